@@ -5,9 +5,16 @@ This module provides workflow nodes and utilities for monitoring
 federated learning workloads across multiple clusters.
 """
 
-from .workflow import federated_monitoring_graph
 from .state import State, Node
 
+
+def __getattr__(name):
+    # Compiling the graph pulls in the LLM and MCP clients, only do it when asked for
+    if name == "federated_monitoring_graph":
+        from .workflow import federated_monitoring_graph
+        return federated_monitoring_graph
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
 __all__ = [
     "federated_monitoring_graph",
     "State", 
@@ -3,23 +3,30 @@ Analyzer Node - Analyzes metrics data and provides insights with Recharts visual
 """
 
 import os
+import json
 from datetime import datetime, timezone
 
-from langchain_openai import ChatOpenAI
 from langchain_core.messages import SystemMessage, HumanMessage, ToolMessage
 from langchain_core.runnables import RunnableConfig
 
 from .state import State
 from agent.utils.logging_config import get_logger
 from agent.utils.model_factory import create_llm
-from agent.tools.render_recharts import render_recharts
 from agent.utils.print_messages import print_messages
+from agent.utils.prom_result import get_prom_result
+from agent.utils.fl_rounds import aggregate_rounds, has_rounds
+from agent.utils.anomaly import ANOMALY_DETECTION, rank_findings
+from agent.utils.quantile_sketch import DISTRIBUTION_SERIES_THRESHOLD, DISTRIBUTION_TOP_K, summarize_distribution
 from agent.utils.copilotkit_state import emit_state
 from .state import update_node, complete_node
 from agent.utils.session_config import log_session_activity
 
 logger = get_logger("analyzer")
 
+# Results with more points (or any result, with anomaly detection on) are sent to the LLM as a digest,
+# charts then reference them by 'source'
+ANALYZER_RAW_POINT_LIMIT = int(os.getenv("ANALYZER_RAW_POINT_LIMIT", "500"))
+
 
 async def analyzer_node(state: State, config: RunnableConfig = None):
     logger.info(f"Starting analyzer with #message {len(state['messages'])}")
@@ -59,15 +66,55 @@ async def analyzer_node(state: State, config: RunnableConfig = None):
         input_messages = [
             HumanMessage(content=f"User Query: {user_query}{tool_data_summary}")
         ]
+        analyzed_results = []
         for tool_msg in prometheus_tool_messages:
-            content = getattr(tool_msg, 'content', None)
+            # Re-use the result decoded by the tool node, re-serialized compactly
+            prom_result = get_prom_result(tool_msg)
             name = getattr(tool_msg, 'name', 'unknown')
+            if prom_result and has_rounds(prom_result):
+                # FL training metrics: the per-round table replaces the raw samples, whatever their count
+                table = json.dumps(aggregate_rounds(prom_result).to_records(), separators=(",", ":"))
+                logger.info(f"Tool {name} result holds FL round metrics, sending per-round table")
+                content = f"[source: {tool_msg.tool_call_id}] federated learning metrics per (cluster, round): {table}"
+            elif prom_result and prom_result.series_count > DISTRIBUTION_SERIES_THRESHOLD:
+                # Too many series even for a digest, send per-cluster and fleet percentiles
+                summary = json.dumps(summarize_distribution(prom_result).to_records(), separators=(",", ":"))
+                logger.info(f"Tool {name} result has {prom_result.series_count} series, sending distribution summary")
+                content = (f"[source: {tool_msg.tool_call_id}] {prom_result.result_type} with {prom_result.series_count} series, "
+                           f"distribution per cluster and fleet (top {DISTRIBUTION_TOP_K} series by mean): {summary}")
+            elif prom_result and (ANOMALY_DETECTION or prom_result.point_count > ANALYZER_RAW_POINT_LIMIT):
+                # Too many points to re-type into a chart (or the findings below already cover them):
+                # send a digest and let the chart reference the result
+                digest = json.dumps(prom_result.digest(), separators=(",", ":"))
+                logger.info(f"Tool {name} result has {prom_result.point_count} points, sending digest of {prom_result.series_count} series")
+                content = (f"[source: {tool_msg.tool_call_id}] {prom_result.result_type} with {prom_result.point_count} points, "
+                           f"per-series digest: {digest}")
+            else:
+                content = prom_result.to_prompt_json() if prom_result else getattr(tool_msg, 'content', None)
+            if prom_result and not has_rounds(prom_result):
+                analyzed_results.append((tool_msg.tool_call_id, prom_result))
+            adjustments = tool_msg.additional_kwargs.get("query_adjustments")
+            if content and adjustments:
+                # Tell the model the data is coarser (or cut) compared to what it asked for
+                content = f"[query adjusted to fit the budget: {'; '.join(adjustments)}] {content}"
+            if content and prom_result and prom_result.warnings:
+                content = f"[warnings: {'; '.join(prom_result.warnings)}] {content}"
+            missing_clusters = tool_msg.additional_kwargs.get("missing_clusters")
+            if content and missing_clusters:
+                content = f"[partial result, these clusters failed or timed out: {', '.join(missing_clusters)}] {content}"
             input_messages.append(HumanMessage(content=f"Tool {name} output: {content}" if content else f"Tool {name} was called"))
 
+        if ANOMALY_DETECTION and analyzed_results:
+            # Detectors already scanned every point, the model narrates their ranked findings
+            findings = rank_findings(analyzed_results)
+            records = json.dumps([finding.to_record() for finding in findings], separators=(",", ":"))
+            input_messages.append(HumanMessage(content=f"Pre-analysis findings (strongest first): {records}"))
+
     
     logger.info(f"Analyzer input: {len(input_messages)} total messages")
     
     # Use render_recharts tool for visualization
+    from agent.tools.render_recharts import render_recharts
     model_name = os.getenv("OPENAI_MODEL", "gpt-4o")
     llm = create_llm(model_name=model_name, temperature=0.1, streaming=True)
     ai_message = await llm.bind_tools([render_recharts]).ainvoke([
@@ -136,6 +183,19 @@ ANALYZER_PROMPT = """You are a multi-cluster metrics analyzer. Create visualizat
 • scaler: number (conversion factor)
 • chart_title: string
 
+**LARGE RESULTS (source)**:
+- Tool outputs starting with `[source: <id>]` only contain a per-series digest, not the raw points
+- Chart them by setting `source: '<id>'` with rechart_type, unit, scaler and chart_title, and leave rechart_data empty
+- The server fills rechart_data, x_axis_key and y_axis_keys ('timestamp' + series for LineChart, 'pod'/'value' for BarChart)
+- Example: {{'charts': [{{'source': 'call_abc123', 'rechart_type': 'LineChart', 'unit': 'MiB', 'scaler': 0.00000095367431640625, 'chart_title': 'Memory Usage Over Time'}}]}}
+- Outputs with a 'distribution per cluster and fleet' have too many series for per-pod charts: chart them as a BarChart with `source` and `summary: 'distribution'` (one group of p25..p99 bars per cluster and the fleet), and name the top series as outliers in the insights
+
+**PRE-ANALYSIS FINDINGS**:
+- The last input lists anomalies detected over ALL points of every series, strongest first (an empty list means nothing stood out)
+- Kinds: 'spike' (point far from the series median), 'level_shift' (mean changed 'before' -> 'after' at 'at'), 'flatline' (stopped changing 'since'), 'outlier' (level far from the peer median)
+- Base your insights on these findings (series, time, values) instead of scanning the raw numbers, and don't report anomalies that are not listed
+- Prefer charting the series named in the strongest findings
+
 **CRITICAL TOOL CALL RULE**: 
 - When calling render_recharts, do NOT generate any message content
 - Leave the message content completely empty ("")
@@ -201,8 +261,9 @@ For LineChart:
 Using x_axis_key: timestamp, y_axis_keys: [local-cluster:foo-server-vkkdf, cluster1:foo-client-q5pls, cluster2:foo-client-hkc9j]'
 
 **For the Customized Federated Learning Metrics, like training 'loss', 'accuracy', etc.** 
-  - The x_axis_key is the **round**! the y_axis_keys is the value the metrics, if x_axis_key is not round, you should use the round as the x_axis_key
-  - For there are multiple value in a round, you should use the first one as the y value
+  - Their tool output is already aggregated per (cluster, round) with first/last/mean values, chart it with `source` and leave rechart_data empty
+  - The LineChart x_axis_key is the **round** with one line per cluster; a BarChart shows one bar per cluster for the latest round
+  - The first value of a round is plotted by default, set `round_value` to 'last' or 'mean' only if the user asks for it
   - If these values are too similar across clusters, you should use the bar chart to visualize the metrics, Each cluster should have a bar, You should try to put all the bar into one chart for comparison
   - If the values are too different across cluster, you should use the line chart to visualize the metrics, Each cluster should have a line, You should try to put all the line into one chart for comparison
 
@@ -5,8 +5,9 @@ Chart Node - Handles render_recharts tool calls for visualization
 from langchain_core.messages import ToolMessage
 from langchain_core.runnables import RunnableConfig
 from agent.federated_learning.monitoring.state import State
-from agent.tools.render_recharts import render_recharts
 from agent.utils.logging_config import get_logger
+from agent.utils.prom_result import get_prom_result
+from agent.utils.chart_data import build_rechart_data
 from .state import update_node, complete_node
 logger = get_logger("chart")
 
@@ -16,6 +17,42 @@ CHART_TYPE_MAPPING = {
     "LineChart": "line chart"
 }
 
+def _find_prom_result(messages, tool_call_id: str):
+    """Columnar result of the prometheus ToolMessage with the given tool_call_id"""
+    for msg in reversed(messages):
+        if isinstance(msg, ToolMessage) and msg.tool_call_id == tool_call_id:
+            return get_prom_result(msg)
+    return None
+
+
+def resolve_chart_sources(tool_call: dict, messages) -> dict:
+    """Fill charts that reference a Prometheus result ('source') with server-built data"""
+    args = tool_call.get("args", {})
+    collection = args.get("data", args)
+    charts = collection.get("charts", [])
+    if not any(chart.get("source") for chart in charts):
+        return tool_call
+
+    resolved_charts = []
+    for chart in charts:
+        source = chart.get("source")
+        result = _find_prom_result(messages, source) if source else None
+        if result is None:
+            if source:
+                logger.warning(f"Chart source '{source}' not found, keeping chart as provided")
+            resolved_charts.append(chart)
+            continue
+
+        rows, x_axis_key, y_axis_keys = build_rechart_data(result, chart.get("rechart_type", "LineChart"), chart.get("round_value", "first"),
+                                                       chart.get("summary", "series"))
+        logger.info(f"Built {len(rows)} rows x {len(y_axis_keys)} keys from source '{source}'")
+        resolved_charts.append({**chart, "rechart_data": rows, "x_axis_key": x_axis_key, "y_axis_keys": y_axis_keys})
+
+    resolved_collection = {**collection, "charts": resolved_charts}
+    resolved_args = {**args, "data": resolved_collection} if "data" in args else resolved_collection
+    return {**tool_call, "args": resolved_args}
+
+
 async def chart_node(state: State, config: RunnableConfig):
     """Handle render_recharts tool calls separately"""
     logger.info(f"Starting chart node with #message {len(state['messages'])}")
@@ -33,6 +70,15 @@ async def chart_node(state: State, config: RunnableConfig):
     if not hasattr(last_message, 'tool_calls') or not last_message.tool_calls:
         return state
     
+    from agent.tools.render_recharts import render_recharts
+    
+    # Charts referencing a tool result get their data here; the AI message is replaced
+    # (same id) so the frontend renders the filled-in tool call
+    tool_calls = [resolve_chart_sources(tool_call, messages) for tool_call in last_message.tool_calls]
+    if tool_calls != last_message.tool_calls:
+        last_message = last_message.model_copy(update={"tool_calls": tool_calls})
+        messages = list(messages[:-1]) + [last_message]
+    
     tool_messages = []
     
     for tool_call in last_message.tool_calls:
@@ -100,7 +146,8 @@ async def chart_node(state: State, config: RunnableConfig):
             
             if not is_error:
                 # Extract chart type from tool call arguments
-                charts = tool_call.get("args", {}).get("charts", [])
+                args = tool_call.get("args", {})
+                charts = args.get("data", args).get("charts", [])
                 logger.debug(f"Found {len(charts)} charts in args")
                 
                 for chart in charts:
@@ -2,23 +2,23 @@
 Inspector Node - Generates PromQL queries based on user queries
 """
 
-from langchain_openai import ChatOpenAI
-from langchain_core.messages import HumanMessage, SystemMessage
+from langchain_core.messages import AIMessage, HumanMessage, SystemMessage
 from langchain_core.messages.utils import trim_messages, count_tokens_approximately
 from langchain_core.runnables import RunnableConfig        
 import os
+import time
 from datetime import datetime, timezone
 
-from dotenv import load_dotenv
-
-load_dotenv()
-
 from .state import State
-from agent.tools.mcp_tool import get_mcp_tools
+from agent.tools.mcp_tool import get_mcp_tools_with_persistent_sessions
 from agent.utils.logging_config import get_logger
 from agent.utils.model_factory import create_llm
+from agent.utils.metric_catalog import relevant_metrics_prompt
+from agent.utils.fl_topology import topology_prompt
 from .state import update_node, complete_node, reset_progress, clear_all_state
 from agent.utils.session_config import log_session_activity, get_session_info
+from agent.utils.subscriptions import PIN_COMMAND, UNPIN_COMMAND, SUBSCRIPTION_MIN_INTERVAL, pin_charts, unpin
+from agent.utils.answer_cache import lookup_answer, parse_refresh, replay_messages
 
 logger = get_logger("inspector")
 
@@ -53,15 +53,64 @@ async def inspector_node(state: State, config: RunnableConfig = None) -> State:
               **state,
             }
         
+        # Handle /pin and /unpin: live chart subscriptions, updated without the LLM
+        if user_query.strip() in (PIN_COMMAND, UNPIN_COMMAND):
+            await reset_progress(state, config)
+            thread_id = get_session_info(config)["thread_id"]
+            if user_query.strip() == PIN_COMMAND:
+                pinned = pin_charts(messages, thread_id)
+                if pinned:
+                    lines = "\n".join(
+                        f"- {s.title or s.id}: /subscriptions/{s.id}/updates (every {max(s.step, SUBSCRIPTION_MIN_INTERVAL):.0f}s)"
+                        for s in pinned
+                    )
+                    content = f"Pinned {len(pinned)} chart(s), new samples are streamed without re-running the analysis:\n{lines}"
+                else:
+                    content = "No pinnable chart found. Only line charts built from a range query can be pinned."
+            else:
+                content = f"Stopped {unpin(thread_id=thread_id)} chart subscription(s)."
+            return {
+              **state,
+              "messages": list(messages) + [AIMessage(content=content)],
+              "query": user_query
+            }
+        
+        # Handle /refresh: answer the question again, bypassing the answer cache
+        refreshed = parse_refresh(user_query, state.get("query", ""))
+        if refreshed is not None:
+            user_query = refreshed
+            # Same id, so the question replaces the command in the thread
+            last_message = last_message.model_copy(update={"content": refreshed})
+            messages = list(messages[:-1]) + [last_message]
+        
         # Reset progress for new user query
         await reset_progress(state, config)
+        
+        # Same question in the same time bucket: replay the answer, skipping every node
+        answer = lookup_answer(user_query, messages) if refreshed is None else None
+        if answer is not None:
+            age = time.time() - answer.stored_at
+            for name, message in answer.progress:
+                await update_node(state, name, "active", message, config)
+                await complete_node(state, name, f"{message} (cached {age:.0f}s ago)", config)
+            return {
+              **state,
+              "messages": list(messages) + replay_messages(answer),
+              "query": user_query
+            }
     
     # Update progress
     await update_node(state, "inspector", "active", "Understanding user query...", config)
     
     try:
-        tools = await get_mcp_tools()
+        tools = await get_mcp_tools_with_persistent_sessions()
         include_tools = ["prom_query", "prom_range", "prom_discover", "prom_metadata", "prom_targets", "kubectl"]
+        
+        # With the metric catalog ready, relevant metrics go into the prompt instead of discovery calls;
+        # the discovery tools stay bound for when the catalog's matches are the wrong metrics
+        metric_catalog = relevant_metrics_prompt(user_query or state.get("query", ""))
+        # Known pods of the FL instances the query names, instead of a kubectl discovery call
+        fl_topology = topology_prompt(user_query or state.get("query", ""))
         tools = [tool for tool in tools if tool.name in include_tools]
         logger.debug(f"Retrieved {len(tools)} MCP tools")
 
@@ -76,6 +125,8 @@ async def inspector_node(state: State, config: RunnableConfig = None) -> State:
         system_prompt = INSPECTOR_PROMPT.format(
           current_time=utc_time, 
           federated_learning_prompt=FEDERATED_LEARNING_PROMPT,
+          metric_catalog=metric_catalog,
+          fl_topology=fl_topology,
         )
         
         # Trim messages to stay within token limit (10000 tokens max)
@@ -231,8 +282,9 @@ Example 2. prom_range - Query the CPU usage of the pod "federated-learning-sampl
    - Examples of correct UTC time calculations:
      * Past 1 hour: start='{current_time}' minus 1 hour, end='{current_time}'
      * Last 30 minutes: start='{current_time}' minus 30 minutes, end='{current_time}'
-   
+   {metric_catalog}
 {federated_learning_prompt}
+{fl_topology}
    
 [Current Time: {current_time}]
 """
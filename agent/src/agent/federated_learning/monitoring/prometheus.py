@@ -1,13 +1,23 @@
 
+from typing import Any, Dict
 import time
 from langchain_core.messages import ToolMessage
 from langchain_core.runnables import RunnableConfig
 from agent.federated_learning.monitoring.state import State
-from agent.tools.mcp_tool import get_mcp_tools, get_mcp_tools_with_persistent_sessions
-from agent.tools.render_recharts import render_recharts
+from agent.tools.mcp_tool import get_mcp_tools_with_persistent_sessions, get_tool_server
 from agent.utils.logging_config import get_logger
 from .state import update_node, complete_node
-from agent.utils.tool_executor import execute_tool_calls, count_successful_tools
+from agent.utils.tool_executor import count_successful_tools
+from agent.utils.prom_result import get_prom_result
+from agent.utils.query_planner import guard_raw_fetches, plan_tool_calls, resolve_plan
+from agent.utils.query_budget import apply_query_budget
+from agent.utils.series_store import plan_store_reads, record_results
+from agent.utils.fan_out import execute_with_fan_out
+from agent.utils.prom_federation import federate_tools
+from agent.utils.kube_cache import cache_kubectl
+from agent.utils.prefetch import observe_calls, schedule_prefetch
+from agent.utils.recording_rules import log_queries
+from agent.utils.session_config import get_session_info
 
 logger = get_logger("prometheus")
 
@@ -40,19 +50,61 @@ async def prometheus_node(state: State, config: RunnableConfig):
     tools_start = time.time()
     logger.debug(f"[PERF] Starting MCP tools retrieval")
     
+    # Only wait for the servers this node's tool calls need (lazy startup may still be in flight)
+    needed_servers = {get_tool_server(name) for name in tool_names if name != "render_recharts"}
+    servers = sorted(needed_servers) if needed_servers and None not in needed_servers else None
+    
     # Use persistent sessions to avoid server restarts
-    tools = await get_mcp_tools_with_persistent_sessions()
+    tools = await get_mcp_tools_with_persistent_sessions(servers=servers)
+    from agent.tools.render_recharts import render_recharts
     tool_map = {tool.name: tool for tool in tools}
     tool_map["render_recharts"] = render_recharts
+    # With several Prometheus backends, queries go to the backends holding their clusters
+    tool_map = federate_tools(tool_map)
+    # Repeated kubectl reads are served from the cache until a write touches the resource
+    tool_map = cache_kubectl(tool_map)
     
     tools_end = time.time()
     logger.debug(f"[PERF] MCP tools retrieval completed in {tools_end - tools_start:.3f}s ({len(tools)} tools)")
     
+    # Calls reading what an earlier prefetch stored count as prefetch hits
+    observe_calls(last_message.tool_calls)
+    
+    # Drop duplicate and subset queries, every tool call still gets its own message afterwards
+    plan = plan_tool_calls(last_message.tool_calls)
+    plan = await guard_raw_fetches(plan, tool_map, config)
+    
     # Execute all tool calls
     exec_start = time.time()
-    logger.info(f"[PERF] 🚀 Starting {len(last_message.tool_calls)} tool execution(s) in parallel")
+    logger.info(f"[PERF] 🚀 Starting {len(plan.calls)} tool execution(s) in parallel")
+    
+    # Serve range queries from recently fetched series, or fetch only the missing tail
+    calls, local_messages, deltas = plan_store_reads(plan.calls)
+    
+    # Keep the range queries still to run within the points budget (larger step or topk);
+    # delta fetches stay on the grid of the history they complete
+    fetches = [call for call in calls if call["id"] not in deltas]
+    fetches, adjustments = await apply_query_budget(fetches, tool_map, config)
+    calls = fetches + [call for call in calls if call["id"] in deltas]
+
+    async def report_slice(message: str, partial: Dict[str, Any]):
+        # Each cluster slice shows up in state as it arrives: the call's series so far and its missing clusters
+        state.setdefault("partial_results", {})[partial["tool_call_id"]] = partial
+        await update_node(state, "tool", "active", message, config)
+
+    # Calls spanning many clusters run as parallel per-cluster shards, merged back per call
+    executed = await execute_with_fan_out(calls, tool_map, config, on_progress=report_slice) if calls else []
+    executed = record_results(calls, executed, deltas) + local_messages
+    for msg in executed:
+        if msg.tool_call_id in adjustments:
+            msg.additional_kwargs["query_adjustments"] = adjustments[msg.tool_call_id]
+    tool_messages = resolve_plan(plan, executed)
+    
+    # Workload log for the recording rule advisor: the model's calls only, not the internal ones
+    log_queries(last_message.tool_calls, tool_messages)
     
-    tool_messages = await execute_tool_calls(last_message.tool_calls, tool_map, config)
+    # Warm the series store with the likely follow-up queries, off this node's path (opt-in)
+    schedule_prefetch(last_message.tool_calls, tool_messages, tool_map, get_session_info(config)["thread_id"])
     
     exec_end = time.time()
     logger.info(f"[PERF] ✅ Tool execution completed in {exec_end - exec_start:.3f}s")
@@ -66,28 +118,12 @@ async def prometheus_node(state: State, config: RunnableConfig):
     data_points = 0
     total_series = 0
     
-    # Calculate actual metrics from Prometheus responses
+    # Calculate actual metrics from Prometheus responses (decoded once, shared with downstream nodes)
     for msg in tool_messages:
-        if msg.name in ["prom_query", "prom_range"] and not msg.content.startswith("Error"):
-            import json
-            try:
-                # Parse JSON response to count series and data points
-                response_data = json.loads(msg.content)
-                if response_data.get("status") == "success":
-                    result = response_data.get("data", {}).get("result", [])
-                    series_count = len(result)
-                    total_series += series_count
-                    
-                    for series in result:
-                        if "values" in series:
-                            # Range query: count all time series values
-                            data_points += len(series["values"])
-                        elif "value" in series:
-                            # Instant query: count single value
-                            data_points += 1
-            except (json.JSONDecodeError, KeyError):
-                # If parsing fails, fallback to simple counting
-                data_points += msg.content.count('"values":') + msg.content.count('"value":')
+        result = get_prom_result(msg)
+        if result and result.status == "success":
+            total_series += result.series_count
+            data_points += result.point_count
     
     # Generate completion message based on tool types
     kubectl_tools = [msg for msg in tool_messages if msg.name == "kubectl"]
@@ -114,4 +150,6 @@ async def prometheus_node(state: State, config: RunnableConfig):
     return {
         **state,
         "messages": updated_messages,
+        # The merged results are in the messages now
+        "partial_results": {},
     }
\ No newline at end of file
@@ -2,7 +2,7 @@
 State management and progress tracking for workflow execution
 """
 
-from typing import Annotated, Sequence, TypedDict, List, Literal
+from typing import Annotated, Dict, Sequence, TypedDict, List, Literal
 from langchain_core.messages import BaseMessage, RemoveMessage
 from langchain_core.runnables import RunnableConfig
 from langgraph.graph.message import add_messages
@@ -30,6 +30,7 @@ class State(TypedDict):
     messages: Annotated[Sequence[BaseMessage], add_messages]
     query: str
     progress: List[Node]
+    partial_results: Dict[str, dict]   # Fan-out slices merged so far per tool_call_id, while the tool node runs
 
 # Progress tracking functions
 
@@ -9,10 +9,9 @@ from langgraph.graph import StateGraph
 # from langgraph.prebuilt import ToolNode
 from langchain_core.messages import ToolMessage
 
-from agent.tools.mcp_tool import sync_get_mcp_tools
-from agent.tools.render_recharts import render_recharts
 from agent.utils.logging_config import get_logger
 from agent.utils.print_messages import print_messages
+from agent.utils.answer_cache import store_answer
 from .inspector import inspector_node
 from .analyzer import analyzer_node
 from .chart import chart_node
@@ -31,6 +30,8 @@ def finish_node(state: State) -> State:
     logger.debug("=== Finish Node ===")
     messages = state.get("messages", [])
     print_messages(messages)
+    # Memoize the answer for the same question in the same time bucket
+    store_answer(state.get("query", ""), messages, state.get("progress"))
     return state
 
 # ========== NODE DEFINITIONS ==========
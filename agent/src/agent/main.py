@@ -1,9 +1,12 @@
 from fastapi import FastAPI
+from fastapi.responses import JSONResponse, PlainTextResponse, StreamingResponse
 import os
+import json
 import time
 import uvicorn
 import signal
 import asyncio
+import importlib
 from contextlib import asynccontextmanager
 
 # CopilotKit imports
@@ -11,13 +14,69 @@ from copilotkit import  CopilotKitSDK, LangGraphAgent
 from copilotkit.integrations.fastapi import add_fastapi_endpoint
 
 # from agent.graphs.router_graph import router_graph
-from agent.federated_learning.monitoring.workflow import federated_monitoring_graph
 from agent.utils.session_config import create_session_config
 from agent.utils.logging_config import get_logger
-from agent.tools.mcp_tool import close_persistent_sessions, preload_mcp_client_and_sessions, get_session_stats
+from agent.tools.mcp_tool import (
+    MCP_LAZY_STARTUP,
+    close_persistent_sessions,
+    preload_mcp_client_and_sessions,
+    start_mcp_preload_in_background,
+    get_session_stats,
+    get_server_readiness,
+)
 
 logger = get_logger("main")
 
+# Modules of the background refresh loops, they pull in numpy
+BACKGROUND_MODULES = ("agent.utils.metric_catalog", "agent.utils.fl_topology", "agent.utils.recording_rules")
+
+_startup_tasks: set = set()  # Keep references to the fire-and-forget startup tasks
+
+def _start_task(coro) -> asyncio.Task:
+    task = asyncio.create_task(coro)
+    _startup_tasks.add(task)
+    task.add_done_callback(_startup_tasks.discard)
+    return task
+
+async def warmup_agents():
+    """Compile the workflow graph in the background so the first request doesn't pay for it"""
+    warmup_start = time.time()
+    try:
+        await asyncio.to_thread(get_agents)
+        # Modules the nodes import on first use
+        for module in ("langchain_openai", "agent.tools.render_recharts"):
+            await asyncio.to_thread(importlib.import_module, module)
+        logger.info(f"🔥 Workflow graph ready in {time.time() - warmup_start:.1f}s")
+    except Exception as e:
+        logger.error(f"❌ Workflow graph warmup failed: {e}", exc_info=True)
+
+async def start_background_refresh():
+    """Import the refresh loops' modules off the event loop, then start the loops"""
+    try:
+        for module in BACKGROUND_MODULES:
+            await asyncio.to_thread(importlib.import_module, module)
+        from agent.utils.metric_catalog import start_catalog_refresh
+        from agent.utils.fl_topology import start_topology_refresh
+        from agent.utils.recording_rules import start_rule_advisor
+
+        start_catalog_refresh()
+        start_topology_refresh()
+        start_rule_advisor()
+    except Exception as e:
+        logger.error(f"❌ Starting background refresh failed: {e}", exc_info=True)
+
+async def stop_background_tasks():
+    """Stop the refresh loops and the chart subscriptions"""
+    from agent.utils.metric_catalog import stop_catalog_refresh
+    from agent.utils.fl_topology import stop_topology_refresh
+    from agent.utils.recording_rules import stop_rule_advisor
+    from agent.utils.subscriptions import stop_subscriptions
+
+    await stop_catalog_refresh()
+    await stop_topology_refresh()
+    await stop_subscriptions()
+    await stop_rule_advisor()
+
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     """Handle application startup and shutdown with MCP preloading"""
@@ -26,6 +85,22 @@ async def lifespan(app: FastAPI):
     
     logger.info("🚀 Starting FastAPI application with MCP preloading...")
     
+    # Build the graph in a worker thread while MCP sessions start, it's off the import path
+    _start_task(warmup_agents())
+    
+    # Metric catalog refreshes in the background, off the inspector's path
+    _start_task(start_background_refresh())
+    
+    # Lazy mode: serve immediately, requests only wait for the servers whose tools they need
+    if MCP_LAZY_STARTUP:
+        start_mcp_preload_in_background()
+        logger.info(f"🎉 FastAPI application ready in {time.time() - app_start:.1f}s (MCP sessions starting in background, see /ready)")
+        yield
+        logger.info("🛑 Shutting down - cleaning up MCP persistent sessions")
+        await stop_background_tasks()
+        await close_persistent_sessions()
+        return
+    
     # Startup: Preload MCP client and sessions
     try:
         preload_result = await preload_mcp_client_and_sessions()
@@ -53,6 +128,7 @@ async def lifespan(app: FastAPI):
         final_stats = get_session_stats()
         logger.info(f"📊 Final session stats: {final_stats}")
         
+        await stop_background_tasks()
         await close_persistent_sessions()
         logger.info("✅ FastAPI application shutdown complete")
         
@@ -61,20 +137,28 @@ async def lifespan(app: FastAPI):
 
 app = FastAPI(lifespan=lifespan)
 
-sdk = CopilotKitSDK(
-    agents=[
-        # LangGraphAgent(
-        #     name="chat_agent",
-        #     description="An example for showcasing the  AG-UI protocol using LangGraph.",
-        #     graph=router_graph
-        # ),
-        LangGraphAgent(
-            name="chat_agent",
-            description="An example for showcasing the  AG-UI protocol using LangGraph.",
-            graph=federated_monitoring_graph
-        )
-    ]
-)
+_agents = None
+
+def get_agents(context=None):
+    """Build the agents on first use, so compiling the graph (and importing the LLM clients) stays off the import path"""
+    global _agents
+    if _agents is None:
+        from agent.federated_learning.monitoring.workflow import federated_monitoring_graph
+        _agents = [
+            # LangGraphAgent(
+            #     name="chat_agent",
+            #     description="An example for showcasing the  AG-UI protocol using LangGraph.",
+            #     graph=router_graph
+            # ),
+            LangGraphAgent(
+                name="chat_agent",
+                description="An example for showcasing the  AG-UI protocol using LangGraph.",
+                graph=federated_monitoring_graph
+            )
+        ]
+    return _agents
+
+sdk = CopilotKitSDK(agents=get_agents)
 
 add_fastapi_endpoint(app, sdk, "/copilotkit")
 
@@ -87,12 +171,42 @@ async def root():
 async def mcp_health():
     """Check MCP client and session health status"""
     try:
+        # Imported here, these modules pull in numpy and yaml, which startup doesn't need
+        from agent.utils.tool_executor import get_executor_stats
+        from agent.utils.query_planner import get_planner_stats
+        from agent.utils.query_budget import get_budget_stats
+        from agent.utils.metric_catalog import get_catalog_stats
+        from agent.utils.fl_topology import get_topology_stats
+        from agent.utils.series_store import get_store_stats
+        from agent.utils.anomaly import get_anomaly_stats
+        from agent.utils.fan_out import get_fanout_stats
+        from agent.utils.prom_federation import get_federation_stats
+        from agent.utils.kube_cache import get_kube_cache_stats
+        from agent.utils.prefetch import get_prefetch_stats
+        from agent.utils.recording_rules import get_rule_stats
+        from agent.utils.answer_cache import get_answer_cache_stats
+        from agent.utils.subscriptions import get_subscription_stats
+
         stats = get_session_stats()
         
         return {
             "status": "healthy" if stats["active_sessions"] > 0 else "no_sessions",
             "mcp_client_loaded": True,
             "session_stats": stats,
+            "executor_stats": get_executor_stats(),
+            "planner_stats": get_planner_stats(),
+            "budget_stats": get_budget_stats(),
+            "catalog_stats": get_catalog_stats(),
+            "store_stats": get_store_stats(),
+            "anomaly_stats": get_anomaly_stats(),
+            "fanout_stats": get_fanout_stats(),
+            "federation_stats": get_federation_stats(),
+            "kube_cache_stats": get_kube_cache_stats(),
+            "topology_stats": get_topology_stats(),
+            "subscription_stats": get_subscription_stats(),
+            "prefetch_stats": get_prefetch_stats(),
+            "rule_stats": get_rule_stats(),
+            "answer_cache_stats": get_answer_cache_stats(),
             "timestamp": time.strftime('%H:%M:%S')
         }
     except Exception as e:
@@ -104,6 +218,61 @@ async def mcp_health():
         }
 
 
+@app.get("/ready")
+async def ready():
+    """Per-server MCP readiness, 503 until every server session is up"""
+    readiness = get_server_readiness()
+    readiness["timestamp"] = time.strftime('%H:%M:%S')
+    return JSONResponse(content=readiness, status_code=200 if readiness["ready"] else 503)
+
+
+@app.get("/subscriptions")
+async def subscriptions(thread_id: str = None):
+    """Pinned charts, optionally of one thread"""
+    from agent.utils.subscriptions import list_subscriptions
+
+    return {"subscriptions": list_subscriptions(thread_id)}
+
+
+@app.get("/subscriptions/{subscription_id}/updates")
+async def subscription_updates(subscription_id: str):
+    """Server-sent events with the rows appended to a pinned chart, starting with the rows kept so far"""
+    from agent.utils.subscriptions import listen, unlisten
+
+    queue = listen(subscription_id)
+    if queue is None:
+        return JSONResponse(content={"error": f"Unknown subscription '{subscription_id}'"}, status_code=404)
+
+    async def stream():
+        try:
+            while True:
+                update = await queue.get()
+                if update is None:
+                    break
+                yield f"data: {json.dumps(update)}\n\n"
+        finally:
+            unlisten(subscription_id, queue)
+
+    return StreamingResponse(stream(), media_type="text/event-stream")
+
+
+@app.delete("/subscriptions/{subscription_id}")
+async def delete_subscription(subscription_id: str):
+    """Unpin a chart"""
+    from agent.utils.subscriptions import unpin
+
+    stopped = unpin(subscription_id)
+    return JSONResponse(content={"stopped": stopped}, status_code=200 if stopped else 404)
+
+
+@app.get("/recording-rules")
+async def recording_rules():
+    """Recording rules recommended from the observed query workload, as a Prometheus rule file"""
+    from agent.utils.recording_rules import rules_yaml
+
+    return PlainTextResponse(rules_yaml(), media_type="application/yaml")
+
+
 @app.get("/health")
 async def health():
     """General application health check"""
@@ -1,30 +1,36 @@
+from __future__ import annotations
+
 import os
 import json
+import time
 import asyncio
-from typing import List, Dict, Any, Optional
-from langchain_mcp_adapters.client import MultiServerMCPClient
+from typing import TYPE_CHECKING, List, Dict, Any, Optional
 from langchain_core.tools import Tool
-from langchain_mcp_adapters.sessions import Connection
-from dotenv import load_dotenv
-import nest_asyncio
-from mcp import ClientSession
 
+from agent.tools import tool_schema_cache
 from agent.utils.logging_config import get_logger
 
-load_dotenv()
+# The MCP client stack is imported on first use to keep it off the startup path
+if TYPE_CHECKING:
+    from langchain_mcp_adapters.client import MultiServerMCPClient
+    from langchain_mcp_adapters.sessions import Connection
+    from mcp import ClientSession
 
 logger = get_logger("mcp_tools")
 
 
 def get_default_server_configs() -> Dict[str, Dict[str, Any]]:
     """Get default server configurations"""
+    # Imported here, the federation merge code pulls in numpy
+    from agent.utils.prom_federation import backend_server_configs, primary_url
+
     config = {
         "prometheus": {
             "command": "npx",
             "args": ["prometheus-mcp-server@1.0.1"],
             "transport": "stdio",
             "env": {
-                "PROMETHEUS_URL": os.getenv(
+                "PROMETHEUS_URL": primary_url() or os.getenv(
                     "PROMETHEUS_URL", "https://localhost:30090"
                 ),
                 "PROMETHEUS_INSECURE": os.getenv("PROMETHEUS_INSECURE", "true"),
@@ -42,6 +48,8 @@ def get_default_server_configs() -> Dict[str, Dict[str, Any]]:
             },
         }
     }
+    # Secondary Prometheus backends (PROMETHEUS_BACKENDS) each get their own server
+    config.update(backend_server_configs(config["prometheus"]))
     return config
 
 
@@ -56,14 +64,40 @@ _session_stats = {
     "created": 0,
     "reused": 0,
     "failures": 0,
-    "active_count": 0
+    "active_count": 0,
+    "tool_calls": 0,
+    "coalesced": 0,
+    "cancelled": 0
 }
 
+# Singleflight: concurrent identical calls of read-only tools share one MCP request
+MCP_COALESCE_CALLS = os.getenv("MCP_COALESCE_CALLS", "true").lower() == "true"
+MCP_COALESCE_TOOLS = set(
+    os.getenv("MCP_COALESCE_TOOLS", "prom_query,prom_range,prom_discover,prom_metadata,prom_targets").split(",")
+)
+_inflight_calls: Dict[str, Dict[str, Any]] = {}  # call key -> {"task": Task, "waiters": int}
+
+# Startup tuning: sessions start in parallel, each offset by a small stagger so
+# concurrent npx boots don't trample each other's stdio pipes
+MCP_STARTUP_STAGGER = float(os.getenv("MCP_STARTUP_STAGGER", "0.5"))
+MCP_SESSION_TIMEOUT = float(os.getenv("MCP_SESSION_TIMEOUT", "90"))
+MCP_LAZY_STARTUP = os.getenv("MCP_LAZY_STARTUP", "false").lower() == "true"
+
+# Per-server readiness tracking
+_server_readiness: Dict[str, Dict[str, Any]] = {}
+_server_ready_events: Dict[str, asyncio.Event] = {}
+_server_start_tasks: Dict[str, asyncio.Task] = {}
+_server_tools: Dict[str, List[Tool]] = {}
+_tool_servers: Dict[str, str] = {}  # tool name -> server name
+_preload_task: Optional[asyncio.Task] = None
+
 
 def get_mcp_client(
     server_configs: dict[str, Connection] | None = None
 ) -> MultiServerMCPClient:
     """Get or create MCP client"""
+    from langchain_mcp_adapters.client import MultiServerMCPClient
+    
     global _mcp_client
     if _mcp_client is None or server_configs is not None:
         configs = server_configs or get_default_server_configs()
@@ -74,6 +108,33 @@ def get_mcp_client(
     return _mcp_client
 
 
+async def _run_session_owner(server_name: str, client: MultiServerMCPClient, opened: asyncio.Future, close_event: asyncio.Event):
+    """
+    Own a session context for its whole lifetime.
+
+    The stdio transport uses anyio cancel scopes, which must be exited by the task that
+    entered them. Sessions are opened from startup tasks and tool calls but closed at
+    shutdown, so a dedicated task enters and exits the context.
+    """
+    try:
+        # Initialize ourselves to keep the server info (used to fingerprint the tool schema cache)
+        async with client.session(server_name, auto_initialize=False) as session:
+            init_result = await session.initialize()
+            opened.set_result((session, init_result))
+            await close_event.wait()
+    except BaseException as e:
+        if not opened.done():
+            opened.set_exception(e)
+        if not isinstance(e, Exception):
+            raise
+
+
+async def _close_session_data(session_data: Dict[str, Any]) -> None:
+    """Signal a session owner task to exit its context and wait for it"""
+    session_data['close_event'].set()
+    await session_data['owner_task']
+
+
 async def get_persistent_session(server_name: str, client: MultiServerMCPClient) -> ClientSession:
     """Get or create a persistent MCP session for a server with health checking"""
     import time
@@ -108,7 +169,7 @@ async def get_persistent_session(server_name: str, client: MultiServerMCPClient)
                 logger.warning(f"[PERF] Session health check failed for '{server_name}': {e}")
                 # Remove unhealthy session
                 try:
-                    await session_data['context'].__aexit__(None, None, None)
+                    await _close_session_data(session_data)
                 except:
                     pass
                 del _active_sessions[server_name]
@@ -128,16 +189,25 @@ async def get_persistent_session(server_name: str, client: MultiServerMCPClient)
                     await asyncio.sleep(retry_delay)
                     retry_delay *= 1.5  # Exponential backoff
                 
-                session_context = client.session(server_name)
-                session = await session_context.__aenter__()
+                opened = asyncio.get_running_loop().create_future()
+                close_event = asyncio.Event()
+                owner_task = asyncio.create_task(_run_session_owner(server_name, client, opened, close_event))
+                try:
+                    session, init_result = await opened
+                except asyncio.CancelledError:
+                    # e.g. startup timeout - don't leave a half-open session behind
+                    owner_task.cancel()
+                    raise
                 
                 _active_sessions[server_name] = {
                     'session': session,
-                    'context': session_context,
+                    'owner_task': owner_task,
+                    'close_event': close_event,
                     'created_at': current_time,
                     'last_used': current_time,
                     'use_count': 1,
-                    'server_name': server_name
+                    'server_name': server_name,
+                    'server_version': init_result.serverInfo.version if init_result.serverInfo else None
                 }
                 
                 _session_stats["created"] += 1
@@ -161,6 +231,17 @@ async def close_persistent_sessions():
     import asyncio
     global _active_sessions, _session_locks, _session_stats
     
+    # Stop startups that are still in flight (lazy mode) before tearing down sessions
+    pending_starts = [task for task in _server_start_tasks.values() if not task.done()]
+    for task in pending_starts:
+        task.cancel()
+    if pending_starts:
+        await asyncio.gather(*pending_starts, return_exceptions=True)
+        logger.info(f"[PERF] Cancelled {len(pending_starts)} in-flight session startups")
+    _server_start_tasks.clear()
+    _server_ready_events.clear()
+    _server_readiness.clear()
+    
     # We don't need locks during shutdown as it's a single operation
     if not _active_sessions:
         logger.info("[PERF] No persistent sessions to close")
@@ -181,7 +262,7 @@ async def close_persistent_sessions():
             # Try to close gracefully with timeout
             try:
                 await asyncio.wait_for(
-                    session_data['context'].__aexit__(None, None, None), 
+                    _close_session_data(session_data), 
                     timeout=5.0  # 5 second timeout for each session
                 )
             except asyncio.TimeoutError:
@@ -201,8 +282,11 @@ async def close_persistent_sessions():
 
 def get_session_stats() -> dict:
     """Get current session statistics for monitoring"""
+    tool_calls = _session_stats["tool_calls"]
     return {
         **_session_stats,
+        "coalesce_rate": round(_session_stats["coalesced"] / tool_calls, 3) if tool_calls else 0.0,
+        "inflight_calls": len(_inflight_calls),
         "active_sessions": len(_active_sessions),
         "session_details": {
             name: {
@@ -269,6 +353,7 @@ def sync_get_mcp_tools(
     try:
         loop = asyncio.get_running_loop()
         logger.debug("Running in async context, applying nest_asyncio")
+        import nest_asyncio
         nest_asyncio.apply()
         # Create task and run it
         coro = get_mcp_tools(server_configs, use_cache)
@@ -280,54 +365,223 @@ def sync_get_mcp_tools(
         return asyncio.run(get_mcp_tools(server_configs, use_cache))
 
 
+# --- Server readiness tracking ---
+def _get_ready_event(server_name: str) -> asyncio.Event:
+    """Get or create the event that is set once a server finished starting (ready or failed)"""
+    if server_name not in _server_ready_events:
+        _server_ready_events[server_name] = asyncio.Event()
+    return _server_ready_events[server_name]
+
+
+def _set_server_status(server_name: str, status: str, **details) -> None:
+    """Record a readiness transition for a server"""
+    entry = _server_readiness.setdefault(server_name, {})
+    if status in ("pending", "starting"):
+        # Drop details of a previous attempt
+        entry.clear()
+    entry.update(details)
+    entry["status"] = status
+    entry["updated_at"] = time.time()
+
+
+def _register_server_tools(server_name: str, mcp_tools: list) -> List[Tool]:
+    """Wrap a server's MCP tools for persistent sessions and make them available"""
+    global _tools_cache
+    from agent.utils.prom_federation import is_backend_server
+
+    server_tools = [create_persistent_mcp_tool(mcp_tool, server_name) for mcp_tool in mcp_tools]
+
+    _server_tools[server_name] = server_tools
+    if is_backend_server(server_name):
+        # Same tool names as the primary backend, only reachable through the federation
+        return server_tools
+    for tool in server_tools:
+        _tool_servers[tool.name] = server_name
+    _tools_cache = None  # Combined list is rebuilt on next request
+    return server_tools
+
+
+def _load_cached_server_tools(client: MultiServerMCPClient) -> List[str]:
+    """Register tools from the on-disk schema cache for servers that have none yet, returns those servers"""
+    from mcp.types import Tool as MCPTool
+
+    loaded = []
+    for server_name, connection in client.connections.items():
+        if server_name in _server_tools:
+            continue
+
+        entry = tool_schema_cache.load_server_tools(server_name, tool_schema_cache.config_fingerprint(connection))
+        if not entry:
+            continue
+
+        try:
+            mcp_tools = [MCPTool.model_validate(tool) for tool in entry["tools"]]
+        except Exception as e:
+            logger.warning(f"[PERF] Ignoring invalid cached tool schemas for '{server_name}': {e}")
+            continue
+
+        _register_server_tools(server_name, mcp_tools)
+        _server_readiness.setdefault(server_name, {"status": "pending"})["tools_source"] = "cache"
+        loaded.append(server_name)
+        logger.info(f"[PERF] 💾 {server_name}: {len(mcp_tools)} tools loaded from schema cache (server version {entry.get('server_version')})")
+    return loaded
+
+
+async def _load_server_tools(server_name: str, client: MultiServerMCPClient) -> List[Tool]:
+    """Open the persistent session for a server, list its tools and revalidate the schema cache"""
+    from langchain_mcp_adapters.tools import _list_all_tools
+
+    session = await get_persistent_session(server_name, client)
+    mcp_tools = await _list_all_tools(session)
+
+    server_version = get_server_version(server_name)
+    changed = tool_schema_cache.save_server_tools(
+        server_name,
+        tool_schema_cache.config_fingerprint(client.connections[server_name]),
+        server_version,
+        [mcp_tool.model_dump(mode="json", exclude_none=True) for mcp_tool in mcp_tools],
+    )
+    if changed and server_name in _server_tools:
+        logger.info(f"[PERF] ♻️ {server_name}: cached tool schemas invalidated (server version {server_version})")
+
+    return _register_server_tools(server_name, mcp_tools)
+
+
+async def _start_server(server_name: str, client: MultiServerMCPClient, delay: float = 0.0) -> List[Tool]:
+    """Start a single server after an optional stagger delay, bounded by MCP_SESSION_TIMEOUT"""
+    if delay > 0:
+        await asyncio.sleep(delay)
+
+    start_time = time.time()
+    _set_server_status(server_name, "starting")
+    logger.info(f"📡 Starting connection to MCP server: {server_name}")
+
+    try:
+        server_tools = await asyncio.wait_for(
+            _load_server_tools(server_name, client),
+            timeout=MCP_SESSION_TIMEOUT
+        )
+        startup_time = time.time() - start_time
+        _set_server_status(server_name, "ready", tools=len(server_tools), startup_time=round(startup_time, 3))
+        logger.info(f"✅ {server_name}: {len(server_tools)} tools loaded in {startup_time:.1f}s")
+        return server_tools
+
+    except asyncio.TimeoutError:
+        startup_time = time.time() - start_time
+        _set_server_status(server_name, "failed", error=f"timed out after {MCP_SESSION_TIMEOUT:.0f}s", startup_time=round(startup_time, 3))
+        logger.error(f"❌ {server_name}: session startup timed out after {startup_time:.1f}s")
+        return []
+
+    except Exception as e:
+        startup_time = time.time() - start_time
+        _set_server_status(server_name, "failed", error=str(e), startup_time=round(startup_time, 3))
+        logger.error(f"❌ {server_name}: failed to load tools in {startup_time:.1f}s - {e}")
+        return []
+
+    finally:
+        # Wake up waiters whatever the outcome, they check the status themselves
+        _get_ready_event(server_name).set()
+
+
+def _ensure_server_started(server_name: str, client: MultiServerMCPClient, delay: float = 0.0, refresh: bool = False) -> asyncio.Task:
+    """Get the startup task of a server, (re)starting it if it never ran, failed or a refresh is requested"""
+    task = _server_start_tasks.get(server_name)
+    failed = _server_readiness.get(server_name, {}).get("status") == "failed"
+
+    if task is None or (task.done() and (refresh or failed)):
+        _get_ready_event(server_name).clear()
+        _set_server_status(server_name, "pending")
+        task = asyncio.create_task(_start_server(server_name, client, delay))
+        _server_start_tasks[server_name] = task
+    return task
+
+
+async def wait_for_servers(server_names: Optional[List[str]] = None, timeout: Optional[float] = None) -> List[str]:
+    """
+    Wait until the given servers finished starting and return the ones that are ready.
+
+    Servers that were never started are started on demand, so a request only waits
+    for the servers whose tools it actually needs.
+    """
+    client = get_mcp_client()
+    names = server_names or list(client.connections.keys())
+    tasks = [_ensure_server_started(name, client) for name in names]
+
+    try:
+        await asyncio.wait_for(asyncio.gather(*[asyncio.shield(task) for task in tasks]), timeout)
+    except asyncio.TimeoutError:
+        pending = [name for name in names if not _get_ready_event(name).is_set()]
+        logger.warning(f"[PERF] Timed out after {timeout}s waiting for MCP servers: {', '.join(pending)}")
+
+    return [name for name in names if _server_readiness.get(name, {}).get("status") == "ready"]
+
+
+def get_server_version(server_name: str) -> Optional[str]:
+    """Get the version a server reported on initialize, None if it has no session yet"""
+    return _active_sessions.get(server_name, {}).get("server_version")
+
+
+def get_server_tools(server_name: str) -> List[Tool]:
+    """Get the loaded tools of a server, empty if it has none yet"""
+    return _server_tools.get(server_name, [])
+
+
+def _exposed_tools(server_names: List[str]) -> List[Tool]:
+    """Tools of the given servers that are bound to the LLM (secondary Prometheus backends excluded)"""
+    from agent.utils.prom_federation import is_backend_server
+
+    return [tool for name in server_names if not is_backend_server(name) for tool in _server_tools.get(name, [])]
+
+
+def get_tool_server(tool_name: str) -> Optional[str]:
+    """Get the name of the MCP server providing a tool, None if unknown"""
+    return _tool_servers.get(tool_name)
+
+
+def get_server_readiness() -> dict:
+    """Get per-server readiness for the /ready endpoint"""
+    servers = {name: dict(info) for name, info in _server_readiness.items()}
+    return {
+        "ready": bool(servers) and all(info["status"] == "ready" for info in servers.values()),
+        "lazy": MCP_LAZY_STARTUP,
+        "servers": servers,
+    }
+
+
 # --- Startup preloader functions ---
 async def preload_mcp_client_and_sessions():
     """Preload MCP client, sessions, and tools during application startup"""
-    import time
+    global _tools_cache
     startup_start = time.time()
     
     logger.info(f"[STARTUP] 🚀 Preloading MCP client and sessions")
     
     try:
-        # 1. Create MCP client
-        client_start = time.time()
         client = get_mcp_client()
-        client_time = time.time() - client_start
-        
-        # 2. Create sessions SERIALLY to avoid EPIPE conflicts
-        logger.info("[STARTUP] 📡 Creating MCP sessions serially...")
-        sessions_start = time.time()
-        
-        healthy_sessions = 0
         server_names = list(client.connections.keys())
-        logger.info(f"[STARTUP] Creating sessions for servers: {', '.join(server_names)}")
         
-        # Create sessions one by one instead of in parallel
-        for i, server_name in enumerate(server_names, 1):
-            try:
-                logger.info(f"[STARTUP] [{i}/{len(server_names)}] Creating session for '{server_name}'...")
-                session_start = time.time()
-                
-                session = await get_persistent_session(server_name, client)
-                session_time = time.time() - session_start
-                
-                healthy_sessions += 1
-                logger.info(f"[STARTUP] ✅ [{i}/{len(server_names)}] Session '{server_name}' created in {session_time:.1f}s")
-                
-            except Exception as e:
-                logger.error(f"[STARTUP] ❌ [{i}/{len(server_names)}] Session '{server_name}' failed: {e}")
+        # Cached tool schemas make LLM binding available before any session is up
+        cached_servers = _load_cached_server_tools(client)
+        if cached_servers:
+            logger.info(f"[STARTUP] 💾 Tool schemas for {', '.join(cached_servers)} loaded from cache in {time.time() - startup_start:.3f}s")
         
-        # 3. Load tools with existing persistent sessions
-        tools_start = time.time()
-        tools = await get_mcp_tools_with_persistent_sessions(use_cache=False)
-        tools_time = time.time() - tools_start
+        # Start sessions in PARALLEL, each one offset by the stagger delay
+        logger.info(f"[STARTUP] 📡 Creating sessions in parallel for servers: {', '.join(server_names)} "
+                    f"(stagger={MCP_STARTUP_STAGGER}s, timeout={MCP_SESSION_TIMEOUT}s)")
         
-        sessions_time = time.time() - sessions_start
-        logger.info(f"[STARTUP] 📊 Serial session creation completed in {sessions_time:.1f}s ({healthy_sessions}/{len(server_names)} successful)")
+        tasks = [
+            _ensure_server_started(server_name, client, delay=i * MCP_STARTUP_STAGGER)
+            for i, server_name in enumerate(server_names)
+        ]
+        await asyncio.gather(*tasks)
+        
+        ready_servers = [name for name in server_names if _server_readiness[name]["status"] == "ready"]
+        tools = _exposed_tools(server_names)
+        _tools_cache = tools
         
         total_startup_time = time.time() - startup_start
         
-        logger.info(f"[STARTUP] 🎉 MCP startup complete in {total_startup_time:.1f}s - {len(tools)} tools, {healthy_sessions} sessions ready")
+        logger.info(f"[STARTUP] 🎉 MCP startup complete in {total_startup_time:.1f}s - {len(tools)} tools, {len(ready_servers)}/{len(server_names)} sessions ready")
         
         # Get current session stats
         stats = get_session_stats()
@@ -336,7 +590,8 @@ async def preload_mcp_client_and_sessions():
             "success": True,
             "total_time": total_startup_time,
             "tools_loaded": len(tools),
-            "sessions_ready": healthy_sessions,
+            "sessions_ready": len(ready_servers),
+            "readiness": get_server_readiness(),
             "stats": stats
         }
         
@@ -350,6 +605,15 @@ async def preload_mcp_client_and_sessions():
         }
 
 
+def start_mcp_preload_in_background() -> asyncio.Task:
+    """Lazy startup: preload MCP sessions in the background so the app can serve immediately"""
+    global _preload_task
+    if _preload_task is None or _preload_task.done():
+        _preload_task = asyncio.create_task(preload_mcp_client_and_sessions())
+        logger.info("[STARTUP] 💤 Lazy mode - MCP sessions are starting in the background")
+    return _preload_task
+
+
 def preload_mcp_sync():
     """Synchronous wrapper for MCP preloading"""
     import asyncio
@@ -364,6 +628,107 @@ def preload_mcp_sync():
         return asyncio.run(preload_mcp_client_and_sessions())
 
 
+# --- Singleflight coalescing of identical in-flight calls ---
+def _normalize_call_args(value: Any) -> Any:
+    """Normalize tool arguments so equivalent calls map to the same key"""
+    if isinstance(value, dict):
+        return {key: _normalize_call_args(item) for key, item in sorted(value.items()) if item is not None}
+    if isinstance(value, (list, tuple)):
+        return [_normalize_call_args(item) for item in value]
+    if isinstance(value, str):
+        return value.strip()
+    return value
+
+
+def tool_call_key(server_name: str, tool_name: str, arguments: Dict[str, Any]) -> str:
+    """Stable key of a tool call: server, tool and normalized arguments"""
+    normalized = json.dumps(_normalize_call_args(arguments), sort_keys=True, separators=(",", ":"), default=str)
+    return f"{server_name}/{tool_name}:{normalized}"
+
+
+async def _coalesced_call(key: str, call):
+    """
+    Run call() once per key among concurrent callers, every waiter gets the same result.
+
+    The shared call runs in its own task, so one waiter being cancelled doesn't affect
+    the others. It's only cancelled when its last waiter gives up.
+    """
+    entry = _inflight_calls.get(key)
+    if entry is None:
+        entry = {"task": asyncio.create_task(call()), "waiters": 0}
+        _inflight_calls[key] = entry
+
+        def _forget(_task, key=key, entry=entry):
+            if _inflight_calls.get(key) is entry:
+                del _inflight_calls[key]
+        entry["task"].add_done_callback(_forget)
+    else:
+        _session_stats["coalesced"] += 1
+        logger.debug(f"[PERF] Coalescing with in-flight call {key[:120]} ({entry['waiters']} waiting)")
+
+    entry["waiters"] += 1
+    try:
+        return await asyncio.shield(entry["task"])
+    except asyncio.CancelledError:
+        if entry["waiters"] == 1 and not entry["task"].done():
+            entry["task"].cancel()
+        raise
+    finally:
+        entry["waiters"] -= 1
+
+
+_cancel_notifications: set = set()  # Keep references to fire-and-forget notification tasks
+_request_id_supported: Optional[bool] = None
+
+
+def _next_request_id(session: ClientSession) -> Optional[int]:
+    """
+    Id the session's next send_request assigns, None if unknown.
+
+    The mcp client doesn't expose request ids: BaseSession keeps the next one in the private
+    _request_id (mcp 1.x) and send_request takes it before its first await, so reading it
+    right before call_tool, with no await in between, gives that call's id. Other mcp
+    versions aren't trusted, the call then just isn't cancellable on the server.
+    """
+    global _request_id_supported
+    if _request_id_supported is None:
+        from importlib.metadata import PackageNotFoundError, version
+        try:
+            _request_id_supported = version("mcp").split(".")[0] == "1"
+        except PackageNotFoundError:
+            _request_id_supported = False
+        if not _request_id_supported:
+            logger.warning("[PERF] Unknown mcp version, abandoned tool calls won't be cancelled on the server")
+    request_id = getattr(session, "_request_id", None) if _request_id_supported else None
+    return request_id if isinstance(request_id, int) else None
+
+
+def _notify_request_cancelled(session: ClientSession, request_id: Optional[int], reason: str) -> None:
+    """Tell the server to stop working on an abandoned request (best effort, MCP notifications/cancelled)"""
+    from mcp import types
+    
+    if request_id is None:
+        return
+    
+    notification = types.ClientNotification(
+        types.CancelledNotification(
+            method="notifications/cancelled",
+            params=types.CancelledNotificationParams(requestId=request_id, reason=reason),
+        )
+    )
+    
+    async def send():
+        try:
+            await session.send_notification(notification)
+            logger.info(f"[PERF] Sent cancellation for MCP request {request_id}: {reason}")
+        except Exception as e:
+            logger.debug(f"[PERF] Could not send cancellation for MCP request {request_id}: {e}")
+    
+    task = asyncio.create_task(send())
+    _cancel_notifications.add(task)
+    task.add_done_callback(_cancel_notifications.discard)
+
+
 # --- Custom tool wrapper for persistent sessions ---
 def create_persistent_mcp_tool(mcp_tool, server_name: str) -> Tool:
     """Create a LangChain tool that uses persistent MCP sessions"""
@@ -378,8 +743,9 @@ def create_persistent_mcp_tool(mcp_tool, server_name: str) -> Tool:
         # Generate session ID for tracking
         session_id = f"{server_name}-{hash(str(arguments)) % 10000}"
         logger.debug(f"[PERF] Tool '{mcp_tool.name}' starting with persistent session {session_id}")
+        _session_stats["tool_calls"] += 1
         
-        try:
+        async def call():
             # Get persistent session for this server
             client = get_mcp_client()
             session_get_start = time.time()
@@ -390,7 +756,13 @@ def create_persistent_mcp_tool(mcp_tool, server_name: str) -> Tool:
             
             # Execute tool using persistent session
             call_start = time.time()
-            call_tool_result = await session.call_tool(mcp_tool.name, arguments)
+            request_id = _next_request_id(session)
+            try:
+                call_tool_result = await session.call_tool(mcp_tool.name, arguments)
+            except asyncio.CancelledError:
+                _session_stats["cancelled"] += 1
+                _notify_request_cancelled(session, request_id, f"{mcp_tool.name} call cancelled by client")
+                raise
             call_end = time.time()
             
             total_time = call_end - start_time
@@ -399,6 +771,11 @@ def create_persistent_mcp_tool(mcp_tool, server_name: str) -> Tool:
             logger.info(f"[PERF] Tool '{mcp_tool.name}' SUCCESS: total={total_time:.3f}s, actual_call={actual_call_time:.3f}s")
             
             return _convert_call_tool_result(call_tool_result)
+        
+        try:
+            if MCP_COALESCE_CALLS and mcp_tool.name in MCP_COALESCE_TOOLS:
+                return await _coalesced_call(tool_call_key(server_name, mcp_tool.name, arguments), call)
+            return await call()
             
         except Exception as e:
             error_time = time.time() - start_time
@@ -424,18 +801,23 @@ def create_persistent_mcp_tool(mcp_tool, server_name: str) -> Tool:
 
 # --- Enhanced version with persistent sessions ---
 async def get_mcp_tools_with_persistent_sessions(
-    server_configs: dict[str, Connection] | None = None, use_cache: bool = True
+    server_configs: dict[str, Connection] | None = None,
+    use_cache: bool = True,
+    servers: Optional[List[str]] = None,
 ) -> List[Tool]:
-    """Get MCP tools using persistent sessions to avoid server restarts"""
-    import time
-    import asyncio
-    from langchain_mcp_adapters.tools import load_mcp_tools
-    
+    """
+    Get MCP tools using persistent sessions to avoid server restarts.
+
+    Args:
+        server_configs: Optional server configurations, defaults to get_default_server_configs()
+        use_cache: Whether to return already loaded tools
+        servers: Only load (and wait for) these servers, defaults to all of them
+    """
     start_time = time.time()
     global _tools_cache
 
     # Use cache if available and requested
-    if _tools_cache is not None and use_cache:
+    if _tools_cache is not None and use_cache and servers is None:
         logger.info(f"[PERF] Using cached MCP tools ({len(_tools_cache)} tools) - cache hit in {time.time() - start_time:.4f}s")
         return _tools_cache
 
@@ -443,67 +825,32 @@ async def get_mcp_tools_with_persistent_sessions(
     
     try:
         client = get_mcp_client(server_configs)
-        all_tools = []
+        server_names = servers or list(client.connections.keys())
         
-        # Create tasks for parallel loading of all servers
-        async def load_server_tools(server_name: str):
-            """Load tools from a single server"""
-            session_start = time.time()
-            logger.info(f"📡 Starting connection to MCP server: {server_name}")
-            
-            try:
-                # Get persistent session for this server to list tools
-                session_get_start = time.time()
-                logger.debug(f"🔄 {server_name}: Getting persistent session...")
-                session = await get_persistent_session(server_name, client)
-                session_get_time = time.time() - session_get_start
-                logger.info(f"🔗 {server_name}: Session acquired in {session_get_time:.1f}s")
-                
-                # List tools from session
-                from langchain_mcp_adapters.tools import _list_all_tools
-                mcp_tools = await _list_all_tools(session)
-                
-                # Create persistent tools using our custom wrapper
-                server_tools = [create_persistent_mcp_tool(mcp_tool, server_name) for mcp_tool in mcp_tools]
-                
-                session_time = time.time() - session_start
-                logger.info(f"✅ {server_name}: {len(server_tools)} tools loaded in {session_time:.1f}s")
-                
-                return server_tools
-                
-            except Exception as e:
-                session_time = time.time() - session_start
-                logger.error(f"❌ {server_name}: failed to load tools in {session_time:.1f}s - {e}")
-                return []
+        # Schemas from the on-disk cache are enough to bind tools, sessions revalidate them in the background
+        if use_cache and servers is None:
+            _load_cached_server_tools(client)
+            if all(name in _server_tools for name in server_names):
+                for name in server_names:
+                    _ensure_server_started(name, client)
+                _tools_cache = _exposed_tools(server_names)
+                logger.info(f"[PERF] Using tool schemas from cache ({len(_tools_cache)} tools) in {time.time() - start_time:.4f}s")
+                return _tools_cache
         
-        # Execute all server loading tasks in parallel
-        server_names = list(client.connections.keys())
         logger.info(f"🔧 Loading tools from {len(server_names)} MCP servers: {', '.join(server_names)}")
-        tools_load_start = time.time()
-        
-        server_tasks = [load_server_tools(server_name) for server_name in server_names]
-        server_results = await asyncio.gather(*server_tasks, return_exceptions=True)
         
-        tools_load_time = time.time() - tools_load_start
+        # Servers load in parallel, in-flight startups (e.g. lazy preload) are joined instead of restarted
+        tasks = [_ensure_server_started(name, client, refresh=not use_cache) for name in server_names]
+        await asyncio.gather(*[asyncio.shield(task) for task in tasks])
         
-        # Combine all tools from all servers and handle exceptions
-        all_tools = []
-        successful_servers = 0
-        for i, result in enumerate(server_results):
-            if isinstance(result, Exception):
-                logger.error(f"❌ {server_names[i]}: Exception during loading: {result}")
-            elif isinstance(result, list):
-                all_tools.extend(result)
-                successful_servers += 1
+        all_tools = _exposed_tools(server_names)
+        successful_servers = len([name for name in server_names if _server_readiness[name]["status"] == "ready"])
         
-        logger.info(f"🔧 Tools loading complete in {tools_load_time:.1f}s - {successful_servers}/{len(server_names)} servers, {len(all_tools)} total tools")
-        
-        _tools_cache = all_tools
         total_time = time.time() - start_time
+        logger.info(f"🔧 Tools loading complete in {total_time:.1f}s - {successful_servers}/{len(server_names)} servers, {len(all_tools)} total tools")
         
-        # Simple completion message  
-        if len(all_tools) > 0:
-            logger.debug(f"[PERF] Total loading time: {total_time:.1f}s")
+        if servers is None:
+            _tools_cache = all_tools
         
         return all_tools
 
@@ -511,4 +858,3 @@ async def get_mcp_tools_with_persistent_sessions(
         error_time = time.time() - start_time
         logger.error(f"[PERF] Failed to fetch MCP tools with persistent sessions after {error_time:.2f}s: {str(e)}", exc_info=True)
         raise
-
@@ -1,5 +1,5 @@
-from typing import List, Literal, Dict, Any
-from pydantic import BaseModel, Field
+from typing import List, Literal, Dict, Any, Optional
+from pydantic import BaseModel, Field, model_validator
 from langchain.tools import tool
 
 from agent.utils.logging_config import get_logger
@@ -40,8 +40,21 @@ Example 2 - Line Chart (Time Series):
 
 # Define the schema
 class RechartData(BaseModel):
+    source: Optional[str] = Field(
+        default=None,
+        description="Optional tool_call_id of a prom_query/prom_range result. When set, the server builds rechart_data, x_axis_key and y_axis_keys from that result, so leave rechart_data empty."
+    )
+    round_value: Literal["first", "last", "mean"] = Field(
+        default="first",
+        description="Only with 'source' on federated learning metrics labelled by round: which per-round value to plot per cluster."
+    )
+    summary: Literal["series", "distribution"] = Field(
+        default="series",
+        description="Only with 'source': 'distribution' charts per-cluster and fleet percentiles (p25..p99, x axis 'cluster') instead of one bar/line per series. Use it for results with many series."
+    )
     rechart_data: List[Dict[str, Any]] = Field(
-        description="REQUIRED: The structured data used for rendering the chart with Recharts. Each item should be a dictionary with metric values (raw numeric values from source data, string labels for x-axis). Example: [{'timestamp': 1755227795, 'cluster1:foo-client': 581467340.8, 'cluster2:foo-client': 557235855.36}]"
+        default_factory=list,
+        description="REQUIRED unless 'source' is set: The structured data used for rendering the chart with Recharts. Each item should be a dictionary with metric values (raw numeric values from source data, string labels for x-axis). Example: [{'timestamp': 1755227795, 'cluster1:foo-client': 581467340.8, 'cluster2:foo-client': 557235855.36}]"
     )
     rechart_type: Literal["BarChart", "LineChart"] = Field(
         description="The chart type to use. 'BarChart' for categorical/comparison data, 'LineChart' for time-series or trend data."
@@ -63,6 +76,13 @@ class RechartData(BaseModel):
         description="Descriptive title for the chart that explains what is being visualized."
     )
 
+    @model_validator(mode="after")
+    def _require_data_or_source(self):
+        # rechart_data defaults to empty for charts built from 'source', any other chart must carry it
+        if not self.source and not self.rechart_data:
+            raise ValueError("rechart_data is required unless 'source' is set")
+        return self
+
 
 class RechartDataCollection(BaseModel):
     charts: List[RechartData] = Field(
@@ -117,7 +137,8 @@ def render_recharts(data: RechartDataCollection) -> str:
                 continue
             
             # Check if y_axis_keys exist in data  
-            missing_keys = [key for key in chart.y_axis_keys if key not in sample_point]
+            # Series may start late or skip rounds, a key only has to appear in some data point
+            missing_keys = [key for key in chart.y_axis_keys if not any(key in point for point in chart.rechart_data)]
             if missing_keys:
                 logger.warning(f"Chart {i+1}: y_axis_keys {missing_keys} not found in data. Available keys: {list(sample_point.keys())}")
                 # Log all data points to see if keys exist in other points
@@ -0,0 +1,115 @@
+"""
+Tool Schema Cache - Persists MCP tool schemas on disk for instant startup
+
+Each server entry holds the tool names, descriptions and input schemas together with
+a fingerprint of the server launch config and the version the server reported on
+initialize. The next start binds tools from this file right away, the live sessions
+revalidate it in the background.
+"""
+
+import os
+import json
+import time
+import hashlib
+from typing import Any, Dict, List, Optional
+
+from agent.utils.logging_config import get_logger
+
+logger = get_logger("tool_schema_cache")
+
+CACHE_FORMAT_VERSION = 1
+
+# Set MCP_TOOL_CACHE_PATH to an empty string to disable the cache
+TOOL_SCHEMA_CACHE_PATH = os.path.expanduser(
+    os.getenv("MCP_TOOL_CACHE_PATH", "~/.cache/acm-aiops/mcp_tools.json")
+)
+
+
+def config_fingerprint(connection: Dict[str, Any]) -> str:
+    """Fingerprint the parts of a server config that determine which server binary runs"""
+    relevant = {key: connection.get(key) for key in ("transport", "command", "args", "url")}
+    return hashlib.sha256(json.dumps(relevant, sort_keys=True).encode()).hexdigest()[:16]
+
+
+def tools_digest(tools: List[Dict[str, Any]]) -> str:
+    """Digest of a server's tool schemas, used to detect schema drift on revalidation"""
+    return hashlib.sha256(json.dumps(tools, sort_keys=True).encode()).hexdigest()[:16]
+
+
+def _read_cache() -> Dict[str, Any]:
+    """Read the whole cache file, an empty cache if missing or unreadable"""
+    if not TOOL_SCHEMA_CACHE_PATH or not os.path.exists(TOOL_SCHEMA_CACHE_PATH):
+        return {"version": CACHE_FORMAT_VERSION, "servers": {}}
+
+    try:
+        with open(TOOL_SCHEMA_CACHE_PATH) as f:
+            cache = json.load(f)
+    except (OSError, json.JSONDecodeError) as e:
+        logger.warning(f"Ignoring unreadable tool schema cache {TOOL_SCHEMA_CACHE_PATH}: {e}")
+        return {"version": CACHE_FORMAT_VERSION, "servers": {}}
+
+    if cache.get("version") != CACHE_FORMAT_VERSION:
+        logger.info(f"Tool schema cache format changed ({cache.get('version')} -> {CACHE_FORMAT_VERSION}), discarding")
+        return {"version": CACHE_FORMAT_VERSION, "servers": {}}
+    return cache
+
+
+def load_server_tools(server_name: str, fingerprint: str) -> Optional[Dict[str, Any]]:
+    """
+    Load the cached entry of a server.
+
+    Args:
+        server_name: MCP server name
+        fingerprint: Current config fingerprint of the server
+
+    Returns:
+        Entry with 'tools', 'server_version' and 'digest', None if missing or stale
+    """
+    entry = _read_cache()["servers"].get(server_name)
+    if not entry:
+        return None
+
+    if entry.get("fingerprint") != fingerprint:
+        logger.info(f"Tool schema cache for '{server_name}' is stale (server config changed)")
+        return None
+    return entry
+
+
+def save_server_tools(server_name: str, fingerprint: str, server_version: Optional[str], tools: List[Dict[str, Any]]) -> bool:
+    """
+    Persist the tool schemas of a server.
+
+    Returns:
+        True if the cached schemas changed (or were missing), False if they were up to date
+    """
+    if not TOOL_SCHEMA_CACHE_PATH:
+        return False
+
+    cache = _read_cache()
+    previous = cache["servers"].get(server_name) or {}
+    digest = tools_digest(tools)
+    changed = (
+        previous.get("fingerprint") != fingerprint
+        or previous.get("server_version") != server_version
+        or previous.get("digest") != digest
+    )
+
+    cache["servers"][server_name] = {
+        "fingerprint": fingerprint,
+        "server_version": server_version,
+        "digest": digest,
+        "saved_at": time.time(),
+        "tools": tools,
+    }
+
+    try:
+        os.makedirs(os.path.dirname(TOOL_SCHEMA_CACHE_PATH), exist_ok=True)
+        # Write to a temp file first so a crash never leaves a truncated cache behind
+        tmp_path = f"{TOOL_SCHEMA_CACHE_PATH}.{os.getpid()}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(cache, f)
+        os.replace(tmp_path, TOOL_SCHEMA_CACHE_PATH)
+    except OSError as e:
+        logger.warning(f"Failed to write tool schema cache {TOOL_SCHEMA_CACHE_PATH}: {e}")
+
+    return changed
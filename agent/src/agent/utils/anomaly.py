@@ -0,0 +1,215 @@
+"""
+Anomaly - Vectorized pre-analysis of Prometheus results before the analyzer LLM
+
+Every series of a result is aligned onto one grid and all detectors run over the whole
+(series x points) matrix at once:
+- spike: a point far from the series median (robust z-score on the MAD)
+- level_shift: the split maximizing the mean difference before/after it (cumulative sums),
+  scored against the spread within both segments, so steady trends don't count
+- flatline: a series that varied and then stopped changing up to the end (a stalled counter)
+- outlier: a series whose typical level is far from its peers (other clusters and pods)
+Scores are the detector statistic over its threshold (1.0 = just anomalous), the findings
+are ranked by score and the top ones are handed to the analyzer as a compact
+list, so the model narrates them instead of scanning the raw points.
+"""
+
+import os
+import time
+import warnings
+from dataclasses import dataclass
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+
+from agent.utils.logging_config import get_logger
+from agent.utils.prom_result import PromResult, round_significant as _round
+from agent.utils.series_align import align_series
+
+logger = get_logger("anomaly")
+
+ANOMALY_DETECTION = os.getenv("ANOMALY_DETECTION", "true").lower() == "true"
+ANOMALY_Z_THRESHOLD = float(os.getenv("ANOMALY_Z_THRESHOLD", "5.0"))
+ANOMALY_SHIFT_THRESHOLD = float(os.getenv("ANOMALY_SHIFT_THRESHOLD", "4.0"))
+ANOMALY_FLATLINE_MIN_POINTS = int(os.getenv("ANOMALY_FLATLINE_MIN_POINTS", "10"))
+ANOMALY_MAX_FINDINGS = int(os.getenv("ANOMALY_MAX_FINDINGS", "12"))
+
+MIN_POINTS = 8          # Fewer points per series are not enough for the time detectors
+MIN_PEERS = 4           # Fewer series are not enough to call one of them an outlier
+MAD_SCALE = 1.4826      # MAD -> standard deviation for normal data
+MEAN_AD_SCALE = 1.2533  # Mean absolute deviation -> standard deviation for normal data
+MAX_SCORE = 100.0       # Near-constant peers make z explode, beyond this the order says nothing
+
+_anomaly_stats = {
+    "results_analyzed": 0,
+    "series_analyzed": 0,
+    "findings": 0,
+    "total_time_ms": 0.0,
+}
+
+
+def get_anomaly_stats() -> dict:
+    """Get anomaly pre-analysis statistics for monitoring"""
+    analyzed = _anomaly_stats["results_analyzed"]
+    return {
+        **_anomaly_stats,
+        "avg_time_ms": round(_anomaly_stats["total_time_ms"] / analyzed, 2) if analyzed else 0.0,
+    }
+
+
+@dataclass
+class Finding:
+    kind: str            # 'spike', 'level_shift', 'flatline' or 'outlier'
+    series: str
+    score: float         # Statistic over its threshold, comparable across kinds
+    detail: Dict[str, Any]
+    source: Optional[str] = None
+
+    def to_record(self) -> Dict[str, Any]:
+        record = {"kind": self.kind, "series": self.series, "score": _round(self.score)}
+        if self.source:
+            record["source"] = self.source
+        record.update(self.detail)
+        return record
+
+
+def _robust_sigma(matrix: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """Per-row median and MAD-based standard deviation, ignoring NaN"""
+    median = np.nanmedian(matrix, axis=1)
+    sigma = MAD_SCALE * np.nanmedian(np.abs(matrix - median[:, None]), axis=1)
+    return median, sigma
+
+
+def _fill_gaps(matrix: np.ndarray, fill: np.ndarray) -> np.ndarray:
+    """Replace NaN with a per-row value so cumulative sums stay defined"""
+    return np.where(np.isnan(matrix), fill[:, None], matrix)
+
+
+def detect_spikes(matrix: np.ndarray, grid: np.ndarray) -> List[Tuple[int, float, Dict[str, Any]]]:
+    median, sigma = _robust_sigma(matrix)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        z = np.abs(matrix - median[:, None]) / sigma[:, None]
+    z[~np.isfinite(z)] = 0.0
+    at = z.argmax(axis=1)
+    peak = z[np.arange(len(z)), at]
+    hits = np.flatnonzero(peak > ANOMALY_Z_THRESHOLD)
+    return [(i, float(peak[i]) / ANOMALY_Z_THRESHOLD,
+             {"at": _round(grid[at[i]]), "value": _round(matrix[i, at[i]]), "median": _round(median[i]), "robust_z": _round(peak[i])})
+            for i in hits]
+
+
+def detect_level_shifts(matrix: np.ndarray, grid: np.ndarray) -> List[Tuple[int, float, Dict[str, Any]]]:
+    points = matrix.shape[1]
+    segment = max(MIN_POINTS // 2, points // 10)
+    if points < 2 * segment:
+        return []
+
+    # Centered on the median, so the sums of squares keep their precision on large values (bytes)
+    median, _ = _robust_sigma(matrix)
+    filled = _fill_gaps(matrix - median[:, None], np.zeros(len(matrix)))
+    cumsum = np.cumsum(filled, axis=1)
+    squares = np.cumsum(filled * filled, axis=1)
+    total = cumsum[:, -1:]
+    split = np.arange(segment, points - segment + 1)          # points before the split
+    before = cumsum[:, split - 1] / split
+    after = (total - cumsum[:, split - 1]) / (points - split)
+    difference = after - before
+    # Scan statistic: the mean difference weighted by how well both sides are supported
+    weight = np.sqrt(split * (points - split) / points)
+    best = np.abs(difference * weight).argmax(axis=1)
+
+    rows = np.arange(len(matrix))
+    k = split[best]
+    mean_before, mean_after = before[rows, best], after[rows, best]
+    # Spread around the two segment means: small for a step, large for a ramp
+    residual = squares[:, -1] - k * mean_before ** 2 - (points - k) * mean_after ** 2
+    spread = np.sqrt(np.maximum(residual, 0.0) / (points - 2))
+    floor = 1e-9 * np.maximum(np.maximum(np.abs(mean_before), np.abs(mean_after)), 1.0)
+    effect = np.abs(difference[rows, best]) / np.maximum(spread, floor)
+    hits = np.flatnonzero(np.isfinite(effect) & (effect > ANOMALY_SHIFT_THRESHOLD))
+    return [(i, float(effect[i]) / ANOMALY_SHIFT_THRESHOLD,
+             {"at": _round(grid[k[i]]), "before": _round(mean_before[i] + median[i]), "after": _round(mean_after[i] + median[i])})
+            for i in hits]
+
+
+def detect_flatlines(matrix: np.ndarray, grid: np.ndarray) -> List[Tuple[int, float, Dict[str, Any]]]:
+    points = matrix.shape[1]
+    if points < ANOMALY_FLATLINE_MIN_POINTS + 2:
+        return []
+    changed = np.diff(matrix, axis=1) != 0               # NaN compares as changed, gaps break a run
+    # Length of the unchanged run at the end: position of the last change counted from the end
+    last_change = points - 2 - np.argmax(changed[:, ::-1], axis=1)
+    varied = changed.any(axis=1)
+    run = np.where(varied, points - 1 - last_change, 0)
+    # A quarter of the window at least, a gauge settling for a moment is not a stall
+    min_run = max(ANOMALY_FLATLINE_MIN_POINTS, points // 4)
+    hits = np.flatnonzero(varied & (run >= min_run) & ~np.isnan(matrix[:, -1]))
+    return [(i, float(run[i]) / min_run,
+             {"since": _round(grid[points - 1 - run[i]]), "value": _round(matrix[i, -1]), "points": int(run[i])})
+            for i in hits]
+
+
+def detect_outliers(levels: np.ndarray) -> List[Tuple[int, float, Dict[str, Any]]]:
+    present = ~np.isnan(levels)
+    if present.sum() < MIN_PEERS:
+        return []
+    median, sigma = _robust_sigma(levels[None, present])
+    median, sigma = float(median[0]), float(sigma[0])
+    if not sigma:
+        # Most peers are equal, fall back to the mean absolute deviation
+        sigma = MEAN_AD_SCALE * float(np.mean(np.abs(levels[present] - median)))
+    if not sigma:
+        return []
+    z = np.abs(levels - median) / sigma
+    hits = np.flatnonzero(present & (z > ANOMALY_Z_THRESHOLD))
+    return [(i, float(z[i]) / ANOMALY_Z_THRESHOLD,
+             {"level": _round(levels[i]), "peer_median": _round(median), "robust_z": _round(z[i])})
+            for i in hits]
+
+
+def analyze_result(result: PromResult, source: Optional[str] = None) -> List[Finding]:
+    """All findings of one result, unranked"""
+    series = [s for s in result.series if len(s)]
+    if not series:
+        return []
+    names = [s.name for s in series]
+    findings: List[Finding] = []
+
+    def collect(kind: str, hits: List[Tuple[int, float, Dict[str, Any]]]):
+        findings.extend(Finding(kind, names[i], min(score, MAX_SCORE), detail, source) for i, score, detail in hits)
+
+    # Empty grid points are NaN, all-NaN rows simply produce no finding
+    with warnings.catch_warnings(), np.errstate(all="ignore"):
+        warnings.simplefilter("ignore", RuntimeWarning)
+        if result.result_type == "matrix":
+            aligned = align_series(series)
+            matrix = aligned.values.T                    # (series, points)
+            if len(aligned) >= MIN_POINTS:
+                collect("spike", detect_spikes(matrix, aligned.grid))
+                collect("level_shift", detect_level_shifts(matrix, aligned.grid))
+                collect("flatline", detect_flatlines(matrix, aligned.grid))
+            levels = np.nanmedian(matrix, axis=1)
+        else:
+            levels = np.array([float(s.values[-1]) for s in series])
+        collect("outlier", detect_outliers(levels))
+    return findings
+
+
+def rank_findings(results: List[Tuple[str, PromResult]], limit: int = ANOMALY_MAX_FINDINGS) -> List[Finding]:
+    """Findings across results, strongest first"""
+    start_time = time.time()
+    findings: List[Finding] = []
+    for source, result in results:
+        if result is None or result.status != "success":
+            continue
+        findings.extend(analyze_result(result, source))
+        _anomaly_stats["results_analyzed"] += 1
+        _anomaly_stats["series_analyzed"] += result.series_count
+
+    findings.sort(key=lambda f: f.score, reverse=True)
+    ranked = findings[:limit]
+    _anomaly_stats["findings"] += len(ranked)
+    elapsed_ms = (time.time() - start_time) * 1000
+    _anomaly_stats["total_time_ms"] += elapsed_ms
+    if results:
+        logger.info(f"[PERF] Pre-analysis: {len(findings)} findings over {len(results)} results in {elapsed_ms:.1f}ms")
+    return ranked
@@ -0,0 +1,183 @@
+"""
+Answer Cache - End-to-end memoization of answered questions
+
+A question asked again within the same time bucket gets the previous answer replayed:
+the charts (render_recharts call and result) and the analyzer's final text go straight
+into state, without running the inspector, tool, analyzer or chart nodes. The key is the
+normalized question, the time bucket (ANSWER_CACHE_BUCKET seconds, so 'the last hour'
+means the same window) and the thread's previous question, which follow-ups like
+'and the memory?' depend on.
+
+Only answers built from Prometheus data are stored: a turn with any other tool call
+(kubectl may change the cluster), a failed call, a partial federated result or a failed
+chart is not. '/refresh <question>' (or '/refresh' alone, for the previous question)
+bypasses the cache and stores the new answer.
+"""
+
+import os
+import re
+import time
+import uuid
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Sequence, Tuple
+
+from langchain_core.messages import AIMessage, BaseMessage, HumanMessage, ToolMessage
+
+from agent.utils.logging_config import get_logger
+from agent.utils.prom_result import PROMETHEUS_TOOLS
+
+logger = get_logger("answer_cache")
+
+ANSWER_CACHE = os.getenv("ANSWER_CACHE", "true").lower() == "true"
+ANSWER_CACHE_BUCKET = float(os.getenv("ANSWER_CACHE_BUCKET", "60"))
+ANSWER_CACHE_SIZE = int(os.getenv("ANSWER_CACHE_SIZE", "128"))
+
+REFRESH_COMMAND = "/refresh"
+CACHEABLE_TOOLS = set(PROMETHEUS_TOOLS) | {"render_recharts"}
+
+_SPACES = re.compile(r"\s+")
+
+Key = Tuple[str, str, int]
+
+
+@dataclass
+class CachedAnswer:
+    text: str
+    charts: List[Tuple[dict, str]]        # (render_recharts args, tool result)
+    progress: List[Tuple[str, str]]       # (node display name, completion message)
+    stored_at: float
+
+
+_answers: "OrderedDict[Key, CachedAnswer]" = OrderedDict()
+_answer_stats = {
+    "lookups": 0,
+    "hits": 0,
+    "misses": 0,
+    "refreshes": 0,
+    "stores": 0,
+    "uncacheable": 0,
+    "evictions": 0,
+}
+
+
+def get_answer_cache_stats() -> dict:
+    """Get answer cache statistics for monitoring"""
+    return {
+        **_answer_stats,
+        "enabled": ANSWER_CACHE,
+        "entries": len(_answers),
+        "hit_rate": round(_answer_stats["hits"] / _answer_stats["lookups"], 3) if _answer_stats["lookups"] else 0.0,
+    }
+
+
+def normalize_question(text: str) -> str:
+    return _SPACES.sub(" ", str(text)).strip().rstrip("?.! ").lower()
+
+
+def _is_command(text: str) -> bool:
+    return str(text).strip().startswith("/")
+
+
+def previous_question(query: str, messages: Sequence[BaseMessage]) -> str:
+    """
+    The thread's question before the last one, empty if none.
+
+    Commands and repeats of the same question are skipped: asking again doesn't change
+    what the question refers to.
+    """
+    question = normalize_question(query)
+    humans = [m.content for m in messages if isinstance(m, HumanMessage) and not _is_command(m.content)]
+    for text in reversed(humans[:-1]):
+        if normalize_question(text) != question:
+            return normalize_question(text)
+    return ""
+
+
+def _key(query: str, messages: Sequence[BaseMessage], now: Optional[float] = None) -> Key:
+    bucket = int((now or time.time()) // ANSWER_CACHE_BUCKET)
+    return normalize_question(query), previous_question(query, messages), bucket
+
+
+def parse_refresh(text: str, last_query: str) -> Optional[str]:
+    """The question a /refresh command re-asks (the last one if none given), None if not a /refresh"""
+    text = str(text).strip()
+    if text != REFRESH_COMMAND and not text.startswith(REFRESH_COMMAND + " "):
+        return None
+    _answer_stats["refreshes"] += 1
+    return text[len(REFRESH_COMMAND):].strip() or last_query
+
+
+def lookup_answer(query: str, messages: Sequence[BaseMessage]) -> Optional[CachedAnswer]:
+    """The cached answer to the last question of the thread, None on a miss"""
+    if not ANSWER_CACHE or not query or _is_command(query):
+        return None
+    _answer_stats["lookups"] += 1
+    key = _key(query, messages)
+    answer = _answers.get(key)
+    if answer is None:
+        _answer_stats["misses"] += 1
+        return None
+    _answers.move_to_end(key)
+    _answer_stats["hits"] += 1
+    logger.info(f"[PERF] Answer cache hit for '{key[0]}' (answered {time.time() - answer.stored_at:.0f}s ago)")
+    return answer
+
+
+def replay_messages(answer: CachedAnswer) -> List[BaseMessage]:
+    """Fresh messages re-creating the cached charts and final text"""
+    messages: List[BaseMessage] = []
+    if answer.charts:
+        calls = [{"name": "render_recharts", "args": args, "id": f"call_{uuid.uuid4().hex[:24]}"} for args, _ in answer.charts]
+        messages.append(AIMessage(content="", tool_calls=calls, additional_kwargs={"node": "analyzer", "answer_cache": "hit"}))
+        messages.extend(ToolMessage(content=content, tool_call_id=call["id"], name="render_recharts")
+                        for call, (_, content) in zip(calls, answer.charts))
+    messages.append(AIMessage(content=answer.text, additional_kwargs={"node": "analyzer", "answer_cache": "hit"}))
+    return messages
+
+
+def _turn(messages: Sequence[BaseMessage]) -> Optional[List[BaseMessage]]:
+    """Messages after the last question"""
+    for index in range(len(messages) - 1, -1, -1):
+        if isinstance(messages[index], HumanMessage):
+            return list(messages[index + 1:])
+    return None
+
+
+def store_answer(query: str, messages: Sequence[BaseMessage], progress: Optional[List[Dict[str, str]]] = None) -> bool:
+    """Cache the finished turn's answer if it was built from Prometheus data only"""
+    if not ANSWER_CACHE or not query or _is_command(query):
+        return False
+    turn = _turn(messages)
+    if not turn:
+        return False
+    final = turn[-1]
+    if not isinstance(final, AIMessage) or final.tool_calls or not final.content or final.additional_kwargs.get("answer_cache"):
+        return False
+
+    results = {m.tool_call_id: m for m in turn if isinstance(m, ToolMessage)}
+    calls = {call["id"]: call for m in turn if isinstance(m, AIMessage) for call in m.tool_calls}
+    fetched = any(call["name"] in PROMETHEUS_TOOLS for call in calls.values())
+    failed = [
+        m for m in results.values()
+        if str(m.content).startswith(("Error", "Tool ")) or m.additional_kwargs.get("missing_clusters")
+    ]
+    if not fetched or failed or any(call["name"] not in CACHEABLE_TOOLS or call["id"] not in results for call in calls.values()):
+        _answer_stats["uncacheable"] += 1
+        return False
+
+    charts = [(call["args"], str(results[call["id"]].content)) for call in calls.values() if call["name"] == "render_recharts"]
+    key = _key(query, messages)
+    _answers[key] = CachedAnswer(
+        text=str(final.content),
+        charts=charts,
+        progress=[(node["name"], node["message"]) for node in progress or [] if node.get("status") == "completed"],
+        stored_at=time.time(),
+    )
+    _answers.move_to_end(key)
+    _answer_stats["stores"] += 1
+    while len(_answers) > ANSWER_CACHE_SIZE:
+        _answers.popitem(last=False)
+        _answer_stats["evictions"] += 1
+    logger.debug(f"Cached answer for '{key[0]}' with {len(charts)} chart call(s)")
+    return True
@@ -0,0 +1,114 @@
+"""
+Chart Data - Builds render_recharts datasets directly from columnar Prometheus results
+
+Charts that reference a tool result (`source`) get their rechart_data here instead of
+from the LLM re-typing thousands of numbers.
+"""
+
+from typing import Any, Dict, List, Tuple
+
+import numpy as np
+
+from agent.utils.prom_result import PromResult, PromSeries, compact_number as _compact
+from agent.utils.series_align import align_series
+from agent.utils.fl_rounds import ROUND_LABEL, aggregate_rounds, has_rounds
+from agent.utils.quantile_sketch import distribution_rows
+
+
+def _unique_names(series: List[PromSeries]) -> List[str]:
+    """Series names, suffixed where two series would end up in the same column"""
+    names, seen = [], {}
+    for s in series:
+        name = s.name
+        seen[name] = seen.get(name, 0) + 1
+        names.append(name if seen[name] == 1 else f"{name}#{seen[name]}")
+    return names
+
+
+def _grid_rows(timestamps: np.ndarray, grid: np.ndarray, keys: List[str], x_key: str, skip_empty: bool) -> List[Dict[str, Any]]:
+    """Wide rows from a (timestamps x series) grid, non-finite cells are left out of a row"""
+    rows = []
+    for ts, row in zip(timestamps.tolist(), grid.tolist()):
+        point = {key: value for key, value in zip(keys, row) if value == value and abs(value) != float("inf")}
+        if point or not skip_empty:
+            rows.append({x_key: _compact(ts), **point})
+    return rows
+
+
+def pivot_wide(result: PromResult, x_key: str = "timestamp") -> Tuple[List[Dict[str, Any]], List[str]]:
+    """
+    Pivot a matrix to wide rows: one row per raw timestamp, one column per series.
+
+    Returns:
+        (rows, series keys). Missing or non-finite samples are left out of a row.
+    """
+    series = [s for s in result.series if len(s)]
+    if not series:
+        return [], []
+
+    keys = _unique_names(series)
+    timestamps = np.unique(np.concatenate([s.timestamps for s in series]))
+
+    grid = np.full((len(timestamps), len(series)), np.nan)
+    for column, s in enumerate(series):
+        grid[np.searchsorted(timestamps, s.timestamps), column] = s.values
+
+    return _grid_rows(timestamps, grid, keys, x_key, skip_empty=False), keys
+
+
+def pivot_aligned(result: PromResult, x_key: str = "timestamp", **align_options) -> Tuple[List[Dict[str, Any]], List[str]]:
+    """
+    Pivot a matrix to wide rows on a common step grid, so series scraped at different
+    offsets (clusters) share rows instead of producing sparse, jagged lines.
+
+    Args:
+        align_options: step, method, staleness, max_points (see series_align.align_series)
+
+    Returns:
+        (rows, series keys). Grid points without any current sample are dropped.
+    """
+    series = [s for s in result.series if len(s)]
+    if not series:
+        return [], []
+
+    aligned = align_series(series, **align_options)
+    return _grid_rows(aligned.grid, aligned.values, _unique_names(series), x_key, skip_empty=True), _unique_names(series)
+
+
+def latest_values(result: PromResult, x_key: str = "pod", y_key: str = "value") -> List[Dict[str, Any]]:
+    """One bar per series with its most recent finite value"""
+    rows = []
+    for name, s in zip(_unique_names(result.series), result.series):
+        finite = s.values[np.isfinite(s.values)]
+        if len(finite):
+            rows.append({x_key: name, y_key: float(finite[-1])})
+    return rows
+
+
+def build_rechart_data(result: PromResult, rechart_type: str, round_value: str = "first",
+                       summary: str = "series") -> Tuple[List[Dict[str, Any]], str, List[str]]:
+    """
+    Build a render_recharts dataset from a Prometheus result.
+
+    Federated learning metrics labelled by round are aggregated per (cluster, round):
+    a LineChart gets one row per round, a BarChart one bar per cluster for the latest round.
+    A 'distribution' summary gets one row of percentiles per cluster and for the fleet.
+
+    Returns:
+        (rechart_data, x_axis_key, y_axis_keys)
+    """
+    if summary == "distribution":
+        return distribution_rows(result)
+
+    if has_rounds(result):
+        table = aggregate_rounds(result)
+        if rechart_type == "LineChart":
+            return table.to_rows(round_value), ROUND_LABEL, table.columns
+        latest = table.to_rows(round_value)[-1] if table.rounds else {}
+        return [{"cluster": column, "value": latest[column]} for column in table.columns if column in latest], "cluster", ["value"]
+
+    if rechart_type == "LineChart" and result.result_type == "matrix":
+        rows, keys = pivot_aligned(result)
+        return rows, "timestamp", keys
+
+    return latest_values(result), "pod", ["value"]
@@ -0,0 +1,161 @@
+"""
+Counter Eval - Local rate/irate/increase/delta/idelta over raw samples
+
+When several calls apply different window functions to the same counter selector, the
+raw samples are fetched once (a range-vector instant query) and every variant is computed
+here. The kernels follow Prometheus' semantics: windows are left-open (t - range, t],
+counter resets add the pre-reset value, and rate/increase/delta extrapolate to the window
+edges (never below zero for counters). All evaluation points of a series are computed in
+one vectorized pass. Raw fetches are pinned with '@', so a later call over a window
+already covered can be evaluated from the small raw cache without a query.
+"""
+
+import os
+from collections import OrderedDict
+from typing import Dict, Optional, Tuple
+
+import numpy as np
+
+from agent.utils.prom_result import PromResult, PromSeries, intern_labels
+
+WINDOW_FUNCTIONS = ("rate", "irate", "increase", "delta", "idelta")
+COUNTER_RAW_CACHE_SIZE = int(os.getenv("COUNTER_RAW_CACHE_SIZE", "32"))
+
+# selector -> (covered from (exclusive), covered until, raw samples)
+_raw_cache: "OrderedDict[str, Tuple[float, float, PromResult]]" = OrderedDict()
+
+
+def reset_adjusted(values: np.ndarray) -> np.ndarray:
+    """Counter values with resets undone: after a drop, the value before it is added to all later samples"""
+    if len(values) < 2:
+        return values.copy()
+    drops = np.where(values[1:] < values[:-1], values[:-1], 0.0)
+    return values + np.concatenate([[0.0], np.cumsum(drops)])
+
+
+def _window_bounds(timestamps: np.ndarray, grid: np.ndarray, window: float):
+    """Index of the first and last sample in (t - window, t] for every evaluation time t"""
+    first = np.searchsorted(timestamps, grid - window, side="right")
+    last = np.searchsorted(timestamps, grid, side="right") - 1
+    return first, last
+
+
+def extrapolated(timestamps: np.ndarray, values: np.ndarray, grid: np.ndarray, window: float,
+                 is_counter: bool, is_rate: bool) -> np.ndarray:
+    """rate/increase (is_counter) or delta over each window, extrapolated like Prometheus"""
+    out = np.full(len(grid), np.nan)
+    first, last = _window_bounds(timestamps, grid, window)
+    valid = (last - first) >= 1
+    if not valid.any():
+        return out
+
+    first, last, at = first[valid], last[valid], grid[valid]
+    adjusted = reset_adjusted(values) if is_counter else values
+    result = adjusted[last] - adjusted[first]
+
+    first_ts, last_ts = timestamps[first], timestamps[last]
+    sampled = last_ts - first_ts
+    average_interval = sampled / (last - first)
+    to_start = first_ts - (at - window)
+    to_end = at - last_ts
+
+    if is_counter:
+        # The counter can't have been below zero before the window started
+        first_values = values[first]
+        with np.errstate(divide="ignore", invalid="ignore"):
+            to_zero = np.where((result > 0) & (first_values >= 0), sampled * (first_values / result), np.inf)
+        to_start = np.minimum(to_start, to_zero)
+
+    threshold = average_interval * 1.1
+    interval = sampled.copy()
+    interval += np.where(to_start < threshold, to_start, average_interval / 2)
+    interval += np.where(to_end < threshold, to_end, average_interval / 2)
+
+    result = result * (interval / sampled)
+    if is_rate:
+        result = result / window
+    out[valid] = result
+    return out
+
+
+def instant(timestamps: np.ndarray, values: np.ndarray, grid: np.ndarray, window: float, is_rate: bool) -> np.ndarray:
+    """irate (counter, per second) or idelta over the last two samples of each window"""
+    out = np.full(len(grid), np.nan)
+    first, last = _window_bounds(timestamps, grid, window)
+    valid = (last - first) >= 1
+    if not valid.any():
+        return out
+
+    last = last[valid]
+    current, previous = values[last], values[last - 1]
+    if is_rate:
+        difference = np.where(current < previous, current, current - previous)  # Reset: counted from zero
+        out[valid] = difference / (timestamps[last] - timestamps[last - 1])
+    else:
+        out[valid] = current - previous
+    return out
+
+
+def evaluate_series(function: str, timestamps: np.ndarray, values: np.ndarray, grid: np.ndarray, window: float) -> np.ndarray:
+    """Evaluate one window function over one raw series at every grid timestamp"""
+    finite = np.isfinite(values)
+    if not finite.all():
+        timestamps, values = timestamps[finite], values[finite]
+    if function == "rate":
+        return extrapolated(timestamps, values, grid, window, is_counter=True, is_rate=True)
+    if function == "increase":
+        return extrapolated(timestamps, values, grid, window, is_counter=True, is_rate=False)
+    if function == "delta":
+        return extrapolated(timestamps, values, grid, window, is_counter=False, is_rate=False)
+    if function == "irate":
+        return instant(timestamps, values, grid, window, is_rate=True)
+    if function == "idelta":
+        return instant(timestamps, values, grid, window, is_rate=False)
+    raise ValueError(f"Unsupported window function '{function}'")
+
+
+def evaluate(function: str, window: float, raw: PromResult, grid: np.ndarray, result_type: str = "matrix") -> PromResult:
+    """
+    Evaluate a window function over raw samples, shaped like Prometheus' answer.
+
+    Args:
+        function: One of WINDOW_FUNCTIONS
+        window: Range of the window in seconds
+        raw: Raw samples (matrix of a range-vector selector)
+        grid: Evaluation timestamps (one for an instant query)
+        result_type: 'matrix' for a range query, 'vector' for an instant query
+    """
+    series = []
+    for s in raw.series:
+        values = evaluate_series(function, s.timestamps, s.values, grid, window)
+        present = ~np.isnan(values)
+        if not present.any():
+            continue
+        # Like Prometheus, the function result drops the metric name
+        labels: Dict[str, str] = intern_labels({k: v for k, v in s.metric.items() if k != "__name__"})
+        series.append(PromSeries(labels, grid[present].astype(np.float64), values[present]))
+    return PromResult("success", result_type, series)
+
+
+def evaluation_grid(start: float, end: float, step: Optional[float]) -> np.ndarray:
+    """Evaluation timestamps of a range query (start + k*step <= end), or the single instant"""
+    if not step:
+        return np.array([end], dtype=np.float64)
+    return start + np.arange(int((end - start) // step) + 1) * step
+
+
+def remember_raw(selector: str, low: float, high: float, raw: PromResult):
+    """Keep the raw samples of a selector over (low, high] for later evaluations"""
+    _raw_cache[selector] = (low, high, raw)
+    _raw_cache.move_to_end(selector)
+    while len(_raw_cache) > COUNTER_RAW_CACHE_SIZE:
+        _raw_cache.popitem(last=False)
+
+
+def cached_raw(selector: str, low: float, high: float) -> Optional[PromResult]:
+    """Cached raw samples of a selector covering (low, high], None if not cached"""
+    entry = _raw_cache.get(selector)
+    if entry is None or low < entry[0] or high > entry[1]:
+        return None
+    _raw_cache.move_to_end(selector)
+    return entry[2]
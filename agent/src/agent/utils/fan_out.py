@@ -0,0 +1,250 @@
+"""
+Fan Out - Shards Prometheus calls per cluster and streams the slices as they arrive
+
+One query over every managed cluster is as slow as the slowest cluster and fails as a
+whole. A per-series call (one selector, see promql templates) that spans several clusters
+is split into one shard per cluster_name (or per group of clusters). The shards run in
+parallel in their own executor lane (PROM_FANOUT_CONCURRENCY, deadline per running shard).
+Each finished shard is reported through the progress callback with the call's slices
+merged so far (per-series digest and missing clusters), and at the end the slices are
+merged into one ToolMessage per call. A failed or timed out cluster only leaves its own
+slice missing, which the message records.
+
+The clusters holding a selector are found with a cheap instant 'group by (cluster_name)'
+over the call's own window (last_over_time, evaluated at the call's end or time, so past
+windows see the clusters of that time) and cached for a while. A remainder shard with
+cluster_name!~"<probed clusters>" always runs too: it returns the series without a
+cluster_name and the clusters the probe missed, usually nothing.
+"""
+
+import os
+import re
+import math
+import time
+import asyncio
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+
+from langchain_core.messages import ToolMessage
+
+from agent.utils.logging_config import get_logger
+from agent.utils.prom_result import PROMETHEUS_TOOLS, PromResult, cache_prom_result, get_prom_result, parse_prom_response
+from agent.utils.promql import (
+    CLUSTER_LABEL, Matcher, PromQLError, Selector, escape_regex, format_duration, parse_duration, parse_query,
+    parse_time, range_args,
+)
+from agent.utils.tool_executor import execute_tool_call, execute_tool_calls, lane_limiter
+
+logger = get_logger("fan_out")
+
+PROM_FANOUT = os.getenv("PROM_FANOUT", "true").lower() == "true"
+PROM_FANOUT_MIN_CLUSTERS = int(os.getenv("PROM_FANOUT_MIN_CLUSTERS", "4"))
+PROM_FANOUT_GROUP_SIZE = int(os.getenv("PROM_FANOUT_GROUP_SIZE", "1"))     # Clusters per shard
+PROM_FANOUT_CONCURRENCY = int(os.getenv("PROM_FANOUT_CONCURRENCY", "8"))   # Shards running, in their own executor lane
+PROM_FANOUT_CLUSTER_TTL = float(os.getenv("PROM_FANOUT_CLUSTER_TTL", "300"))
+CLUSTER_CACHE_SIZE = 256
+LOOKBACK_DELTA = 300        # Prometheus' default staleness window, seconds
+REMAINDER_SHARD = "other clusters"
+
+_RANGE = re.compile(r"\[([0-9a-z]+)(?::[0-9a-z]*)?\]")
+
+ProgressCallback = Callable[[str, Dict[str, Any]], Awaitable[None]]   # (message, partial result of the call)
+
+_cluster_cache: "OrderedDict[str, Tuple[float, List[str]]]" = OrderedDict()
+_fanout_stats = {
+    "fanned_calls": 0,
+    "shards": 0,
+    "shard_failures": 0,
+    "partial_results": 0,
+    "cluster_probes": 0,
+    "cluster_cache_hits": 0,
+}
+
+
+def get_fanout_stats() -> dict:
+    """Get fan-out statistics for monitoring"""
+    return {**_fanout_stats, "cluster_cache_size": len(_cluster_cache)}
+
+
+def _probe_window(tool_call: Dict[str, Any], template: str) -> Tuple[Optional[float], float]:
+    """(evaluation time, None for now; lookback) covering every sample the call can read"""
+    ranges = [parse_duration(window) or 0 for window in _RANGE.findall(template)]
+    lookback = max(ranges, default=0) + LOOKBACK_DELTA
+    args = tool_call.get("args", {})
+    if tool_call.get("name") == "prom_range":
+        start, end, _ = range_args(args)
+        if start is not None and end is not None and end >= start:
+            return end, end - start + lookback
+        return None, lookback
+    return parse_time(args.get("time")), lookback
+
+
+async def probe_clusters(selector: Selector, tool_map: Dict[str, Any], config=None,
+                         at: Optional[float] = None, lookback: float = LOOKBACK_DELTA) -> Optional[List[str]]:
+    """Clusters with series of the selector in the lookback before 'at' (now if None), None if unknown"""
+    window = format_duration(math.ceil(lookback))
+    # Windows ending in the past don't change, recent ones are re-probed after the TTL
+    key = f"{selector.render()}[{window}]@{at:.0f}" if at is not None else f"{selector.render()}[{window}]"
+    cached = _cluster_cache.get(key)
+    if cached and time.time() - cached[0] < PROM_FANOUT_CLUSTER_TTL:
+        _fanout_stats["cluster_cache_hits"] += 1
+        return cached[1]
+    if "prom_query" not in tool_map:
+        return None
+
+    _fanout_stats["cluster_probes"] += 1
+    args = {"query": f"group by ({CLUSTER_LABEL}) (last_over_time({selector.render()}[{window}]))"}
+    if at is not None:
+        args["time"] = f"{at:.3f}"
+    probe = {"name": "prom_query", "args": args, "id": f"clusters-{abs(hash(key))}"}
+    result = parse_prom_response((await execute_tool_call(probe, tool_map, config)).content)
+    if result is None or result.status != "success":
+        logger.warning(f"Cluster probe failed for {key}")
+        return None
+
+    clusters = sorted({s.metric[CLUSTER_LABEL] for s in result.series if s.metric.get(CLUSTER_LABEL)})
+    _cluster_cache[key] = (time.time(), clusters)
+    while len(_cluster_cache) > CLUSTER_CACHE_SIZE:
+        _cluster_cache.popitem(last=False)
+    return clusters
+
+
+def _shard_selector(selector: Selector, clusters: List[str], exclude: bool = False) -> Selector:
+    """The selector restricted to the given clusters, or to all others (kept matchers still apply)"""
+    if exclude:
+        matcher = Matcher(CLUSTER_LABEL, "!~", "|".join(escape_regex(cluster) for cluster in clusters))
+    elif len(clusters) == 1:
+        matcher = Matcher(CLUSTER_LABEL, "=", clusters[0])
+    else:
+        matcher = Matcher(CLUSTER_LABEL, "=~", "|".join(escape_regex(cluster) for cluster in clusters))
+    return Selector(selector.metric, tuple(sorted((*selector.matchers, matcher), key=lambda m: (m.label, m.op, m.value))))
+
+
+async def plan_shards(tool_call: Dict[str, Any], tool_map: Dict[str, Any], config=None) -> Optional[List[Tuple[str, Dict[str, Any]]]]:
+    """(shard label, shard call) pairs of a call spanning enough clusters, None to run it as is"""
+    if tool_call.get("name") not in PROMETHEUS_TOOLS or not tool_call.get("id"):
+        return None
+    try:
+        parsed = parse_query(tool_call.get("args", {}).get("query", ""))
+    except PromQLError:
+        return None
+    # Only per-series expressions can be split and concatenated back unchanged
+    if parsed.template is None or any(m.label == CLUSTER_LABEL and m.op == "=" for m in parsed.selector.matchers):
+        return None
+
+    at, lookback = _probe_window(tool_call, parsed.template)
+    clusters = await probe_clusters(parsed.selector, tool_map, config, at, lookback)
+    if not clusters or len(clusters) < PROM_FANOUT_MIN_CLUSTERS:
+        return None
+
+    def shard(label: str, selector: Selector) -> Tuple[str, Dict[str, Any]]:
+        query = parsed.template.replace("$selector", selector.render(), 1)
+        return label, {**tool_call, "id": f"{tool_call['id']}#{label}", "args": {**tool_call["args"], "query": query}}
+
+    size = max(1, PROM_FANOUT_GROUP_SIZE)
+    shards = [shard(",".join(clusters[i:i + size]), _shard_selector(parsed.selector, clusters[i:i + size]))
+              for i in range(0, len(clusters), size)]
+    # Series without a cluster_name and clusters the probe missed
+    shards.append(shard(REMAINDER_SHARD, _shard_selector(parsed.selector, clusters, exclude=True)))
+    return shards
+
+
+def _merge(shards: List[Tuple[str, ToolMessage]]) -> Tuple[Optional[PromResult], List[str]]:
+    """(series of the successful shards, None if none succeeded; labels of the failed shards)"""
+    merged: Optional[PromResult] = None
+    seen = set()
+    failed = []
+    for label, message in shards:
+        result = get_prom_result(message)
+        if result is None or result.status != "success":
+            failed.append(label)
+            continue
+        if merged is None:
+            merged = PromResult("success", result.result_type, [])
+        merged.warnings.extend(result.warnings)
+        for s in result.series:
+            key = frozenset(s.metric.items())
+            if key not in seen:
+                seen.add(key)
+                merged.series.append(s)
+    return merged, failed
+
+
+def merge_shards(tool_call: Dict[str, Any], shards: List[Tuple[str, ToolMessage]]) -> ToolMessage:
+    """One message with the series of every successful shard, missing clusters recorded"""
+    merged, failed = _merge(shards)
+    if merged is None:
+        # Every shard failed, report the first error like the unsharded call would have
+        first = shards[0][1]
+        return ToolMessage(content=first.content, tool_call_id=tool_call["id"], name=tool_call.get("name"))
+
+    cache_prom_result(tool_call["id"], merged)
+    additional_kwargs: Dict[str, Any] = {"fanout": {"shards": len(shards), "failed": failed}}
+    if failed:
+        additional_kwargs["missing_clusters"] = failed
+        _fanout_stats["partial_results"] += 1
+    return ToolMessage(content=merged.to_response_json(), tool_call_id=tool_call["id"], name=tool_call.get("name"),
+                       additional_kwargs=additional_kwargs)
+
+
+async def execute_with_fan_out(tool_calls: List[Dict[str, Any]], tool_map: Dict[str, Any], config=None,
+                               on_progress: Optional[ProgressCallback] = None) -> List[ToolMessage]:
+    """Execute the calls, sharding the ones spanning many clusters; one message per call, in order"""
+    if not PROM_FANOUT:
+        return await execute_tool_calls(tool_calls, tool_map, config)
+
+    plans = await asyncio.gather(*(plan_shards(tool_call, tool_map, config) for tool_call in tool_calls))
+    fanned = {tool_call["id"]: shards for tool_call, shards in zip(tool_calls, plans) if shards}
+    if not fanned:
+        return await execute_tool_calls(tool_calls, tool_map, config)
+
+    plain = [tool_call for tool_call in tool_calls if tool_call.get("id") not in fanned]
+    total = sum(len(shards) for shards in fanned.values())
+    # Shards have their own lane: the prom_range limit would run them two at a time, and a
+    # deadline counting the queue would time out the last ones while their clusters are fine
+    lane = lane_limiter("prom_fanout", PROM_FANOUT_CONCURRENCY)
+    done = 0
+    received: Dict[str, List[Tuple[str, ToolMessage]]] = {call_id: [] for call_id in fanned}
+    logger.info(f"[PERF] Fan-out: {len(fanned)} calls -> {total} cluster shards (+{len(plain)} unsharded calls)")
+
+    async def run_shard(call_id: str, label: str, shard_call: Dict[str, Any]) -> Tuple[str, str, ToolMessage]:
+        nonlocal done
+        started = time.time()
+        message = await execute_tool_call(shard_call, tool_map, config, lane=lane)
+        done += 1
+        received[call_id].append((label, message))
+        result = get_prom_result(message)
+        ok = result is not None and result.status == "success"
+        if not ok:
+            _fanout_stats["shard_failures"] += 1
+        logger.info(f"[PERF] Shard {label} of {call_id} {'done' if ok else 'failed'} in {time.time() - started:.3f}s ({done}/{total})")
+        if on_progress:
+            series = f"{result.series_count} series" if ok else "failed"
+            merged, failed = _merge(received[call_id])
+            partial = {
+                "tool_call_id": call_id,
+                "shards_done": len(received[call_id]),
+                "shards_total": len(fanned[call_id]),
+                "series": merged.digest() if merged else [],
+                "missing_clusters": failed,
+            }
+            await on_progress(f"Fetched {done}/{total} cluster slices, latest: {label} ({series})", partial)
+        return call_id, label, message
+
+    async def run_plain() -> List[ToolMessage]:
+        return await execute_tool_calls(plain, tool_map, config) if plain else []
+
+    shard_tasks = [run_shard(call_id, label, shard_call) for call_id, shards in fanned.items() for label, shard_call in shards]
+    plain_messages, *shard_results = await asyncio.gather(run_plain(), *shard_tasks)
+
+    by_call: Dict[str, List[Tuple[str, ToolMessage]]] = {}
+    for call_id, label, message in shard_results:
+        by_call.setdefault(call_id, []).append((label, message))
+
+    _fanout_stats["fanned_calls"] += len(fanned)
+    _fanout_stats["shards"] += total
+    messages = {msg.tool_call_id: msg for msg in plain_messages}
+    for tool_call in tool_calls:
+        if tool_call["id"] in fanned:
+            messages[tool_call["id"]] = merge_shards(tool_call, by_call[tool_call["id"]])
+    return [messages[tool_call.get("id")] for tool_call in tool_calls]
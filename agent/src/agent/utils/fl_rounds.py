@@ -0,0 +1,140 @@
+"""
+FL Rounds - Per-round aggregation of the custom federated learning metrics
+
+The training metrics (loss, accuracy, ...) carry cluster_name, round and pod_name labels
+and are scraped as plain time series, so every round shows up as many samples. Grouping
+by (cluster, round) and reducing to first/last/mean yields a table of rounds x clusters,
+whose size doesn't depend on the time range or scrape interval.
+"""
+
+from dataclasses import dataclass
+from typing import Any, Dict, List, Tuple
+
+import numpy as np
+
+from agent.utils.prom_result import PromResult, round_significant as _round
+
+ROUND_LABEL = "round"
+ROUND_AGGREGATES = ("first", "last", "mean")
+
+
+@dataclass
+class RoundTable:
+    rounds: List[Any]       # sorted round labels (numeric where possible)
+    columns: List[str]      # one column per cluster (prefixed with the metric if several)
+    first: np.ndarray       # shape (rounds, columns), NaN where a cluster has no sample in a round
+    last: np.ndarray
+    mean: np.ndarray
+    samples: np.ndarray     # sample count per cell
+
+    def values(self, aggregate: str = "first") -> np.ndarray:
+        if aggregate not in ROUND_AGGREGATES:
+            raise ValueError(f"Unknown round aggregate '{aggregate}', expected one of {ROUND_AGGREGATES}")
+        return getattr(self, aggregate)
+
+    def to_rows(self, aggregate: str = "first", x_key: str = ROUND_LABEL) -> List[Dict[str, Any]]:
+        """Wide rows for charts: one row per round, one column per cluster"""
+        rows = []
+        for round_value, row in zip(self.rounds, self.values(aggregate).tolist()):
+            point = {x_key: round_value}
+            point.update((column, value) for column, value in zip(self.columns, row) if value == value)
+            rows.append(point)
+        return rows
+
+    def to_records(self) -> List[Dict[str, Any]]:
+        """Long records with every aggregate, for the analyzer prompt"""
+        records = []
+        for i, round_value in enumerate(self.rounds):
+            for j, column in enumerate(self.columns):
+                if self.samples[i, j]:
+                    records.append({
+                        "round": round_value,
+                        "cluster": column,
+                        "first": _round(self.first[i, j]),
+                        "last": _round(self.last[i, j]),
+                        "mean": _round(self.mean[i, j]),
+                        "samples": int(self.samples[i, j]),
+                    })
+        return records
+
+
+def _round_sort_key(value: str) -> Tuple[int, Any]:
+    try:
+        return (0, float(value))
+    except ValueError:
+        return (1, value)
+
+
+def _round_value(value: str):
+    try:
+        number = float(value)
+    except ValueError:
+        return value
+    return int(number) if number.is_integer() else number
+
+
+def has_rounds(result: PromResult) -> bool:
+    """True if the result holds per-round FL metrics"""
+    return bool(result.series) and all(ROUND_LABEL in s.metric for s in result.series)
+
+
+def aggregate_rounds(result: PromResult) -> RoundTable:
+    """
+    Group the samples of a round-labelled result by (cluster, round) and reduce them.
+
+    Non-finite samples are ignored. 'first' and 'last' follow sample timestamps.
+    """
+    metric_names = {s.metric.get("__name__", "") for s in result.series}
+    prefix_metric = len(metric_names) > 1
+
+    def column_of(metric: Dict[str, str]) -> str:
+        cluster = metric.get("cluster_name") or metric.get("pod_name") or metric.get("pod") or "value"
+        return f"{metric.get('__name__', '')}:{cluster}" if prefix_metric else cluster
+
+    round_labels = sorted({s.metric[ROUND_LABEL] for s in result.series}, key=_round_sort_key)
+    columns = sorted({column_of(s.metric) for s in result.series})
+    round_index = {label: i for i, label in enumerate(round_labels)}
+    column_index = {column: j for j, column in enumerate(columns)}
+
+    # One flat sample table tagged with the cell (round, column) each sample belongs to
+    cells, timestamps, values = [], [], []
+    for s in result.series:
+        finite = np.isfinite(s.values)
+        if not finite.any():
+            continue
+        cell = round_index[s.metric[ROUND_LABEL]] * len(columns) + column_index[column_of(s.metric)]
+        cells.append(np.full(int(finite.sum()), cell))
+        timestamps.append(s.timestamps[finite])
+        values.append(s.values[finite])
+
+    size = len(round_labels) * len(columns)
+    first, last, mean = (np.full(size, np.nan) for _ in range(3))
+    samples = np.zeros(size, dtype=np.int64)
+
+    if cells:
+        cells = np.concatenate(cells)
+        timestamps = np.concatenate(timestamps)
+        values = np.concatenate(values)
+
+        samples = np.bincount(cells, minlength=size)
+        sums = np.bincount(cells, weights=values, minlength=size)
+        present = samples > 0
+        mean[present] = sums[present] / samples[present]
+
+        # Sorted by cell then time: a cell's first/last sample sits at its run boundaries
+        order = np.lexsort((timestamps, cells))
+        sorted_cells = cells[order]
+        starts = np.flatnonzero(np.r_[True, sorted_cells[1:] != sorted_cells[:-1]])
+        ends = np.r_[starts[1:], len(order)] - 1
+        first[sorted_cells[starts]] = values[order[starts]]
+        last[sorted_cells[ends]] = values[order[ends]]
+
+    shape = (len(round_labels), len(columns))
+    return RoundTable(
+        rounds=[_round_value(label) for label in round_labels],
+        columns=columns,
+        first=first.reshape(shape),
+        last=last.reshape(shape),
+        mean=mean.reshape(shape),
+        samples=samples.reshape(shape),
+    )
@@ -0,0 +1,308 @@
+"""
+FL Topology - Background-refreshed index of FederatedLearning instances and their pods
+
+A FederatedLearning instance runs one server pod on the hub ('local-cluster') and client
+pods on the managed clusters, named '<instance>-server-*' and '<instance>-client-*'. The
+index maps every instance (from kubectl) to those pods (from the cadvisor pod labels over
+a lookback window, so pods of earlier rounds are included).
+
+The first refresh scans the whole lookback window. Later refreshes only scan the time since
+the previous successful one, merge the pods they see into the index, and drop pods not seen
+for the lookback window.
+
+The inspector prompt lists the pods of the instances a question names, so no discovery
+round trip is needed, and the planner turns prefix regexes like
+pod_name=~"federated-learning-sample-client-.*" into exact alternatives of the known pods,
+which Prometheus answers from the postings index instead of matching every pod name.
+Pods created since the last refresh aren't indexed yet, so only windows ending before the
+refresh are pinned.
+"""
+
+import os
+import re
+import json
+import time
+import asyncio
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional, Tuple
+
+from agent.utils.logging_config import get_logger
+from agent.utils.prom_result import PROMETHEUS_TOOLS, parse_prom_response
+from agent.utils.promql import (
+    CLUSTER_LABEL, Matcher, PromQLError, Selector, escape_regex, parse_duration, parse_query, parse_time,
+)
+
+logger = get_logger("fl_topology")
+
+FL_TOPOLOGY = os.getenv("FL_TOPOLOGY", "true").lower() == "true"
+FL_TOPOLOGY_REFRESH = float(os.getenv("FL_TOPOLOGY_REFRESH", "120"))
+FL_TOPOLOGY_LOOKBACK = float(os.getenv("FL_TOPOLOGY_LOOKBACK", "86400"))   # Pods seen this far back are indexed
+FL_TOPOLOGY_MAX_AGE = float(os.getenv("FL_TOPOLOGY_MAX_AGE", str(3 * FL_TOPOLOGY_REFRESH)))
+
+HUB_CLUSTER = "local-cluster"
+POD_LABELS = ("pod", "pod_name")     # cadvisor uses 'pod', kepler and the FL metrics 'pod_name'
+INSTANCES_COMMAND = "kubectl get federatedlearnings -A -o json"
+PODS_QUERY = ('group by (cluster_name, namespace, pod) (last_over_time(container_memory_usage_bytes'
+              '{{job="cadvisor", image="", pod=~".+-(server|client)-.+"}}[{lookback}]))')
+
+_POD_NAME = re.compile(r"^(?P<instance>.+?)-(?P<role>server|client)-[a-z0-9]+(?:-[a-z0-9]+)?$")
+_PREFIX_REGEX = re.compile(r"^(?P<prefix>[a-z0-9][a-z0-9.-]*-(?:server|client)-)\.[*+]$")
+_RANGE = re.compile(r"\[([0-9a-z]+)(?::[0-9a-z]*)?\]")
+
+
+@dataclass
+class FLInstance:
+    name: str
+    namespace: str = ""
+    servers: List[str] = field(default_factory=list)               # server pods on the hub
+    clients: Dict[str, List[str]] = field(default_factory=dict)    # cluster -> client pods
+
+    def render(self) -> str:
+        servers = ", ".join(f"`{pod}`" for pod in self.servers) or "none seen"
+        clients = "; ".join(f"{cluster}: {', '.join(f'`{pod}`' for pod in pods)}" for cluster, pods in sorted(self.clients.items()))
+        namespace = f" (namespace {self.namespace})" if self.namespace else ""
+        return f"{self.name}{namespace}: server pods on {HUB_CLUSTER}: {servers}; client pods: {clients or 'none seen'}"
+
+
+@dataclass
+class Topology:
+    instances: Dict[str, FLInstance] = field(default_factory=dict)
+    refreshed_at: Optional[float] = None
+    pod_labels: Dict[Tuple[str, str, str], float] = field(default_factory=dict)   # (cluster, namespace, pod) -> last seen
+
+    def pods(self, prefix: str) -> List[Tuple[str, str]]:
+        """(cluster, pod) of the indexed pods whose name starts with the prefix"""
+        found = []
+        for instance in self.instances.values():
+            found.extend((HUB_CLUSTER, pod) for pod in instance.servers if pod.startswith(prefix))
+            found.extend((cluster, pod) for cluster, pods in instance.clients.items() for pod in pods if pod.startswith(prefix))
+        return found
+
+
+topology = Topology()
+_refresh_task: Optional[asyncio.Task] = None
+_topology_stats = {
+    "refreshes": 0,
+    "refresh_failures": 0,
+    "incremental_refreshes": 0,
+    "last_refresh_time": 0.0,
+    "prompt_sections": 0,
+    "pinned_selectors": 0,
+}
+
+
+def get_topology_stats() -> dict:
+    """Get FL topology index statistics for monitoring"""
+    return {
+        **_topology_stats,
+        "instances": len(topology.instances),
+        "pods": sum(len(i.servers) + sum(len(p) for p in i.clients.values()) for i in topology.instances.values()),
+        "refreshed_at": topology.refreshed_at,
+        "running": _refresh_task is not None and not _refresh_task.done(),
+    }
+
+
+def is_topology_fresh() -> bool:
+    return FL_TOPOLOGY and topology.refreshed_at is not None and time.time() - topology.refreshed_at < FL_TOPOLOGY_MAX_AGE
+
+
+# --- Index building ---
+def parse_instances(content: Optional[str]) -> Optional[Dict[str, str]]:
+    """Instance name -> namespace from 'kubectl get federatedlearnings -o json', None if unreadable"""
+    try:
+        data = json.loads(content) if content else None
+    except (TypeError, ValueError):
+        return None
+    if not isinstance(data, dict):
+        return None
+    items = data.get("items", [data] if data.get("kind") == "FederatedLearning" else [])
+    return {
+        item["metadata"]["name"]: item["metadata"].get("namespace", "")
+        for item in items if isinstance(item, dict) and item.get("metadata", {}).get("name")
+    }
+
+
+def build_topology(pod_labels: List[Dict[str, str]], instances: Optional[Dict[str, str]],
+                   known_pods: Optional[Dict[Tuple[str, str, str], float]] = None, at: Optional[float] = None) -> Topology:
+    """
+    Assign pods to instances by name prefix (longest instance name first).
+
+    The pods are merged into known_pods (from the previous index), dropping those not seen
+    within the lookback window. Without the instance list (kubectl unavailable) the instances
+    are inferred from the pod names. 'at' is when the pod labels were queried.
+    """
+    now = at or time.time()
+    seen = {key: last for key, last in (known_pods or {}).items() if now - last <= FL_TOPOLOGY_LOOKBACK}
+    for labels in pod_labels:
+        seen[(labels.get(CLUSTER_LABEL, ""), labels.get("namespace", ""), labels.get("pod", ""))] = now
+    pod_labels = [{CLUSTER_LABEL: cluster, "namespace": namespace, "pod": pod} for cluster, namespace, pod in seen]
+
+    known = dict(instances or {})
+    if instances is None:
+        for labels in pod_labels:
+            match = _POD_NAME.match(labels.get("pod", ""))
+            if match:
+                known.setdefault(match.group("instance"), "")
+
+    index = {name: FLInstance(name, namespace) for name, namespace in known.items()}
+    names = sorted(index, key=len, reverse=True)
+    for labels in sorted(pod_labels, key=lambda l: (l.get(CLUSTER_LABEL, ""), l.get("pod", ""))):
+        pod, cluster = labels.get("pod", ""), labels.get(CLUSTER_LABEL, "")
+        for name in names:
+            if pod.startswith(f"{name}-server-") and cluster == HUB_CLUSTER:
+                index[name].servers.append(pod)
+                break
+            if pod.startswith(f"{name}-client-") and cluster:
+                index[name].clients.setdefault(cluster, []).append(pod)
+                break
+    return Topology(index, now, seen)
+
+
+async def _call(tool_map: Dict[str, Any], name: str, args: Dict[str, Any]) -> Optional[str]:
+    from agent.utils.tool_executor import execute_tool_call
+
+    if name not in tool_map:
+        return None
+    message = await execute_tool_call({"name": name, "args": args, "id": f"topology-{name}"}, tool_map)
+    content = str(message.content)
+    return None if content.startswith(("Error", "Tool ")) else content
+
+
+async def refresh_topology() -> bool:
+    """Rebuild the index from the FederatedLearning resources and the pod labels"""
+    global topology
+    from agent.tools.mcp_tool import get_mcp_tools_with_persistent_sessions
+    from agent.utils.prom_federation import federate_tools
+
+    start = time.time()
+    tool_map = federate_tools({tool.name: tool for tool in await get_mcp_tools_with_persistent_sessions()})
+    if "prom_query" not in tool_map:
+        logger.info("No prom_query tool available, FL topology index disabled")
+        return False
+
+    # Incremental after the first load: only the time since the last refresh, plus one interval of margin
+    incremental = topology.refreshed_at is not None and start - topology.refreshed_at + FL_TOPOLOGY_REFRESH < FL_TOPOLOGY_LOOKBACK
+    lookback = start - topology.refreshed_at + FL_TOPOLOGY_REFRESH if incremental else FL_TOPOLOGY_LOOKBACK
+    instances_content, pods_content = await asyncio.gather(
+        _call(tool_map, "kubectl", {"command": INSTANCES_COMMAND}),
+        _call(tool_map, "prom_query", {"query": PODS_QUERY.format(lookback=f"{int(lookback)}s")}),
+    )
+    result = parse_prom_response(pods_content) if pods_content else None
+    if result is None or result.status != "success":
+        _topology_stats["refresh_failures"] += 1
+        logger.warning("FL topology refresh got no pod labels")
+        return False
+
+    topology = build_topology([s.metric for s in result.series], parse_instances(instances_content),
+                              topology.pod_labels if incremental else None, at=start)
+    _topology_stats["refreshes"] += 1
+    _topology_stats["incremental_refreshes"] += int(incremental)
+    _topology_stats["last_refresh_time"] = round(time.time() - start, 3)
+    logger.info(f"[PERF] FL topology refreshed: {len(topology.instances)} instances in {time.time() - start:.3f}s")
+    return True
+
+
+async def _refresh_loop() -> None:
+    while True:
+        try:
+            await refresh_topology()
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            _topology_stats["refresh_failures"] += 1
+            logger.warning(f"FL topology refresh failed: {e}")
+        await asyncio.sleep(FL_TOPOLOGY_REFRESH)
+
+
+def start_topology_refresh() -> Optional[asyncio.Task]:
+    """Start the background refresh loop (no-op if disabled or already running)"""
+    global _refresh_task
+    if not FL_TOPOLOGY:
+        return None
+    if _refresh_task is None or _refresh_task.done():
+        _refresh_task = asyncio.create_task(_refresh_loop())
+    return _refresh_task
+
+
+async def stop_topology_refresh() -> None:
+    global _refresh_task
+    if _refresh_task and not _refresh_task.done():
+        _refresh_task.cancel()
+        try:
+            await _refresh_task
+        except asyncio.CancelledError:
+            pass
+    _refresh_task = None
+
+
+# --- Consumers ---
+def topology_prompt(query: str) -> str:
+    """Inspector prompt section with the pods of the instances the query names, empty if none"""
+    if not is_topology_fresh() or not query:
+        return ""
+    text = query.lower()
+    named = [instance for name, instance in topology.instances.items() if name in text]
+    if not named:
+        return ""
+    _topology_stats["prompt_sections"] += 1
+    lines = "\n".join(f"   - {instance.render()}" for instance in named)
+    refreshed = time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime(topology.refreshed_at))
+    return (
+        "\n**Federated Learning topology (from the cluster, no discovery needed):**\n"
+        f"{lines}\n"
+        f"   Pods created after {refreshed} are not listed yet. Select these pods with exact matchers "
+        "(pod=\"...\" or pod=~\"a|b\" listing the names) for windows ending before then, otherwise with the prefix regex.\n"
+    )
+
+
+def _pinned(selector: Selector, start: float, end: float) -> Optional[Selector]:
+    """The selector with prefix pod regexes replaced by the indexed pod names, None if unchanged"""
+    # Pods older than the index lookback would be missed, and so would pods created since the refresh
+    if start < topology.refreshed_at - FL_TOPOLOGY_LOOKBACK or end > topology.refreshed_at:
+        return None
+    clusters = [m for m in selector.matchers if m.label == CLUSTER_LABEL]
+    matchers, changed = [], False
+    for matcher in selector.matchers:
+        match = _PREFIX_REGEX.match(matcher.value) if matcher.label in POD_LABELS and matcher.op == "=~" else None
+        pods = topology.pods(match.group("prefix")) if match else []
+        pods = sorted({pod for cluster, pod in pods if all(m.matches({CLUSTER_LABEL: cluster}) for m in clusters)})
+        if not pods:
+            matchers.append(matcher)
+            continue
+        value = "|".join(escape_regex(pod) for pod in pods)
+        matchers.append(Matcher(matcher.label, "=", pods[0]) if len(pods) == 1 else Matcher(matcher.label, "=~", value))
+        changed = True
+    if not changed:
+        return None
+    return Selector(selector.metric, tuple(sorted(matchers, key=lambda m: (m.label, m.op, m.value))))
+
+
+def pin_pod_selectors(tool_call: Dict[str, Any]) -> Dict[str, Any]:
+    """The tool call with its FL pod prefix regexes turned into exact pod matchers (same call if none)"""
+    args = tool_call.get("args", {})
+    if tool_call.get("name") not in PROMETHEUS_TOOLS or not isinstance(args.get("query"), str) or not is_topology_fresh():
+        return tool_call
+    try:
+        parsed = parse_query(args["query"])
+    except PromQLError:
+        return tool_call
+
+    # Oldest and newest sample the query can read
+    lookback = max((parse_duration(d) or 0.0 for d in _RANGE.findall(parsed.canonical)), default=0.0)
+    end = parse_time(args.get("end") if tool_call["name"] == "prom_range" else args.get("time"))
+    end = end if end is not None else time.time()
+    start = parse_time(args.get("start")) if tool_call["name"] == "prom_range" else end
+    start = (start if start is not None else end) - lookback
+
+    query = parsed.canonical
+    pinned = 0
+    for selector in parsed.selectors:
+        replacement = _pinned(selector, start, end)
+        if replacement is not None:
+            query = query.replace(selector.render(), replacement.render())
+            pinned += 1
+    if not pinned:
+        return tool_call
+    _topology_stats["pinned_selectors"] += pinned
+    logger.info(f"[PLAN] Pinned FL pod selectors of {tool_call.get('id')}: {query}")
+    return {**tool_call, "args": {**args, "query": query}}
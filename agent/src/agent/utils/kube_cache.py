@@ -0,0 +1,274 @@
+"""
+Kube Cache - Informer-style read-through cache for the kubectl tool
+
+Read-only kubectl calls (get, describe, api-resources, ...) are answered from a cache keyed
+by cluster/kind/namespace/name plus the remaining arguments, for a short TTL. Mutating
+calls (apply/create/delete/patch/... by command, or any call through the YAML path) drop
+every cached entry that could show the touched resources: same cluster and kind, same or
+all namespaces, same name or a list. A call that can't be parsed drops the whole cluster.
+Each invalidation bumps the cluster's generation, and a read that overlapped one is
+returned but not stored, so it can't put back the state from before the write.
+Resources changed indirectly (the pods an operator creates for a FederatedLearning) are
+refreshed by the TTL.
+"""
+
+import os
+import re
+import json
+import time
+import shlex
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Any, Dict, List, Optional, Tuple
+
+import yaml
+
+from agent.utils.logging_config import get_logger
+
+logger = get_logger("kube_cache")
+
+KUBECTL_CACHE = os.getenv("KUBECTL_CACHE", "true").lower() == "true"
+KUBECTL_CACHE_TTL = float(os.getenv("KUBECTL_CACHE_TTL", "30"))
+KUBECTL_STATIC_TTL = float(os.getenv("KUBECTL_STATIC_TTL", "600"))   # API discovery barely changes
+KUBECTL_CACHE_SIZE = int(os.getenv("KUBECTL_CACHE_SIZE", "512"))
+
+DEFAULT_CLUSTER = "local-cluster"
+READ_VERBS = {"get", "describe"}
+STATIC_VERBS = {"api-resources", "api-versions", "explain", "version"}
+UNCACHED_VERBS = {
+    "logs", "top", "events", "auth", "cluster-info", "config", "exec", "port-forward", "wait",
+    "rollout status", "rollout history",
+}
+MUTATING_VERBS = {
+    "apply", "create", "delete", "patch", "replace", "edit", "label", "annotate", "scale", "autoscale",
+    "rollout restart", "rollout undo", "rollout pause", "rollout resume", "set", "expose", "run",
+    "cordon", "uncordon", "drain", "taint",
+}
+SUBCOMMAND_VERBS = {"rollout"}   # The verb is '<verb> <subcommand>', e.g. 'rollout status'
+KIND_ALIASES = {
+    "po": "pods", "svc": "services", "deploy": "deployments", "ns": "namespaces", "cm": "configmaps",
+    "no": "nodes", "rs": "replicasets", "ds": "daemonsets", "sts": "statefulsets", "pvc": "persistentvolumeclaims",
+    "pv": "persistentvolumes", "sa": "serviceaccounts", "ep": "endpoints", "ing": "ingresses", "crd": "customresourcedefinitions",
+    "fl": "federatedlearnings",
+}
+# Flags taking a value as the next token
+_VALUE_FLAGS = {"-n", "--namespace", "-o", "--output", "-l", "--selector", "--cluster", "--context", "-f", "--filename",
+                "--field-selector", "--sort-by", "-c", "--container"}
+_ERROR = re.compile(r"^(Error|error:|Tool )")
+
+
+@dataclass(frozen=True)
+class Target:
+    """Resources a kubectl call reads or writes; None namespace = all, None name = list"""
+    cluster: str
+    kind: Optional[str]
+    namespace: Optional[str]
+    name: Optional[str]
+
+
+@dataclass
+class CacheEntry:
+    target: Target
+    content: str
+    expires: float
+
+
+_entries: "OrderedDict[str, CacheEntry]" = OrderedDict()
+_generations: Dict[str, int] = {}  # Per cluster, bumped by every invalidation
+_kube_cache_stats = {
+    "hits": 0,
+    "misses": 0,
+    "expired": 0,
+    "stored": 0,
+    "invalidations": 0,
+    "invalidated_entries": 0,
+    "stale_reads_dropped": 0,
+}
+
+
+def get_kube_cache_stats() -> dict:
+    """Get kubectl cache statistics for monitoring"""
+    lookups = _kube_cache_stats["hits"] + _kube_cache_stats["misses"]
+    return {
+        **_kube_cache_stats,
+        "entries": len(_entries),
+        "hit_rate": round(_kube_cache_stats["hits"] / lookups, 3) if lookups else 0.0,
+    }
+
+
+def normalize_kind(kind: str) -> str:
+    """'FederatedLearning', 'federatedlearnings.federation-ai...', 'fl' spellings of one kind"""
+    kind = kind.lower().split(".")[0]
+    kind = KIND_ALIASES.get(kind, kind)
+    return kind if kind.endswith("s") else kind + "s"
+
+
+def parse_command(command: str, cluster: Optional[str] = None) -> Optional[Tuple[str, Target, List[str]]]:
+    """(verb, target, remaining normalized arguments) of a kubectl command, None if unparseable"""
+    try:
+        tokens = shlex.split(command)
+    except ValueError:
+        return None
+    if tokens and tokens[0] == "kubectl":
+        tokens = tokens[1:]
+
+    namespace: Optional[str] = "default"
+    positional, rest = [], []
+    i = 0
+    while i < len(tokens):
+        token = tokens[i]
+        flag, has_value, value = token.partition("=")
+        if token in ("-A", "--all-namespaces"):
+            namespace = None
+        elif flag in _VALUE_FLAGS and (has_value or i + 1 < len(tokens)):
+            if not has_value:
+                value = tokens[i + 1]
+                i += 1
+            if flag in ("-n", "--namespace"):
+                namespace = value
+            elif flag in ("--cluster", "--context"):
+                cluster = value
+            else:
+                rest.append(f"{flag}={value}")
+        elif token.startswith("-"):
+            rest.append(token)
+        else:
+            positional.append(token)
+        i += 1
+
+    if not positional:
+        return None
+    verb, resources = positional[0], positional[1:]
+    if verb in SUBCOMMAND_VERBS and resources:
+        verb, resources = f"{verb} {resources[0]}", resources[1:]
+    kind, name = None, None
+    if resources:
+        kind, _, name = resources[0].partition("/")
+        name = name or (resources[1] if len(resources) == 2 else None)
+        if len(resources) > 2 or "," in kind:
+            name = None                   # Several names or kinds: treat as a list
+        kind = ",".join(sorted(normalize_kind(k) for k in kind.split(",")))
+    return verb, Target(cluster or DEFAULT_CLUSTER, kind, namespace, name or None), sorted(rest)
+
+
+def yaml_targets(document: str, cluster: Optional[str] = None) -> Optional[List[Target]]:
+    """Resources in a manifest sent through the YAML path, None if it can't be read"""
+    try:
+        objects = [obj for obj in yaml.safe_load_all(document) if obj]
+    except yaml.YAMLError:
+        return None
+    targets = []
+    for obj in objects:
+        if not isinstance(obj, dict) or "kind" not in obj:
+            return None
+        metadata = obj.get("metadata") or {}
+        targets.append(Target(cluster or DEFAULT_CLUSTER, normalize_kind(obj["kind"]),
+                              metadata.get("namespace", "default"), metadata.get("name")))
+    return targets
+
+
+def _covers(cached: Target, touched: Target) -> bool:
+    """A cached read could show the touched resource"""
+    if cached.cluster != touched.cluster:
+        return False
+    if touched.kind is None or cached.kind is None:
+        return True
+    if not set(cached.kind.split(",")) & set(touched.kind.split(",")):
+        return False
+    namespace_ok = cached.namespace is None or touched.namespace is None or cached.namespace == touched.namespace
+    name_ok = cached.name is None or touched.name is None or cached.name == touched.name
+    return namespace_ok and name_ok
+
+
+def invalidate(targets: List[Target]) -> int:
+    """Drop cached reads of the touched resources"""
+    for cluster in {target.cluster for target in targets}:
+        _generations[cluster] = _generations.get(cluster, 0) + 1
+    stale = [key for key, entry in _entries.items() if any(_covers(entry.target, target) for target in targets)]
+    for key in stale:
+        del _entries[key]
+    _kube_cache_stats["invalidations"] += 1
+    _kube_cache_stats["invalidated_entries"] += len(stale)
+    if stale:
+        logger.info(f"Invalidated {len(stale)} cached kubectl reads for {[(t.cluster, t.kind, t.namespace, t.name) for t in targets]}")
+    return len(stale)
+
+
+def classify(args: Dict[str, Any]) -> Tuple[Optional[str], Optional[Target], List[Target]]:
+    """
+    Classify a kubectl call.
+
+    Returns:
+        (cache key if cacheable, target of the cached read, targets to invalidate)
+    """
+    cluster = args.get("cluster")
+    if args.get("yaml"):
+        targets = yaml_targets(args["yaml"], cluster)
+        return None, None, targets if targets is not None else [Target(cluster or DEFAULT_CLUSTER, None, None, None)]
+
+    parsed = parse_command(args.get("command", ""), cluster)
+    if parsed is None:
+        return None, None, [Target(cluster or DEFAULT_CLUSTER, None, None, None)]
+    verb, target, rest = parsed
+    if verb in UNCACHED_VERBS or any(flag in rest for flag in ("-w", "--watch")):
+        return None, None, []
+    if verb in READ_VERBS or verb in STATIC_VERBS:
+        key = json.dumps([verb, target.cluster, target.kind, target.namespace, target.name, rest])
+        return key, target, []
+    by_file = any(flag.startswith(("-f=", "--filename=")) for flag in rest)
+    if verb in MUTATING_VERBS and target.kind is not None and not by_file:
+        return None, None, [target]
+    # Mutation by file, or a verb we don't know: anything in the cluster may have changed
+    return None, None, [Target(target.cluster, None, None, None)]
+
+
+class CachedKubectlTool:
+    """Drop-in for kubectl in a tool map, answering repeated reads from the cache"""
+
+    def __init__(self, tool):
+        self.name = tool.name
+        self.tool = tool
+
+    async def ainvoke(self, args: Dict[str, Any], config=None):
+        key, target, touched = classify(args)
+        if key is None:
+            try:
+                return await self.tool.ainvoke(args, config)
+            finally:
+                # After the write landed (or failed halfway), a read racing it can't repopulate the old state
+                if touched:
+                    invalidate(touched)
+
+        entry = _entries.get(key)
+        now = time.time()
+        if entry and entry.expires > now:
+            _entries.move_to_end(key)
+            _kube_cache_stats["hits"] += 1
+            logger.info(f"[PERF] kubectl cache hit: {args.get('command')}")
+            return entry.content
+        if entry:
+            del _entries[key]
+            _kube_cache_stats["expired"] += 1
+
+        _kube_cache_stats["misses"] += 1
+        generation = _generations.get(target.cluster, 0)
+        content = str(await self.tool.ainvoke(args, config))
+        if _generations.get(target.cluster, 0) != generation:
+            # A write to the cluster was invalidated while this read ran, its content may predate it
+            _kube_cache_stats["stale_reads_dropped"] += 1
+        elif not _ERROR.match(content):
+            verb = json.loads(key)[0]
+            ttl = KUBECTL_STATIC_TTL if verb in STATIC_VERBS else KUBECTL_CACHE_TTL
+            _entries[key] = CacheEntry(target, content, time.time() + ttl)
+            _kube_cache_stats["stored"] += 1
+            while len(_entries) > KUBECTL_CACHE_SIZE:
+                _entries.popitem(last=False)
+        return content
+
+
+def cache_kubectl(tool_map: Dict[str, Any]) -> Dict[str, Any]:
+    """Tool map with kubectl behind the read-through cache"""
+    tool = tool_map.get("kubectl")
+    if not KUBECTL_CACHE or tool is None or isinstance(tool, CachedKubectlTool):
+        return tool_map
+    return {**tool_map, "kubectl": CachedKubectlTool(tool)}
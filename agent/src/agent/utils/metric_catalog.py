@@ -0,0 +1,337 @@
+"""
+Metric Catalog - Local, background-refreshed index of the available Prometheus metrics
+
+prom_discover and prom_metadata are called by a background task instead of the inspector:
+metric names, types, help text and (for metrics that get used) label keys are kept in an
+inverted index over name and help tokens. search() ranks metrics for a user query with
+exact, prefix and fuzzy token matches weighted by rarity, and prompt_section() renders the
+best ones for the inspector prompt, so no discovery round trip or metric dump lands in the
+conversation.
+"""
+
+import os
+import re
+import json
+import math
+import time
+import asyncio
+import difflib
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional, Set, Tuple
+
+from agent.utils.logging_config import get_logger
+from agent.utils.prom_result import parse_prom_response
+
+logger = get_logger("metric_catalog")
+
+METRIC_CATALOG = os.getenv("METRIC_CATALOG", "true").lower() == "true"
+METRIC_CATALOG_REFRESH = float(os.getenv("METRIC_CATALOG_REFRESH", "600"))
+METRIC_CATALOG_TOP = int(os.getenv("METRIC_CATALOG_TOP", "8"))
+LABEL_FETCH_LIMIT = 16  # Label key lookups per refresh cycle
+
+DISCOVER_TOOL = "prom_discover"
+METADATA_TOOL = "prom_metadata"
+
+# User words and the metric name tokens they usually mean
+SYNONYMS = {
+    "memory": ("memory", "mem", "bytes", "rss"),
+    "cpu": ("cpu", "cores", "seconds"),
+    "energy": ("joules", "kepler", "energy"),
+    "power": ("joules", "kepler", "watts"),
+    "network": ("network", "receive", "transmit"),
+    "disk": ("fs", "disk", "io"),
+    "restarts": ("restarts", "restart"),
+}
+
+_TOKEN_SPLIT = re.compile(r"[^a-z0-9]+")
+_STOPWORDS = {"the", "a", "an", "of", "in", "on", "for", "and", "or", "to", "is", "by", "total", "me", "show", "what", "how", "with", "last", "past"}
+
+
+def _tokens(text: str) -> List[str]:
+    return [t for t in _TOKEN_SPLIT.split(text.lower()) if t and t not in _STOPWORDS]
+
+
+@dataclass
+class MetricInfo:
+    name: str
+    type: str = ""
+    help: str = ""
+    unit: str = ""
+    labels: List[str] = field(default_factory=list)
+
+    def render(self) -> str:
+        parts = [self.name]
+        if self.type:
+            parts.append(f"({self.type})")
+        if self.help:
+            parts.append(f"- {self.help[:160]}")
+        if self.labels:
+            parts.append(f"[labels: {', '.join(self.labels)}]")
+        return " ".join(parts)
+
+
+class MetricCatalog:
+    """Inverted index over metric name and help tokens"""
+
+    def __init__(self):
+        self.metrics: Dict[str, MetricInfo] = {}
+        self._name_index: Dict[str, Set[str]] = {}
+        self._help_index: Dict[str, Set[str]] = {}
+        self._vocabulary: List[str] = []
+        self.refreshed_at: Optional[float] = None
+
+    def __len__(self) -> int:
+        return len(self.metrics)
+
+    def rebuild(self, metrics: Dict[str, MetricInfo]) -> None:
+        """Replace the catalog content and rebuild the indexes (keeps known label keys)"""
+        for name, info in metrics.items():
+            if not info.labels and name in self.metrics:
+                info.labels = self.metrics[name].labels
+
+        name_index: Dict[str, Set[str]] = {}
+        help_index: Dict[str, Set[str]] = {}
+        for name, info in metrics.items():
+            for token in _tokens(name):
+                name_index.setdefault(token, set()).add(name)
+            for token in _tokens(info.help):
+                help_index.setdefault(token, set()).add(name)
+
+        self.metrics = metrics
+        self._name_index, self._help_index = name_index, help_index
+        self._vocabulary = sorted(set(name_index) | set(help_index))
+        self.refreshed_at = time.time()
+
+    def _expand(self, token: str) -> List[Tuple[str, float]]:
+        """Index tokens a query token stands for, with match weights"""
+        expanded = {token: 1.0}
+        for synonym in SYNONYMS.get(token, ()):
+            expanded.setdefault(synonym, 0.8)
+        if len(token) >= 3:
+            for candidate in self._vocabulary:
+                if candidate != token and candidate.startswith(token):
+                    expanded.setdefault(candidate, 0.7)
+            for candidate in difflib.get_close_matches(token, self._vocabulary, n=3, cutoff=0.8):
+                expanded.setdefault(candidate, 0.6)
+        return list(expanded.items())
+
+    def search(self, query: str, limit: int = METRIC_CATALOG_TOP) -> List[Tuple[MetricInfo, float]]:
+        """Rank metrics for a free-text query, best first"""
+        if not self.metrics:
+            return []
+
+        total = len(self.metrics)
+        scores: Dict[str, float] = {}
+        for token in set(_tokens(query)):
+            for index_token, weight in self._expand(token):
+                # Rare tokens say more about a metric than ones every metric has
+                for index, index_weight in ((self._name_index, 2.0), (self._help_index, 1.0)):
+                    names = index.get(index_token)
+                    if not names:
+                        continue
+                    idf = math.log(1 + total / len(names))
+                    for name in names:
+                        scores[name] = scores.get(name, 0.0) + weight * index_weight * idf
+
+        ranked = sorted(scores.items(), key=lambda item: (-item[1], item[0]))[:limit]
+        return [(self.metrics[name], score) for name, score in ranked]
+
+    def prompt_section(self, query: str, limit: int = METRIC_CATALOG_TOP) -> str:
+        """Prompt lines describing the metrics most relevant to the query, empty if none"""
+        matches = self.search(query, limit)
+        if not matches:
+            return ""
+        lines = "\n".join(f"   - {info.render()}" for info, _ in matches)
+        return (
+            f"\n**Relevant metrics from the metric catalog ({len(self.metrics)} metrics indexed, best matches first):**\n"
+            f"{lines}\n"
+            "   Prefer these names and labels; only call prom_discover/prom_metadata if none of them fits the question.\n"
+        )
+
+
+# --- Response parsing ---
+def _load(content: str) -> Any:
+    try:
+        return json.loads(content)
+    except (TypeError, ValueError):
+        return content
+
+
+def parse_metric_names(content: str) -> List[str]:
+    """Metric names from a prom_discover response (JSON list, API envelope or one name per line)"""
+    data = _load(content)
+    if isinstance(data, dict):
+        data = data.get("data", data.get("metrics", data.get("result", [])))
+    if isinstance(data, dict):
+        data = list(data)
+    if isinstance(data, str):
+        data = [line.strip() for line in data.splitlines()]
+    names = []
+    for item in data or []:
+        name = item.get("name") or item.get("metric") if isinstance(item, dict) else item
+        if isinstance(name, str) and re.fullmatch(r"[a-zA-Z_:][a-zA-Z0-9_:]*", name):
+            names.append(name)
+    return names
+
+
+def parse_metadata(content: str) -> Dict[str, Dict[str, str]]:
+    """Metadata per metric from a prom_metadata response (Prometheus API shape or a list of entries)"""
+    data = _load(content)
+    if isinstance(data, dict) and "data" in data:
+        data = data["data"]
+
+    metadata = {}
+    if isinstance(data, dict):
+        for name, entries in data.items():
+            entry = entries[0] if isinstance(entries, list) and entries else entries
+            if isinstance(entry, dict):
+                metadata[name] = entry
+    elif isinstance(data, list):
+        for entry in data:
+            if isinstance(entry, dict) and (entry.get("metric") or entry.get("name")):
+                metadata[entry.get("metric") or entry.get("name")] = entry
+    return metadata
+
+
+# --- Background refresh ---
+catalog = MetricCatalog()
+_label_queue: List[str] = []
+_refresh_task: Optional[asyncio.Task] = None
+_catalog_stats = {
+    "refreshes": 0,
+    "refresh_failures": 0,
+    "last_refresh_time": 0.0,
+    "searches": 0,
+    "label_lookups": 0,
+}
+
+
+def get_catalog_stats() -> dict:
+    """Get metric catalog statistics for monitoring"""
+    return {
+        **_catalog_stats,
+        "metrics": len(catalog),
+        "refreshed_at": catalog.refreshed_at,
+        "running": _refresh_task is not None and not _refresh_task.done(),
+    }
+
+
+def is_catalog_ready() -> bool:
+    return METRIC_CATALOG and len(catalog) > 0
+
+
+def relevant_metrics_prompt(query: str) -> str:
+    """Inspector prompt section for the query, queueing label lookups for the metrics it names"""
+    if not is_catalog_ready() or not query:
+        return ""
+    _catalog_stats["searches"] += 1
+    section = catalog.prompt_section(query)
+    for info, _ in catalog.search(query):
+        if not info.labels and info.name not in _label_queue:
+            _label_queue.append(info.name)
+    return section
+
+
+async def _call(tool, args: Dict[str, Any]) -> Optional[str]:
+    from agent.utils.tool_executor import execute_tool_call
+
+    message = await execute_tool_call({"name": tool.name, "args": args, "id": f"catalog-{tool.name}"}, {tool.name: tool})
+    content = str(message.content)
+    return None if content.startswith("Error") else content
+
+
+async def refresh_catalog() -> bool:
+    """Fetch metric names and metadata and rebuild the index"""
+    from agent.tools.mcp_tool import get_mcp_tools_with_persistent_sessions, get_tool_server
+
+    start = time.time()
+    server = get_tool_server(DISCOVER_TOOL)
+    tools = await get_mcp_tools_with_persistent_sessions(servers=[server] if server else None)
+    tool_map = {tool.name: tool for tool in tools}
+    if DISCOVER_TOOL not in tool_map:
+        logger.info(f"No {DISCOVER_TOOL} tool available, metric catalog disabled")
+        return False
+
+    discover, metadata = await asyncio.gather(
+        _call(tool_map[DISCOVER_TOOL], {}),
+        _call(tool_map[METADATA_TOOL], {}) if METADATA_TOOL in tool_map else asyncio.sleep(0, result=None),
+    )
+    names = parse_metric_names(discover) if discover else []
+    if not names:
+        _catalog_stats["refresh_failures"] += 1
+        logger.warning("Metric catalog refresh returned no metric names")
+        return False
+
+    meta = parse_metadata(metadata) if metadata else {}
+    catalog.rebuild({
+        name: MetricInfo(name, meta.get(name, {}).get("type", ""), meta.get(name, {}).get("help", ""), meta.get(name, {}).get("unit", ""))
+        for name in names
+    })
+
+    if "prom_query" in tool_map:
+        await _fetch_labels(tool_map["prom_query"])
+
+    _catalog_stats["refreshes"] += 1
+    _catalog_stats["last_refresh_time"] = round(time.time() - start, 3)
+    logger.info(f"[PERF] Metric catalog refreshed: {len(names)} metrics, {len(meta)} with metadata in {time.time() - start:.3f}s")
+    return True
+
+
+async def _fetch_labels(prom_query) -> None:
+    """Label keys of queued metrics, read from one sample series each"""
+    batch, _label_queue[:] = _label_queue[:LABEL_FETCH_LIMIT], _label_queue[LABEL_FETCH_LIMIT:]
+    if not batch:
+        return
+
+    async def fetch(name: str) -> None:
+        content = await _call(prom_query, {"query": f"topk(1, {name})"})
+        result = parse_prom_response(content) if content else None
+        if result and result.series and name in catalog.metrics:
+            catalog.metrics[name].labels = sorted(k for k in result.series[0].metric if k != "__name__")
+            _catalog_stats["label_lookups"] += 1
+
+    await asyncio.gather(*(fetch(name) for name in batch))
+
+
+async def _refresh_loop() -> None:
+    while True:
+        try:
+            await refresh_catalog()
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            _catalog_stats["refresh_failures"] += 1
+            logger.warning(f"Metric catalog refresh failed: {e}")
+        # Label lookups queued by searches are served sooner than the next full refresh
+        deadline = time.time() + METRIC_CATALOG_REFRESH
+        while time.time() < deadline:
+            await asyncio.sleep(min(30.0, METRIC_CATALOG_REFRESH))
+            if _label_queue and is_catalog_ready():
+                try:
+                    from agent.tools.mcp_tool import get_mcp_tools_with_persistent_sessions
+                    tools = {tool.name: tool for tool in await get_mcp_tools_with_persistent_sessions()}
+                    if "prom_query" in tools:
+                        await _fetch_labels(tools["prom_query"])
+                except Exception as e:
+                    logger.debug(f"Label lookup failed: {e}")
+
+
+def start_catalog_refresh() -> Optional[asyncio.Task]:
+    """Start the background refresh loop (no-op if disabled or already running)"""
+    global _refresh_task
+    if not METRIC_CATALOG:
+        return None
+    if _refresh_task is None or _refresh_task.done():
+        _refresh_task = asyncio.create_task(_refresh_loop())
+    return _refresh_task
+
+
+async def stop_catalog_refresh() -> None:
+    global _refresh_task
+    if _refresh_task and not _refresh_task.done():
+        _refresh_task.cancel()
+        try:
+            await _refresh_task
+        except asyncio.CancelledError:
+            pass
+    _refresh_task = None
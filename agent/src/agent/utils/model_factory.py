@@ -3,7 +3,6 @@ Model Factory - Creates LLM instances with consistent configuration
 """
 
 import os
-from langchain_openai import ChatOpenAI
 
 
 def create_llm(model_name: str = None, temperature: float = 0.1, streaming: bool = True):
@@ -18,6 +17,9 @@ def create_llm(model_name: str = None, temperature: float = 0.1, streaming: bool
     Returns:
         LLM instance
     """
+    # Imported here, the OpenAI client stack is heavy and only needed once a node runs
+    from langchain_openai import ChatOpenAI
+    
     if model_name is None:
         model_name = os.getenv("OPENAI_MODEL", "gpt-4o")
     
@@ -0,0 +1,270 @@
+"""
+Prefetch - Speculative fetches of the likely follow-up queries into the series store
+
+After a question the next one is predictable: the trend of what was just looked at
+(prom_query -> prom_range of the same expression) or the CPU / memory / energy counterpart
+of the same pods. Once a node's calls are done, the top predictions are fetched in the
+background as range queries and stored in the series store, where the follow-up is
+answered locally (or with a short delta fetch of the newest points).
+
+Every prediction kind keeps its hit rate: a prefetch counts as a hit when a later range
+call reads the same canonical query within PREFETCH_HIT_WINDOW. Kinds are ranked by their
+smoothed hit rate, and kinds that stop paying off are only tried every PREFETCH_EXPLORE-th
+time. Budget: at most PREFETCH_MAX_CALLS per node, PREFETCH_MAX_INFLIGHT running and
+PREFETCH_MAX_POINTS estimated points per prefetch. Prefetches run in their own executor
+lane, never in the slots of the users' calls, and are skipped while prom_range calls are
+running or queued. Off unless PREFETCH=true.
+"""
+
+import os
+import time
+import asyncio
+from dataclasses import dataclass
+from typing import Any, Dict, List, Optional, Set, Tuple
+
+from langchain_core.messages import ToolMessage
+
+from agent.utils.logging_config import get_logger
+from agent.utils.prom_result import get_prom_result
+from agent.utils.promql import Matcher, PromQLError, Selector, canonical_query, format_duration, parse_query, range_args
+from agent.utils.series_store import SERIES_STORE, lookup, store_result
+
+logger = get_logger("prefetch")
+
+PREFETCH = os.getenv("PREFETCH", "false").lower() == "true"
+PREFETCH_MAX_CALLS = int(os.getenv("PREFETCH_MAX_CALLS", "2"))          # Per node
+PREFETCH_MAX_INFLIGHT = int(os.getenv("PREFETCH_MAX_INFLIGHT", "2"))
+PREFETCH_MAX_POINTS = int(os.getenv("PREFETCH_MAX_POINTS", "50000"))    # Estimated, per prefetch
+PREFETCH_RANGE = float(os.getenv("PREFETCH_RANGE", "10800"))           # Trend window after an instant query
+PREFETCH_STEP = float(os.getenv("PREFETCH_STEP", "60"))                 # Multiples of it are served too
+PREFETCH_HIT_WINDOW = float(os.getenv("PREFETCH_HIT_WINDOW", "900"))
+PREFETCH_MIN_SCORE = float(os.getenv("PREFETCH_MIN_SCORE", "0.2"))
+PREFETCH_EXPLORE = int(os.getenv("PREFETCH_EXPLORE", "10"))
+
+RATE_WINDOW = "5m"
+CADVISOR_LABELS = {"pod", "namespace", "cluster_name", "job", "image", "container"}
+
+
+@dataclass
+class Prediction:
+    kind: str
+    query: str
+    start: float
+    end: float
+    step: float
+    series: int      # expected series, for the points budget
+
+    @property
+    def points(self) -> int:
+        return self.series * (int((self.end - self.start) // self.step) + 1)
+
+
+def _rate(metric: str, matchers: Tuple[Matcher, ...]) -> str:
+    return f"rate({Selector(metric, matchers).render()}[{RATE_WINDOW}])"
+
+
+def _kepler(matchers: Tuple[Matcher, ...]) -> str:
+    """Energy of the same pods: kepler labels them pod_name/container_namespace"""
+    renamed = {"pod": "pod_name", "namespace": "container_namespace"}
+    kept = [Matcher(renamed.get(m.label, m.label), m.op, m.value) for m in matchers if m.label in ("pod", "namespace", "cluster_name")]
+    kept += [Matcher("mode", "=", "dynamic")]
+    return _rate("kepler_container_joules_total", tuple(sorted(kept, key=lambda m: (m.label, m.op, m.value))))
+
+
+def _cadvisor(matchers: Tuple[Matcher, ...]) -> Tuple[Matcher, ...]:
+    return tuple(m for m in matchers if m.label in CADVISOR_LABELS)
+
+
+# Metric -> (kind, counterpart query of the same matchers)
+COUNTERPARTS = {
+    "container_memory_usage_bytes": (
+        ("counterpart:cpu", lambda ms: _rate("container_cpu_usage_seconds_total", _cadvisor(ms))),
+        ("counterpart:energy", _kepler),
+    ),
+    "container_memory_working_set_bytes": (
+        ("counterpart:cpu", lambda ms: _rate("container_cpu_usage_seconds_total", _cadvisor(ms))),
+    ),
+    "container_cpu_usage_seconds_total": (
+        ("counterpart:memory", lambda ms: Selector("container_memory_usage_bytes", _cadvisor(ms)).render()),
+        ("counterpart:energy", _kepler),
+    ),
+}
+
+
+_kind_stats: Dict[str, Dict[str, int]] = {}
+_pending: Dict[str, Tuple[str, float, float, float]] = {}   # canonical query -> (kind, start, step, stored at)
+_inflight: Set[str] = set()
+_tasks: Set[asyncio.Task] = set()  # Keep references, the loop only holds weak ones to running tasks
+_prefetch_stats = {
+    "issued": 0,
+    "completed": 0,
+    "failed": 0,
+    "skipped_budget": 0,
+    "skipped_busy": 0,
+    "skipped_cached": 0,
+    "hits": 0,
+    "misses": 0,
+}
+
+
+def _score(kind: str) -> float:
+    """Smoothed hit rate of a prediction kind (0.5 before any evidence)"""
+    stats = _kind_stats.get(kind, {})
+    return (stats.get("hits", 0) + 1) / (stats.get("resolved", 0) + 2)
+
+
+def get_prefetch_stats() -> dict:
+    """Get prefetch statistics (overall and per prediction kind) for monitoring"""
+    resolved = _prefetch_stats["hits"] + _prefetch_stats["misses"]
+    return {
+        **_prefetch_stats,
+        "enabled": PREFETCH,
+        "pending": len(_pending),
+        "inflight": len(_inflight),
+        "hit_rate": round(_prefetch_stats["hits"] / resolved, 3) if resolved else 0.0,
+        "kinds": {kind: {**stats, "score": round(_score(kind), 3)} for kind, stats in _kind_stats.items()},
+    }
+
+
+def _resolve(kind: str, hit: bool) -> None:
+    stats = _kind_stats.setdefault(kind, {"issued": 0, "resolved": 0, "hits": 0, "opportunities": 0})
+    stats["resolved"] += 1
+    stats["hits"] += int(hit)
+    _prefetch_stats["hits" if hit else "misses"] += 1
+
+
+def observe_calls(tool_calls: List[Dict[str, Any]]) -> None:
+    """Count prefetches read by these calls as hits and expired ones as misses"""
+    if not PREFETCH:
+        return
+    now = time.time()
+    for tool_call in tool_calls:
+        if tool_call.get("name") != "prom_range":
+            continue
+        args = tool_call.get("args", {})
+        query = canonical_query(args.get("query", ""))
+        start, _, step = range_args(args)
+        pending = _pending.get(query)
+        if not pending or start is None or not step:
+            continue
+        kind, stored_start, stored_step, _ = pending
+        # The store serves windows inside the stored one, on multiples of the stored step
+        if start >= stored_start and step >= stored_step and abs(step / stored_step - round(step / stored_step)) < 1e-9:
+            del _pending[query]
+            _resolve(kind, True)
+            logger.info(f"[PERF] Prefetch hit ({kind}) for {tool_call.get('id')}")
+    for query, (kind, _, _, stored) in list(_pending.items()):
+        if now - stored > PREFETCH_HIT_WINDOW:
+            del _pending[query]
+            _resolve(kind, False)
+
+
+def predict(tool_call: Dict[str, Any], message: ToolMessage, now: Optional[float] = None) -> List[Prediction]:
+    """Likely follow-ups of an executed prom_query/prom_range call"""
+    result = get_prom_result(message)
+    if result is None or result.status != "success" or not result.series:
+        return []
+    try:
+        parsed = parse_query(tool_call["args"]["query"])
+    except (PromQLError, KeyError, TypeError):
+        return []
+
+    now = now or time.time()
+    if tool_call["name"] == "prom_range":
+        start, end, step = range_args(tool_call["args"])
+        if None in (start, end, step):
+            return []
+    else:
+        start, end, step = now - PREFETCH_RANGE, now, PREFETCH_STEP
+    # Grid anchored on whole steps, so later questions land on stored points
+    start, end = start - start % step, end - end % step
+
+    predictions = []
+    if tool_call["name"] == "prom_query" and parsed.template is not None:
+        predictions.append(Prediction("trend", parsed.canonical, start, end, step, result.series_count))
+    if parsed.template is not None and parsed.selector.metric in COUNTERPARTS:
+        for kind, counterpart in COUNTERPARTS[parsed.selector.metric]:
+            predictions.append(Prediction(kind, counterpart(parsed.selector.matchers), start, end, step, result.series_count))
+    return predictions
+
+
+def _select(predictions: List[Prediction]) -> List[Prediction]:
+    """Best-scoring predictions within the budget; kinds below PREFETCH_MIN_SCORE are explored now and then"""
+    chosen = []
+    for prediction in sorted(predictions, key=lambda p: -_score(p.kind)):
+        stats = _kind_stats.setdefault(prediction.kind, {"issued": 0, "resolved": 0, "hits": 0, "opportunities": 0})
+        stats["opportunities"] += 1
+        if _score(prediction.kind) < PREFETCH_MIN_SCORE and stats["opportunities"] % PREFETCH_EXPLORE:
+            continue
+        query = canonical_query(prediction.query)
+        if query in _pending or query in _inflight or any(p.query == prediction.query for p in chosen):
+            continue
+        if prediction.points > PREFETCH_MAX_POINTS:
+            _prefetch_stats["skipped_budget"] += 1
+            continue
+        hit = lookup(prediction.query, prediction.start, prediction.end, prediction.step, include_mutable=True)
+        if hit and hit.kind == "full":
+            _prefetch_stats["skipped_cached"] += 1
+            continue
+        chosen.append(prediction)
+        if len(chosen) >= PREFETCH_MAX_CALLS:
+            break
+    return chosen
+
+
+async def _fetch(prediction: Prediction, tool_map: Dict[str, Any], config) -> None:
+    from agent.utils.tool_executor import execute_tool_call, lane_limiter
+
+    started = time.time()
+    query = canonical_query(prediction.query)
+    call = {
+        "name": "prom_range", "id": f"prefetch-{abs(hash((prediction.query, prediction.end)))}",
+        "args": {"query": prediction.query, "start": prediction.start, "end": prediction.end, "step": format_duration(prediction.step)},
+    }
+    try:
+        message = await execute_tool_call(call, tool_map, config, lane=lane_limiter("prefetch", PREFETCH_MAX_INFLIGHT))
+        result = get_prom_result(message)
+        if result is None or result.status != "success" or result.warnings:
+            raise RuntimeError(str(message.content)[:200])
+        store_result(prediction.query, prediction.start, prediction.end, prediction.step, result, fetched_at=started)
+        _pending[query] = (prediction.kind, prediction.start, prediction.step, time.time())
+        _prefetch_stats["completed"] += 1
+        logger.info(f"[PERF] Prefetched ({prediction.kind}) {prediction.query}: {result.point_count} points in {time.time() - started:.3f}s")
+    except Exception as e:
+        # A failed prefetch is never pending, it doesn't count against the kind
+        _prefetch_stats["failed"] += 1
+        logger.debug(f"Prefetch of {prediction.query} failed: {e}")
+    finally:
+        _inflight.discard(query)
+
+
+def schedule_prefetch(tool_calls: List[Dict[str, Any]], messages: List[ToolMessage], tool_map: Dict[str, Any],
+                      thread_id: str) -> List[asyncio.Task]:
+    """Start background fetches of the top predicted follow-ups of a node's calls"""
+    if not PREFETCH or not SERIES_STORE:
+        return []
+    from agent.utils.tool_executor import is_busy
+
+    if is_busy("prom_range"):
+        # Users' calls are waiting or running: a follow-up must not compete with guesses
+        _prefetch_stats["skipped_busy"] += 1
+        return []
+    by_id = {msg.tool_call_id: msg for msg in messages}
+    predictions = [p for tool_call in tool_calls if tool_call.get("name") in ("prom_query", "prom_range") and tool_call.get("id") in by_id
+                   for p in predict(tool_call, by_id[tool_call["id"]])]
+
+    tasks = []
+    # Only the owner's thread id: the node's run config (callbacks) ends with the node
+    config = {"configurable": {"thread_id": thread_id}}
+    for prediction in _select(predictions):
+        if len(_inflight) >= PREFETCH_MAX_INFLIGHT:
+            _prefetch_stats["skipped_budget"] += 1
+            break
+        _inflight.add(canonical_query(prediction.query))
+        _kind_stats[prediction.kind]["issued"] += 1
+        _prefetch_stats["issued"] += 1
+        task = asyncio.create_task(_fetch(prediction, tool_map, config))
+        _tasks.add(task)
+        task.add_done_callback(_tasks.discard)
+        tasks.append(task)
+    return tasks
@@ -1,6 +1,8 @@
 import json
 from datetime import datetime
 
+from agent.utils.prom_result import get_prom_result
+
 def print_messages(messages):
     """Pretty print all messages with colors and emojis based on type"""
     if not messages:
@@ -57,8 +59,12 @@ def print_messages(messages):
         if hasattr(message, 'content') and message.content:
             content = str(message.content)
             
+            # Prometheus results are already decoded by the tool node
+            prom_result = get_prom_result(message) if message_type == "ToolMessage" else None
+            if prom_result:
+                print(f" - Prometheus {prom_result.status}, {prom_result.series_count} series, {prom_result.point_count} points")
             # For JSON content, try to extract key info
-            if content.strip().startswith('{'):
+            elif content.strip().startswith('{'):
                 try:
                     parsed = json.loads(content)
                     if "status" in parsed and "data" in parsed:
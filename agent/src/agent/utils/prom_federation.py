@@ -0,0 +1,355 @@
+"""
+Prom Federation - Several Prometheus backends, each holding a set of managed clusters
+
+PROMETHEUS_BACKENDS lists the backends as 'name=url|cluster,cluster;name=url|*' ('*' holds
+any cluster). The first backend is served by the regular 'prometheus' MCP server, the
+others by one 'prometheus-<name>' server each, whose tools are not bound to the LLM.
+
+prom_query/prom_range in the tool map are wrapped: a query goes only to the backends whose
+clusters can match its cluster_name matchers (all of them without such a matcher), the
+backends are queried in parallel (secondary servers under their own server limit, each
+backend with a share of the call's deadline) and the series are merged. A series present
+on backends with overlapping clusters (overlapping hubs) is kept once; equal label sets
+from backends with disjoint clusters are different series, kept apart by a
+prometheus_backend label and reported in a warning. Backends that fail are reported as
+Prometheus warnings on the merged result.
+
+An aggregation not grouped by cluster_name would give one total per backend. sum, count,
+min, max, group and avg are sent grouped by cluster_name instead and re-aggregated
+locally (avg as sum and count); other aggregations come back per backend, with a warning.
+"""
+
+import os
+import time
+import asyncio
+from dataclasses import dataclass
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+
+from agent.utils.logging_config import get_logger
+from agent.utils.prom_result import PromResult, PromSeries, intern_labels, parse_prom_response
+from agent.utils.promql import CLUSTER_LABEL, Aggregation, PromQLError, Selector, parse_query, split_aggregation
+from agent.utils.tool_executor import TOOL_CALL_TIMEOUT, TOOL_TIMEOUTS, server_slot
+
+logger = get_logger("prom_federation")
+
+PRIMARY_SERVER = "prometheus"
+BACKEND_SERVER_PREFIX = "prometheus-"
+FEDERATED_TOOLS = ("prom_query", "prom_range")
+ANY_CLUSTER = "*"
+BACKEND_LABEL = "prometheus_backend"
+AVG_PART_LABEL = "__federation_part"
+# Aggregation -> how its per-cluster results combine
+# Share of the call's deadline each backend gets when several are queried, so a slow
+# backend ends as a failed one (partial result) instead of timing out the whole call
+PROM_BACKEND_TIMEOUT_SHARE = float(os.getenv("PROM_BACKEND_TIMEOUT_SHARE", "0.75"))
+REAGGREGATIONS = {"sum": "sum", "count": "sum", "min": "min", "max": "max", "group": "group", "avg": "avg"}
+
+
+@dataclass(frozen=True)
+class Backend:
+    name: str
+    url: str
+    clusters: Tuple[str, ...]
+    server: str
+
+    def holds(self, selector: Selector) -> bool:
+        """The backend can have series matching the selector's cluster_name matchers"""
+        matchers = [m for m in selector.matchers if m.label == CLUSTER_LABEL]
+        if not matchers or ANY_CLUSTER in self.clusters:
+            return True
+        return any(all(m.matches({CLUSTER_LABEL: cluster}) for m in matchers) for cluster in self.clusters)
+
+    def overlaps(self, other: "Backend") -> bool:
+        """The two backends can hold the same cluster"""
+        return ANY_CLUSTER in self.clusters or ANY_CLUSTER in other.clusters or bool(set(self.clusters) & set(other.clusters))
+
+
+def parse_backends(spec: str) -> List[Backend]:
+    """'name=url|cluster,cluster;...' -> backends, the first one on the primary server"""
+    backends = []
+    for i, item in enumerate(part.strip() for part in spec.split(";")):
+        if not item or "=" not in item:
+            continue
+        name, rest = item.split("=", 1)
+        url, _, clusters = rest.partition("|")
+        cluster_names = tuple(c.strip() for c in clusters.split(",") if c.strip()) or (ANY_CLUSTER,)
+        server = PRIMARY_SERVER if i == 0 else f"{BACKEND_SERVER_PREFIX}{name.strip()}"
+        backends.append(Backend(name.strip(), url.strip(), cluster_names, server))
+    return backends
+
+
+BACKENDS = parse_backends(os.getenv("PROMETHEUS_BACKENDS", ""))
+
+_backend_stats: Dict[str, Dict[str, float]] = {
+    backend.name: {"calls": 0, "errors": 0, "total_ms": 0.0, "last_ms": 0.0, "queue_ms": 0.0} for backend in BACKENDS
+}
+_federation_stats = {
+    "federated_calls": 0,
+    "fanned_calls": 0,
+    "routed_away": 0,       # Backend queries saved by routing
+    "overlapping_series": 0,
+    "conflicting_series": 0,   # Same labels from backends with disjoint clusters
+    "reaggregated_calls": 0,
+    "partial_results": 0,
+}
+
+
+def get_federation_stats() -> dict:
+    """Get federation and per-backend latency statistics for monitoring"""
+    backends = {
+        name: {**stats, "total_ms": round(stats["total_ms"], 1), "queue_ms": round(stats["queue_ms"], 1),
+               "avg_ms": round(stats["total_ms"] / stats["calls"], 1) if stats["calls"] else 0.0}
+        for name, stats in _backend_stats.items()
+    }
+    return {**_federation_stats, "backends": backends}
+
+
+def is_federated() -> bool:
+    return len(BACKENDS) > 1
+
+
+def is_backend_server(server_name: str) -> bool:
+    """Server of a secondary backend, its tools are only called through the federation"""
+    return any(backend.server == server_name for backend in BACKENDS[1:])
+
+
+def primary_url() -> Optional[str]:
+    return BACKENDS[0].url if BACKENDS else None
+
+
+def backend_server_configs(primary_config: Dict[str, Any]) -> Dict[str, Dict[str, Any]]:
+    """MCP server configs of the secondary backends, copies of the primary with their URL"""
+    return {
+        backend.server: {**primary_config, "env": {**primary_config.get("env", {}), "PROMETHEUS_URL": backend.url}}
+        for backend in BACKENDS[1:]
+    }
+
+
+def route(query: str) -> List[Backend]:
+    """Backends that can hold series of the query"""
+    try:
+        selectors = parse_query(query).selectors
+    except PromQLError:
+        return list(BACKENDS)
+    routed = [backend for backend in BACKENDS if not selectors or any(backend.holds(s) for s in selectors)]
+    # Clusters no backend lists may still exist somewhere, ask everyone rather than no one
+    return routed or list(BACKENDS)
+
+
+def merge_results(results: List[Tuple[Backend, PromResult]]) -> PromResult:
+    """
+    Series of all backends. A label set answered by backends with overlapping clusters is
+    kept once (most points); answered by backends with disjoint clusters, every copy is kept
+    with its backend as a label, and a warning says so.
+    """
+    by_labels: Dict[frozenset, List[Tuple[Backend, PromSeries]]] = {}
+    for backend, result in results:
+        for s in result.series:
+            entries = by_labels.setdefault(frozenset(s.metric.items()), [])
+            for i, (other, kept) in enumerate(entries):
+                if backend.overlaps(other):
+                    _federation_stats["overlapping_series"] += 1
+                    if len(s) > len(kept):
+                        entries[i] = (backend, s)
+                    break
+            else:
+                entries.append((backend, s))
+
+    series, conflicting = [], set()
+    for entries in by_labels.values():
+        if len(entries) == 1:
+            series.append(entries[0][1])
+            continue
+        _federation_stats["conflicting_series"] += 1
+        conflicting.update(backend.name for backend, _ in entries)
+        series.extend(PromSeries(intern_labels({**s.metric, BACKEND_LABEL: backend.name}), s.timestamps, s.values) for backend, s in entries)
+
+    result_type = results[0][1].result_type
+    warnings = [warning for _, result in results for warning in result.warnings]
+    if conflicting:
+        warnings.append(
+            f"series with the same labels came from backends {', '.join(sorted(conflicting))}, which hold different clusters: "
+            f"they are kept apart by the '{BACKEND_LABEL}' label and are per-backend values, not fleet-wide ones"
+        )
+    return PromResult("success", result_type, series, None, warnings)
+
+
+def _is_per_cluster(aggregation: Aggregation) -> bool:
+    """The aggregation keeps cluster_name, each output series belongs to one cluster"""
+    if aggregation.modifier == "by":
+        return CLUSTER_LABEL in aggregation.labels
+    return aggregation.modifier == "without" and CLUSTER_LABEL not in aggregation.labels
+
+
+def per_cluster_query(query: str) -> Optional[Tuple[str, Aggregation]]:
+    """
+    The aggregation grouped by cluster_name as well, whose per-backend results re-aggregate
+    into the fleet-wide one. None if the query is no such aggregation or already per cluster.
+    """
+    aggregation = split_aggregation(query)
+    if aggregation is None or aggregation.op not in REAGGREGATIONS or _is_per_cluster(aggregation):
+        return None
+    if aggregation.modifier == "by":
+        modifier, labels = "by", aggregation.labels + (CLUSTER_LABEL,)
+    elif aggregation.modifier == "without":
+        modifier, labels = "without", tuple(label for label in aggregation.labels if label != CLUSTER_LABEL)
+    else:
+        modifier, labels = "by", (CLUSTER_LABEL,)
+
+    def part(op: str) -> str:
+        return Aggregation(op, modifier, labels, aggregation.body).render()
+
+    if aggregation.op == "avg":
+        # Sums and counts in one response, told apart by a label
+        return (f'label_replace({part("sum")}, "{AVG_PART_LABEL}", "sum", "", "") or '
+                f'label_replace({part("count")}, "{AVG_PART_LABEL}", "count", "", "")'), aggregation
+    return part(aggregation.op), aggregation
+
+
+def _combine(series: List[PromSeries], op: str, instant: bool) -> Tuple[np.ndarray, np.ndarray]:
+    """Per-timestamp aggregate of several series (instant vectors: one point at the latest timestamp)"""
+    timestamps = np.concatenate([s.timestamps for s in series])
+    values = np.concatenate([s.values for s in series])
+    if instant:
+        timestamps = np.full(len(timestamps), timestamps.max() if len(timestamps) else 0.0)
+    unique, index = np.unique(timestamps, return_inverse=True)
+    if op == "min":
+        combined = np.full(len(unique), np.inf)
+        np.minimum.at(combined, index, values)
+    elif op == "max":
+        combined = np.full(len(unique), -np.inf)
+        np.maximum.at(combined, index, values)
+    elif op == "group":
+        combined = np.ones(len(unique))
+    else:
+        combined = np.zeros(len(unique))
+        np.add.at(combined, index, values)
+    return unique, combined
+
+
+def reaggregate(result: PromResult, aggregation: Aggregation) -> PromResult:
+    """Fleet-wide result of an aggregation from its per-cluster result"""
+    groups: Dict[frozenset, Dict[str, List[PromSeries]]] = {}
+    for s in result.series:
+        labels = frozenset((k, v) for k, v in s.metric.items() if k not in (CLUSTER_LABEL, AVG_PART_LABEL, BACKEND_LABEL))
+        groups.setdefault(labels, {}).setdefault(s.metric.get(AVG_PART_LABEL, "value"), []).append(s)
+
+    op, instant = REAGGREGATIONS[aggregation.op], result.result_type == "vector"
+    series = []
+    for labels, parts in groups.items():
+        if op == "avg":
+            if "sum" not in parts or "count" not in parts:
+                continue
+            sum_ts, sums = _combine(parts["sum"], "sum", instant)
+            count_ts, counts = _combine(parts["count"], "sum", instant)
+            timestamps, i, j = np.intersect1d(sum_ts, count_ts, return_indices=True)
+            values = sums[i] / counts[j]
+        else:
+            timestamps, values = _combine(parts["value"], op, instant)
+        series.append(PromSeries(intern_labels(dict(labels)), timestamps, values))
+    return PromResult(result.status, result.result_type, series, result.error, result.warnings)
+
+
+class FederatedPromTool:
+    """Drop-in for prom_query/prom_range in a tool map, querying the routed backends"""
+
+    def __init__(self, primary):
+        self.name = primary.name
+        self.primary = primary
+
+    async def _backend_tool(self, backend: Backend):
+        if backend.server == PRIMARY_SERVER:
+            return self.primary
+        # Imported here, the MCP client is only needed once a secondary backend is queried
+        from agent.tools.mcp_tool import get_server_tools, wait_for_servers
+
+        await wait_for_servers([backend.server])
+        return next((tool for tool in get_server_tools(backend.server) if tool.name == self.name), None)
+
+    async def _invoke(self, tool, args: Dict[str, Any], config, timeout: Optional[float]) -> str:
+        try:
+            return str(await asyncio.wait_for(tool.ainvoke(args, config), timeout=timeout))
+        except asyncio.TimeoutError:
+            raise RuntimeError(f"timed out after {timeout:g}s") from None
+
+    async def _call(self, backend: Backend, args: Dict[str, Any], config, timeout: Optional[float] = None) -> str:
+        stats = _backend_stats[backend.name]
+        started = time.time()
+        stats["calls"] += 1
+        try:
+            tool = await self._backend_tool(backend)
+            if tool is None:
+                raise RuntimeError(f"{self.name} is not available on backend '{backend.name}'")
+            if backend.server == PRIMARY_SERVER:
+                # The executor already holds this call's slot on the primary server
+                return await self._invoke(tool, args, config, timeout)
+            # Secondary servers are called from inside the wrapper, under their own server limit
+            async with server_slot(backend.server, config) as queue_wait:
+                stats["queue_ms"] += queue_wait * 1000
+                return await self._invoke(tool, args, config, timeout)
+        except Exception:
+            stats["errors"] += 1
+            raise
+        finally:
+            elapsed_ms = (time.time() - started) * 1000
+            stats["total_ms"] += elapsed_ms
+            stats["last_ms"] = round(elapsed_ms, 1)
+
+    async def ainvoke(self, args: Dict[str, Any], config=None) -> str:
+        backends = route(args.get("query", ""))
+        _federation_stats["federated_calls"] += 1
+        _federation_stats["routed_away"] += len(BACKENDS) - len(backends)
+        if len(backends) == 1:
+            return await self._call(backends[0], args, config)
+
+        _federation_stats["fanned_calls"] += 1
+        rewritten = per_cluster_query(args.get("query", ""))
+        backend_args = {**args, "query": rewritten[0]} if rewritten else args
+        timeout = TOOL_TIMEOUTS.get(self.name, TOOL_CALL_TIMEOUT) * PROM_BACKEND_TIMEOUT_SHARE
+        outcomes = await asyncio.gather(*(self._call(backend, backend_args, config, timeout) for backend in backends),
+                                        return_exceptions=True)
+
+        results, failures = [], []
+        for backend, outcome in zip(backends, outcomes):
+            result = None if isinstance(outcome, BaseException) else parse_prom_response(outcome)
+            if result is None or result.status != "success":
+                error = outcome if isinstance(outcome, BaseException) else (result.error if result else str(outcome)[:200])
+                failures.append((backend, error))
+                logger.warning(f"Backend '{backend.name}' failed for {self.name}: {error}")
+            else:
+                results.append((backend, result))
+
+        if not results:
+            # Same failure surface as a single backend
+            backend, error = failures[0]
+            if isinstance(error, BaseException):
+                raise error
+            return outcomes[0]
+
+        merged = merge_results(results)
+        if rewritten:
+            _federation_stats["reaggregated_calls"] += 1
+            merged = reaggregate(merged, rewritten[1])
+        else:
+            aggregation = split_aggregation(args.get("query", ""))
+            if aggregation and not _is_per_cluster(aggregation):
+                merged.warnings.append(f"'{aggregation.op}' was computed on each backend separately, not over all clusters at once")
+        if failures:
+            _federation_stats["partial_results"] += 1
+            merged.warnings.extend(
+                f"backend '{backend.name}' (clusters {', '.join(backend.clusters)}) failed: {error}" for backend, error in failures
+            )
+        logger.info(f"[PERF] Federated {self.name} over {len(backends)} backends: {merged.series_count} series, {len(failures)} failed")
+        return merged.to_response_json()
+
+
+def federate_tools(tool_map: Dict[str, Any]) -> Dict[str, Any]:
+    """Tool map with prom_query/prom_range routed over all backends (unchanged with one backend)"""
+    if not is_federated():
+        return tool_map
+    return {
+        name: FederatedPromTool(tool) if name in FEDERATED_TOOLS and not isinstance(tool, FederatedPromTool) else tool
+        for name, tool in tool_map.items()
+    }
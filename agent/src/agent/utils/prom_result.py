@@ -0,0 +1,327 @@
+"""
+Prometheus Result - Single-pass decoding of prom_query/prom_range tool responses
+
+The response string is walked once: the envelope is parsed incrementally and each series
+of data.result is decoded on its own and packed into float64 columns right away. A
+100k-point matrix never exists as nested Python lists, so peak memory stays around one
+series. The columnar result is kept per tool call id and shared by the tool node, the
+analyzer digest, the chart builder and print_messages.
+"""
+
+import re
+import sys
+import json
+from array import array
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+import numpy as np
+
+from agent.utils.logging_config import get_logger
+
+logger = get_logger("prom_result")
+
+PROMETHEUS_TOOLS = ("prom_query", "prom_range")
+RESULT_CACHE_SIZE = 64
+LABEL_SET_CACHE_SIZE = 100_000
+
+_decoder = json.JSONDecoder()
+_whitespace = re.compile(r"[ \t\n\r]*")
+_empty = np.empty(0, dtype=np.float64)
+
+# Label sets repeat across results (same pods, same clusters), share one dict per distinct set
+_label_sets: Dict[Tuple[Tuple[str, str], ...], Dict[str, str]] = {}
+
+
+def intern_labels(metric: Dict[str, str]) -> Dict[str, str]:
+    """Get the shared, interned instance of a label set. Treat the returned dict as read-only"""
+    key = tuple(sorted(metric.items()))
+    labels = _label_sets.get(key)
+    if labels is None:
+        if len(_label_sets) >= LABEL_SET_CACHE_SIZE:
+            _label_sets.clear()
+        labels = {sys.intern(name): sys.intern(str(value)) for name, value in key}
+        _label_sets[key] = labels
+    return labels
+
+
+def series_name(metric: Dict[str, str]) -> str:
+    """Chart/prompt name of a series: 'cluster:pod' when available, else the label values"""
+    pod = metric.get("pod") or metric.get("pod_name")
+    cluster = metric.get("cluster_name")
+    if pod:
+        return f"{cluster}:{pod}" if cluster else pod
+    name = ",".join(f"{k}={v}" for k, v in metric.items() if k != "__name__")
+    return name or metric.get("__name__", "value")
+
+
+@dataclass
+class PromSeries:
+    metric: Dict[str, str]
+    timestamps: np.ndarray = field(default_factory=lambda: _empty)
+    values: np.ndarray = field(default_factory=lambda: _empty)
+
+    def __len__(self) -> int:
+        return len(self.timestamps)
+
+    @property
+    def name(self) -> str:
+        return series_name(self.metric)
+
+    def slice(self, start: Optional[float] = None, end: Optional[float] = None) -> "PromSeries":
+        """Samples with start <= timestamp <= end, as views on the same arrays (no copy)"""
+        lo = 0 if start is None else int(np.searchsorted(self.timestamps, start, side="left"))
+        hi = len(self.timestamps) if end is None else int(np.searchsorted(self.timestamps, end, side="right"))
+        return PromSeries(self.metric, self.timestamps[lo:hi], self.values[lo:hi])
+
+
+@dataclass
+class PromResult:
+    status: str
+    result_type: str = ""
+    series: List[PromSeries] = field(default_factory=list)
+    error: Optional[str] = None
+    warnings: List[str] = field(default_factory=list)   # e.g. a federated backend that didn't answer
+
+    @property
+    def series_count(self) -> int:
+        return len(self.series)
+
+    @property
+    def point_count(self) -> int:
+        return sum(len(s) for s in self.series)
+
+    def slice(self, start: Optional[float] = None, end: Optional[float] = None) -> "PromResult":
+        """Time window of every series, sharing the underlying arrays"""
+        return PromResult(self.status, self.result_type, [s.slice(start, end) for s in self.series], self.error, self.warnings)
+
+    def filter(self, predicate: Callable[[Dict[str, str]], bool]) -> "PromResult":
+        """Series whose labels satisfy the predicate, sharing the underlying arrays"""
+        return PromResult(self.status, self.result_type, [s for s in self.series if predicate(s.metric)], self.error, self.warnings)
+
+    def to_response_json(self) -> str:
+        """Serialize back to a Prometheus API response (string sample values, like the server sends)"""
+        if self.status != "success":
+            return json.dumps({"status": self.status, "error": self.error}, separators=(",", ":"))
+
+        result = []
+        for s in self.series:
+            points = [[compact_number(ts), _format_sample(v)] for ts, v in zip(s.timestamps.tolist(), s.values.tolist())]
+            if self.result_type == "matrix":
+                result.append({"metric": s.metric, "values": points})
+            elif points:
+                result.append({"metric": s.metric, "value": points[0]})
+        data = {"resultType": self.result_type, "result": result}
+        envelope: Dict[str, Any] = {"status": self.status, "data": data}
+        if self.warnings:
+            envelope["warnings"] = self.warnings
+        return json.dumps(envelope, separators=(",", ":"))
+
+    def to_prompt_json(self) -> str:
+        """Compact JSON in Prometheus' shape (numeric values, no whitespace) for LLM prompts"""
+        if self.status != "success":
+            return json.dumps({"status": self.status, "error": self.error}, separators=(",", ":"))
+
+        result = []
+        for s in self.series:
+            points = [[compact_number(ts), compact_number(v)] for ts, v in zip(s.timestamps.tolist(), s.values.tolist())]
+            if self.result_type == "matrix":
+                result.append({"metric": s.metric, "values": points})
+            else:
+                result.append({"metric": s.metric, "value": points[0] if points else None})
+        return json.dumps({"resultType": self.result_type, "result": result}, separators=(",", ":"))
+
+    def digest(self) -> List[Dict[str, Any]]:
+        """Per-series summary (window and value statistics) computed on the columns"""
+        rows = []
+        for s in self.series:
+            row: Dict[str, Any] = {"series": s.name, "labels": s.metric, "points": len(s)}
+            finite = s.values[np.isfinite(s.values)]
+            if len(s):
+                row["first_ts"] = compact_number(float(s.timestamps[0]))
+                row["last_ts"] = compact_number(float(s.timestamps[-1]))
+                row["last"] = round_significant(float(s.values[-1]))
+            if len(finite):
+                row.update(
+                    min=round_significant(float(finite.min())),
+                    max=round_significant(float(finite.max())),
+                    mean=round_significant(float(finite.mean())),
+                )
+            rows.append(row)
+        return rows
+
+
+def compact_number(value: float):
+    """Render integral floats (timestamps, counters) without the trailing .0"""
+    return int(value) if value.is_integer() else value
+
+
+def _format_sample(value: float) -> str:
+    """Sample value the way Prometheus writes it"""
+    if value != value:
+        return "NaN"
+    if value in (float("inf"), float("-inf")):
+        return "+Inf" if value > 0 else "-Inf"
+    return str(compact_number(value))
+
+
+def round_significant(value: float):
+    """Round to 6 significant digits for prompts"""
+    return compact_number(float(f"{value:.6g}")) if np.isfinite(value) else str(value)
+
+
+# --- Incremental decoder ---
+class _DecodeError(ValueError):
+    pass
+
+
+def _skip(content: str, pos: int) -> int:
+    return _whitespace.match(content, pos).end()
+
+
+def _expect(content: str, pos: int, char: str) -> int:
+    pos = _skip(content, pos)
+    if content[pos:pos + 1] != char:
+        raise _DecodeError(f"expected '{char}' at {pos}")
+    return pos + 1
+
+
+def _walk_object(content: str, pos: int, handlers: Dict[str, Callable[[str, int], int]], out: Dict[str, Any]) -> int:
+    """
+    Walk a JSON object starting at pos. Keys with a handler are handed over without being
+    decoded, every other value is decoded into out. Returns the position after the object.
+    """
+    pos = _expect(content, pos, "{")
+    pos = _skip(content, pos)
+    if content[pos:pos + 1] == "}":
+        return pos + 1
+
+    while True:
+        key, pos = _decoder.raw_decode(content, _skip(content, pos))
+        pos = _skip(content, _expect(content, pos, ":"))
+        if key in handlers:
+            pos = handlers[key](content, pos)
+        else:
+            out[key], pos = _decoder.raw_decode(content, pos)
+
+        pos = _skip(content, pos)
+        if content[pos:pos + 1] == ",":
+            pos += 1
+        elif content[pos:pos + 1] == "}":
+            return pos + 1
+        else:
+            raise _DecodeError(f"expected ',' or '}}' at {pos}")
+
+
+def _walk_array(content: str, pos: int, on_item: Callable[[Any], None]) -> int:
+    """Decode a JSON array one element at a time"""
+    pos = _skip(content, _expect(content, pos, "["))
+    if content[pos:pos + 1] == "]":
+        return pos + 1
+
+    while True:
+        item, pos = _decoder.raw_decode(content, _skip(content, pos))
+        on_item(item)
+
+        pos = _skip(content, pos)
+        if content[pos:pos + 1] == ",":
+            pos += 1
+        elif content[pos:pos + 1] == "]":
+            return pos + 1
+        else:
+            raise _DecodeError(f"expected ',' or ']' at {pos}")
+
+
+def _to_series(item: Dict[str, Any]) -> PromSeries:
+    """Pack one decoded result item into float64 columns"""
+    if "values" in item:
+        points = item["values"]
+    elif item.get("value"):
+        points = [item["value"]]
+    else:
+        points = []
+
+    timestamps, values = array("d"), array("d")
+    for ts, value in points:
+        timestamps.append(float(ts))
+        values.append(float(value))  # Prometheus sends sample values as strings ("NaN", "+Inf" included)
+
+    # frombuffer wraps the packed arrays without copying
+    return PromSeries(
+        metric=intern_labels(item.get("metric", {})),
+        timestamps=np.frombuffer(timestamps, dtype=np.float64) if timestamps else _empty,
+        values=np.frombuffer(values, dtype=np.float64) if values else _empty,
+    )
+
+
+def parse_prom_response(content: str) -> Optional[PromResult]:
+    """
+    Decode a Prometheus API response in one pass.
+
+    Accepts the full envelope ({"status", "data": {"resultType", "result"}}) as well as a
+    bare data object. Returns None if the content is not a Prometheus JSON response.
+    """
+    if not isinstance(content, str) or not content.lstrip().startswith("{"):
+        return None
+
+    series: List[PromSeries] = []
+    data: Dict[str, Any] = {}
+    envelope: Dict[str, Any] = {}
+
+    def on_result(text: str, pos: int) -> int:
+        return _walk_array(text, pos, lambda item: series.append(_to_series(item)))
+
+    def on_data(text: str, pos: int) -> int:
+        return _walk_object(text, pos, {"result": on_result}, data)
+
+    try:
+        _walk_object(content, 0, {"data": on_data, "result": on_result}, envelope)
+    except (ValueError, TypeError, KeyError, AttributeError) as e:
+        logger.debug(f"Not a Prometheus response: {e}")
+        return None
+
+    if "status" not in envelope and "resultType" not in envelope and "resultType" not in data:
+        return None
+
+    return PromResult(
+        status=envelope.get("status", "success"),
+        result_type=data.get("resultType") or envelope.get("resultType", ""),
+        series=series,
+        error=envelope.get("error"),
+        warnings=list(envelope.get("warnings") or []),
+    )
+
+
+# --- Per tool call reuse ---
+_results: "OrderedDict[str, Optional[PromResult]]" = OrderedDict()
+
+
+def get_prom_result(message) -> Optional[PromResult]:
+    """
+    Get the decoded result of a prom_query/prom_range ToolMessage, decoding it on first use.
+
+    Results are kept per tool_call_id (LRU bounded), so every consumer shares one decode.
+    """
+    if getattr(message, "name", None) not in PROMETHEUS_TOOLS:
+        return None
+
+    key = getattr(message, "tool_call_id", None)
+    if key and key in _results:
+        _results.move_to_end(key)
+        return _results[key]
+
+    content = message.content if isinstance(message.content, str) else ""
+    result = parse_prom_response(content) if not content.startswith("Error") else None
+
+    if key:
+        cache_prom_result(key, result)
+    return result
+
+
+def cache_prom_result(tool_call_id: str, result: Optional[PromResult]) -> None:
+    """Register an already decoded result (e.g. derived from another call) for a tool_call_id"""
+    _results[tool_call_id] = result
+    _results.move_to_end(tool_call_id)
+    while len(_results) > RESULT_CACHE_SIZE:
+        _results.popitem(last=False)
@@ -0,0 +1,486 @@
+"""
+PromQL - Tokenizer and canonical form of PromQL queries
+
+Two queries that only differ in whitespace, label order, quoting, keyword case, duration
+spelling or equivalent matcher forms (=~"literal" vs ="literal", sum(x) by (a) vs
+sum by (a) (x)) get the same canonical string. That string backs duplicate detection
+and cache keys. Queries that apply per-series functions to a single selector also get a
+template (the query with the selector cut out), which is what subset detection and query
+merging compare.
+"""
+
+import re
+import ast
+import json
+from datetime import datetime, timezone
+from dataclasses import dataclass
+from typing import Any, Dict, List, Optional, Tuple
+
+# --- Tokenizer ---
+_TOKEN = re.compile(r"""
+    (?P<ws>\s+)
+  | (?P<comment>\#[^\n]*)
+  | (?P<string>"(?:[^"\\]|\\.)*"|'(?:[^'\\]|\\.)*'|`[^`]*`)
+  | (?P<duration>(?:\d+(?:ms|[smhdwy]))+)(?![\w.])
+  | (?P<number>0[xX][0-9a-fA-F]+|(?:\d+\.?\d*|\.\d+)(?:[eE][+-]?\d+)?)
+  | (?P<ident>[a-zA-Z_][a-zA-Z0-9_:]*)
+  | (?P<op>=~|!~|!=|==|<=|>=|[-+*/%^<>=])
+  | (?P<punct>[{}()\[\],@:])
+""", re.VERBOSE)
+
+KEYWORDS = {"and", "or", "unless", "by", "without", "on", "ignoring", "group_left", "group_right", "offset", "bool"}
+AGGREGATIONS = {
+    "sum", "avg", "min", "max", "count", "group", "stddev", "stdvar", "topk", "bottomk",
+    "quantile", "count_values", "limitk", "limit_ratio",
+}
+GROUPING_KEYWORDS = {"by", "without", "on", "ignoring", "group_left", "group_right"}
+BINARY_KEYWORDS = {"and", "or", "unless"}
+
+# Functions that map each input series to one output series with the same labels (minus
+# __name__); filtering their output by labels equals filtering their input
+PER_SERIES_FUNCTIONS = {
+    "rate", "irate", "increase", "delta", "idelta", "deriv", "resets", "changes",
+    "avg_over_time", "min_over_time", "max_over_time", "sum_over_time", "count_over_time",
+    "last_over_time", "stddev_over_time", "stdvar_over_time", "present_over_time",
+    "quantile_over_time", "mad_over_time", "abs", "ceil", "floor", "round", "exp", "ln",
+    "log2", "log10", "sqrt", "clamp", "clamp_min", "clamp_max", "sgn", "timestamp",
+    "predict_linear", "holt_winters", "double_exponential_smoothing",
+}
+
+# Label naming the cluster of every series
+CLUSTER_LABEL = "cluster_name"
+REGEX_META = re.compile(r"[\\.^$|?*+()\[\]{}]")
+
+_DURATION_UNITS = (("y", 365 * 86400000), ("w", 7 * 86400000), ("d", 86400000), ("h", 3600000),
+                   ("m", 60000), ("s", 1000), ("ms", 1))
+_DURATION_PART = re.compile(r"(\d+)(ms|[smhdwy])")
+
+
+def escape_regex(value: str) -> str:
+    """Literal value as a regex matcher value"""
+    return REGEX_META.sub(lambda m: "\\" + m.group(), value)
+
+
+class PromQLError(ValueError):
+    """Raised when a query can't be tokenized"""
+
+
+@dataclass(frozen=True)
+class Token:
+    kind: str
+    text: str
+
+
+def tokenize(query: str) -> List[Token]:
+    tokens, pos = [], 0
+    while pos < len(query):
+        match = _TOKEN.match(query, pos)
+        if not match:
+            raise PromQLError(f"unexpected character {query[pos]!r} at {pos}")
+        pos = match.end()
+        kind = match.lastgroup
+        if kind not in ("ws", "comment"):
+            tokens.append(Token(kind, match.group()))
+    return tokens
+
+
+# --- Normalization helpers ---
+def parse_duration(text: str) -> Optional[float]:
+    """Duration string ('1h30m', '90s', or plain seconds) in seconds, None if invalid"""
+    text = str(text).strip()
+    try:
+        return float(text)
+    except ValueError:
+        pass
+    parts = _DURATION_PART.findall(text)
+    if not parts or "".join(number + unit for number, unit in parts) != text:
+        return None
+    units = dict(_DURATION_UNITS)
+    return sum(int(number) * units[unit] for number, unit in parts) / 1000
+
+
+def format_duration(seconds: float) -> str:
+    """Canonical duration spelling: largest units first, e.g. 5400 -> '1h30m'"""
+    remaining = int(round(seconds * 1000))
+    if remaining == 0:
+        return "0s"
+    parts = []
+    for unit, size in _DURATION_UNITS:
+        if remaining >= size:
+            parts.append(f"{remaining // size}{unit}")
+            remaining %= size
+    return "".join(parts)
+
+
+def parse_time(value: Any) -> Optional[float]:
+    """RFC 3339 / ISO 8601 or unix timestamp to unix seconds, None if not absolute"""
+    if value is None or value == "":
+        return None
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        pass
+    try:
+        parsed = datetime.fromisoformat(str(value).strip().replace("Z", "+00:00"))
+    except ValueError:
+        return None
+    if parsed.tzinfo is None:
+        parsed = parsed.replace(tzinfo=timezone.utc)
+    return parsed.timestamp()
+
+
+def _unquote(text: str) -> str:
+    if text.startswith("`"):
+        return text[1:-1]
+    try:
+        return ast.literal_eval(text)
+    except (ValueError, SyntaxError):
+        return text[1:-1]
+
+
+def _quote(value: str) -> str:
+    return json.dumps(value, ensure_ascii=False)
+
+
+def _compact_number(text: str) -> str:
+    if text.lower().startswith("0x"):
+        return str(int(text, 16))
+    number = float(text)
+    return str(int(number)) if number.is_integer() and abs(number) < 1e15 else repr(number)
+
+
+# --- Selectors ---
+@dataclass(frozen=True)
+class Matcher:
+    label: str
+    op: str
+    value: str
+
+    def matches(self, labels: Dict[str, str]) -> bool:
+        """Evaluate the matcher against a label set (absent labels count as empty)"""
+        actual = labels.get(self.label, "")
+        if self.op == "=":
+            return actual == self.value
+        if self.op == "!=":
+            return actual != self.value
+        matched = re.fullmatch(self.value, actual, re.DOTALL) is not None
+        return matched if self.op == "=~" else not matched
+
+    def render(self) -> str:
+        return f"{self.label}{self.op}{_quote(self.value)}"
+
+
+@dataclass(frozen=True)
+class Selector:
+    metric: str
+    matchers: Tuple[Matcher, ...]
+
+    def render(self) -> str:
+        body = ",".join(m.render() for m in self.matchers)
+        if not self.metric:
+            return "{" + body + "}"
+        return self.metric + ("{" + body + "}" if body else "")
+
+    def matches(self, labels: Dict[str, str]) -> bool:
+        return all(m.matches(labels) for m in self.matchers)
+
+
+def canonical_matcher(label: str, op: str, value: str) -> Optional[Matcher]:
+    """Rewrite a matcher to its simplest equivalent form, None if it matches everything"""
+    if op in ("=~", "!~"):
+        if value == ".*":
+            return None if op == "=~" else Matcher(label, "!~", ".*")
+        if value == ".+":
+            return Matcher(label, "!=" if op == "=~" else "=", "")
+        if not REGEX_META.search(value):
+            return Matcher(label, "=" if op == "=~" else "!=", value)
+    return Matcher(label, op, value)
+
+
+def _parse_matchers(tokens: List[Token], pos: int) -> Tuple[List[Matcher], int]:
+    """Parse label matchers after '{', returns (matchers, position after '}')"""
+    matchers = []
+    while pos < len(tokens) and tokens[pos].text != "}":
+        if tokens[pos].text == ",":
+            pos += 1
+            continue
+        if pos + 2 >= len(tokens) or tokens[pos + 2].kind != "string":
+            raise PromQLError(f"invalid label matcher near {tokens[pos].text!r}")
+        label = tokens[pos].text if tokens[pos].kind != "string" else _unquote(tokens[pos].text)
+        matcher = canonical_matcher(label, tokens[pos + 1].text, _unquote(tokens[pos + 2].text))
+        if matcher:
+            matchers.append(matcher)
+        pos += 3
+    if pos >= len(tokens):
+        raise PromQLError("unterminated label matchers")
+    return matchers, pos + 1
+
+
+def _make_selector(metric: str, matchers: List[Matcher]) -> Selector:
+    # {__name__="foo"} and foo{} are the same selector
+    for matcher in matchers:
+        if matcher.label == "__name__" and matcher.op == "=" and not metric:
+            metric = matcher.value
+            matchers = [m for m in matchers if m is not matcher]
+            break
+    return Selector(metric, tuple(sorted(set(matchers), key=lambda m: (m.label, m.op, m.value))))
+
+
+# --- Canonical form ---
+@dataclass
+class ParsedQuery:
+    canonical: str
+    selectors: List[Selector]
+    template: Optional[str]   # canonical query with its single selector replaced by '$selector'
+
+    @property
+    def selector(self) -> Optional[Selector]:
+        return self.selectors[0] if self.template is not None else None
+
+
+def _grouping_labels(tokens: List[Token], pos: int) -> Tuple[List[Token], int]:
+    """Sorted, deduplicated label list starting at '(' -> (tokens, position after ')')"""
+    labels, pos = [], pos + 1
+    while pos < len(tokens) and tokens[pos].text != ")":
+        if tokens[pos].text != ",":
+            labels.append(tokens[pos].text)
+        pos += 1
+    grouped = [Token("punct", "(")]
+    for i, label in enumerate(sorted(set(labels))):
+        if i:
+            grouped.append(Token("punct", ","))
+        grouped.append(Token("ident", label))
+    grouped.append(Token("group_end", ")"))
+    return grouped, pos + 1
+
+
+def _matching_paren(tokens: List[Token], pos: int) -> int:
+    depth = 0
+    for i in range(pos, len(tokens)):
+        if tokens[i].text == "(":
+            depth += 1
+        elif tokens[i].text == ")":
+            depth -= 1
+            if depth == 0:
+                return i
+    raise PromQLError("unbalanced parentheses")
+
+
+def _normalize(tokens: List[Token], selectors: List[Selector]) -> List[Token]:
+    """Rewrite tokens to canonical form, collecting selectors (each becomes one 'selector' token)"""
+    out: List[Token] = []
+    pos = 0
+    while pos < len(tokens):
+        token = tokens[pos]
+        nxt = tokens[pos + 1] if pos + 1 < len(tokens) else None
+
+        word = token.text.lower() if token.kind == "ident" else None
+        if word in GROUPING_KEYWORDS and nxt and nxt.text == "(":
+            grouped, pos = _grouping_labels(tokens, pos + 1)
+            out.append(Token("keyword", word))
+            out.extend(grouped)
+            continue
+        if word in AGGREGATIONS and nxt and (nxt.text == "(" or nxt.text.lower() in ("by", "without")):
+            pos = _normalize_aggregation(tokens, pos, out, selectors)
+            continue
+        if word in KEYWORDS:
+            out.append(Token("keyword", word))
+            pos += 1
+            continue
+
+        if token.kind == "ident" and not (nxt and nxt.text == "("):
+            # Metric name, optionally with matchers
+            matchers: List[Matcher] = []
+            pos += 1
+            if nxt and nxt.text == "{":
+                matchers, pos = _parse_matchers(tokens, pos + 1)
+            selector = _make_selector(token.text, matchers)
+            selectors.append(selector)
+            out.append(Token("selector", selector.render()))
+            continue
+
+        if token.text == "{":
+            matchers, pos = _parse_matchers(tokens, pos + 1)
+            selector = _make_selector("", matchers)
+            selectors.append(selector)
+            out.append(Token("selector", selector.render()))
+            continue
+
+        if token.kind == "duration":
+            out.append(Token("duration", format_duration(parse_duration(token.text))))
+        elif token.kind == "number":
+            out.append(Token("number", _compact_number(token.text)))
+        elif token.kind == "string":
+            out.append(Token("string", _quote(_unquote(token.text))))
+        else:
+            out.append(token)
+        pos += 1
+    return out
+
+
+def _normalize_aggregation(tokens: List[Token], pos: int, out: List[Token], selectors: List[Selector]) -> int:
+    """Emit 'agg by (labels) (args)' for both 'agg by (l) (args)' and 'agg (args) by (l)'"""
+    out.append(Token("keyword", tokens[pos].text.lower()))
+    pos += 1
+
+    grouping: List[Token] = []
+    if pos < len(tokens) and tokens[pos].text.lower() in ("by", "without"):
+        grouped, after = _grouping_labels(tokens, pos + 1)
+        grouping = [Token("keyword", tokens[pos].text.lower()), *grouped]
+        pos = after
+
+    end = _matching_paren(tokens, pos)
+    body = _normalize(tokens[pos:end + 1], selectors)
+    pos = end + 1
+
+    if not grouping and pos < len(tokens) and tokens[pos].text.lower() in ("by", "without"):
+        grouped, after = _grouping_labels(tokens, pos + 1)
+        grouping = [Token("keyword", tokens[pos].text.lower()), *grouped]
+        pos = after
+
+    out.extend(grouping)
+    out.extend(body)
+    return pos
+
+
+_BINARY_OPS = {"+", "-", "*", "/", "%", "^", "==", "!=", "<", ">", "<=", ">="}
+_OPERAND_END = {"selector", "number", "string", "duration"}
+
+
+def _render(tokens: List[Token]) -> str:
+    """Join tokens with one fixed spacing: binary operators and keywords spaced, nothing else"""
+    parts = []
+    previous: Optional[Token] = None
+    pad_next = False
+    for token in tokens:
+        spaced = (
+            (token.kind == "op" and token.text in _BINARY_OPS and previous is not None
+             and (previous.kind in _OPERAND_END or previous.text in (")", "]")))
+            or (token.kind == "keyword" and token.text not in AGGREGATIONS)
+        )
+        after_grouping = previous is not None and previous.kind == "group_end" and token.text != "("
+        if parts and (spaced or pad_next or after_grouping) and token.text not in (")", ",") and previous.text not in ("(", ","):
+            parts.append(" ")
+        parts.append(token.text)
+        pad_next = spaced
+        previous = token
+    return "".join(parts)
+
+
+def _is_per_series(tokens: List[Token]) -> bool:
+    """True if the only operations around the selector are per-series functions and literals"""
+    for i, token in enumerate(tokens):
+        if token.kind == "keyword" or (token.kind == "op" and token.text in _BINARY_OPS):
+            return False
+        if token.kind == "ident" and i + 1 < len(tokens) and tokens[i + 1].text == "(" and token.text not in PER_SERIES_FUNCTIONS:
+            return False
+    return True
+
+
+def parse_query(query: str) -> ParsedQuery:
+    """
+    Parse a PromQL query into its canonical form.
+
+    Raises:
+        PromQLError: If the query can't be tokenized
+    """
+    selectors: List[Selector] = []
+    tokens = _normalize(tokenize(query), selectors)
+    canonical = _render(tokens)
+
+    template = None
+    if len(selectors) == 1 and _is_per_series(tokens):
+        template = _render([Token("selector", "$selector") if t.kind == "selector" else t for t in tokens])
+    return ParsedQuery(canonical, selectors, template)
+
+
+def canonical_query(query: str) -> str:
+    """Canonical form of a query, the query itself (whitespace-collapsed) if it can't be parsed"""
+    try:
+        return parse_query(query).canonical
+    except PromQLError:
+        return " ".join(str(query).split())
+
+
+@dataclass(frozen=True)
+class Aggregation:
+    """A query that is one aggregation as a whole: 'op modifier (labels) (body)'"""
+    op: str
+    modifier: str              # 'by', 'without' or '' (no grouping)
+    labels: Tuple[str, ...]
+    body: str
+
+    def render(self) -> str:
+        grouping = f" {self.modifier} ({','.join(sorted(set(self.labels)))})" if self.modifier else ""
+        return canonical_query(f"{self.op}{grouping}({self.body})")
+
+
+def split_aggregation(query: str) -> Optional[Aggregation]:
+    """The aggregation the whole query consists of, None if it is anything else (or can't be parsed)"""
+    try:
+        tokens = tokenize(parse_query(query).canonical)
+    except PromQLError:
+        return None
+    if len(tokens) < 3 or tokens[0].kind != "ident" or tokens[0].text not in AGGREGATIONS:
+        return None
+    modifier, labels, pos = "", [], 1
+    if tokens[pos].text in ("by", "without"):
+        modifier, pos = tokens[pos].text, pos + 1
+        while pos < len(tokens) and tokens[pos].text != ")":
+            if tokens[pos].text not in ("(", ","):
+                labels.append(tokens[pos].text)
+            pos += 1
+        pos += 1
+    try:
+        if pos >= len(tokens) or tokens[pos].text != "(" or _matching_paren(tokens, pos) != len(tokens) - 1:
+            return None
+    except PromQLError:
+        return None
+    body = canonical_query(" ".join(token.text for token in tokens[pos + 1:-1]))
+    return Aggregation(tokens[0].text, modifier, tuple(labels), body)
+
+
+# --- Tool call keys ---
+def range_args(args: Dict[str, Any]) -> Tuple[Optional[float], Optional[float], Optional[float]]:
+    """Absolute (start, end, step) of prom_range arguments, None where not absolute"""
+    step = args.get("step")
+    return parse_time(args.get("start")), parse_time(args.get("end")), parse_duration(step) if step not in (None, "") else None
+
+
+def query_key(tool_name: str, args: Dict[str, Any]) -> str:
+    """Stable key of a prom_query/prom_range call: canonical query plus normalized time arguments"""
+    key: Dict[str, Any] = {"tool": tool_name, "query": canonical_query(args.get("query", ""))}
+    for name, value in sorted(args.items()):
+        if name == "query":
+            continue
+        if name in ("start", "end", "time"):
+            parsed = parse_time(value)
+            key[name] = parsed if parsed is not None else value
+        elif name == "step":
+            parsed = parse_duration(value) if value not in (None, "") else None
+            key[name] = parsed if parsed is not None else value
+        else:
+            key[name] = value
+    return json.dumps(key, sort_keys=True, default=str)
+
+
+def is_subset(query: str, of: str) -> bool:
+    """
+    True if every series returned by `query` is also returned, unchanged, by `of`:
+    both apply the same per-series expression to one selector, and `of`'s selector
+    matchers are a subset of `query`'s.
+    """
+    try:
+        narrow, wide = parse_query(query), parse_query(of)
+    except PromQLError:
+        return False
+    if narrow.template is None or narrow.template != wide.template:
+        return False
+    a, b = narrow.selector, wide.selector
+    return a.metric == b.metric and set(b.matchers) <= set(a.matchers)
+
+
+def extra_matchers(query: str, of: str) -> Tuple[Matcher, ...]:
+    """Matchers of `query` that `of` doesn't have (the filter that turns of's result into query's)"""
+    narrow, wide = parse_query(query).selector, parse_query(of).selector
+    return tuple(m for m in narrow.matchers if m not in set(wide.matchers))
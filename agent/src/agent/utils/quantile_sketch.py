@@ -0,0 +1,164 @@
+"""
+Quantile Sketch - Mergeable distribution summaries for results with many series
+
+A question over hundreds of client pods across many managed clusters has too many series
+for per-pod charts or digests. Each cluster's samples are folded into a t-digest style
+sketch (about compression/2 centroids, smallest near the tails), the cluster sketches merge
+into the fleet sketch, and percentiles are read from the centroids. Memory is bounded by
+the compression, not by the number of series or points. Only the top-k series are kept
+individually, as outliers.
+"""
+
+import os
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+
+from agent.utils.prom_result import PromResult, round_significant as _round
+from agent.utils.promql import CLUSTER_LABEL
+
+SKETCH_COMPRESSION = int(os.getenv("SKETCH_COMPRESSION", "100"))
+# The analyzer switches to distribution summaries above this many series
+DISTRIBUTION_SERIES_THRESHOLD = int(os.getenv("DISTRIBUTION_SERIES_THRESHOLD", "50"))
+DISTRIBUTION_TOP_K = int(os.getenv("DISTRIBUTION_TOP_K", "5"))
+
+FLEET = "fleet"
+PERCENTILES = (("p25", 0.25), ("p50", 0.5), ("p75", 0.75), ("p90", 0.9), ("p99", 0.99))
+BUFFER_FACTOR = 10      # Values buffered per centroid before compressing
+
+
+class TDigest:
+    """Merging t-digest: centroids (mean, weight) sized by the arcsine scale function"""
+
+    def __init__(self, compression: int = SKETCH_COMPRESSION):
+        self.compression = compression
+        self.means = np.empty(0)
+        self.weights = np.empty(0)
+        self.min = np.inf
+        self.max = -np.inf
+        self._buffer: List[np.ndarray] = []
+        self._buffered = 0
+
+    @property
+    def count(self) -> float:
+        self._flush()
+        return float(self.weights.sum())
+
+    def update(self, values: np.ndarray):
+        """Add raw samples, NaN and infinities are skipped"""
+        values = np.asarray(values, dtype=np.float64)
+        values = values[np.isfinite(values)]
+        if not len(values):
+            return
+        self.min = min(self.min, float(values.min()))
+        self.max = max(self.max, float(values.max()))
+        self._buffer.append(values)
+        self._buffered += len(values)
+        if self._buffered > BUFFER_FACTOR * self.compression:
+            self._flush()
+
+    def merge(self, other: "TDigest") -> "TDigest":
+        """Fold another sketch into this one"""
+        other._flush()
+        if len(other.weights):
+            self._compress(np.concatenate([self.means, other.means]), np.concatenate([self.weights, other.weights]))
+            self.min, self.max = min(self.min, other.min), max(self.max, other.max)
+        return self
+
+    def _flush(self):
+        if self._buffer:
+            values = np.concatenate(self._buffer)
+            self._buffer, self._buffered = [], 0
+            self._compress(np.concatenate([self.means, values]), np.concatenate([self.weights, np.ones(len(values))]))
+
+    def _compress(self, means: np.ndarray, weights: np.ndarray):
+        """Merge sorted centroids whose quantile midpoints fall in the same unit of the scale function"""
+        order = np.argsort(means, kind="stable")
+        means, weights = means[order], weights[order]
+        total = weights.sum()
+        midpoints = (np.cumsum(weights) - weights / 2) / total
+        # k1 scale: k(q) = compression / (2 pi) * asin(2q - 1), unit steps of k get small near q = 0 and 1
+        k = self.compression / (2 * np.pi) * np.arcsin(2 * midpoints - 1)
+        bins = np.floor(k - k[0]).astype(np.int64)
+        starts = np.flatnonzero(np.r_[True, bins[1:] != bins[:-1]])
+        merged_weights = np.add.reduceat(weights, starts)
+        self.means = np.add.reduceat(means * weights, starts) / merged_weights
+        self.weights = merged_weights
+
+    def quantile(self, q: float) -> Optional[float]:
+        """Estimated value at quantile q, interpolated between centroid midpoints"""
+        self._flush()
+        if not len(self.weights):
+            return None
+        if len(self.weights) == 1:
+            return float(self.means[0])
+        total = self.weights.sum()
+        positions = np.concatenate([[0.0], np.cumsum(self.weights) - self.weights / 2, [total]])
+        centers = np.concatenate([[self.min], self.means, [self.max]])
+        return float(np.interp(q * total, positions, centers))
+
+
+@dataclass
+class DistributionSummary:
+    sketches: Dict[str, TDigest]                        # per cluster, plus the fleet
+    series_counts: Dict[str, int]
+    top: List[Tuple[str, float]] = field(default_factory=list)  # (series, level), highest first
+
+    def percentiles(self, group: str) -> Dict[str, Any]:
+        sketch = self.sketches[group]
+        row: Dict[str, Any] = {"cluster": group, "series": self.series_counts[group], "min": sketch.min}
+        row.update({name: sketch.quantile(q) for name, q in PERCENTILES})
+        row["max"] = sketch.max
+        return row
+
+    def to_rows(self) -> List[Dict[str, Any]]:
+        """One row per cluster and one for the fleet: min, p25..p99, max (a box per row)"""
+        groups = sorted(group for group in self.sketches if group != FLEET) + [FLEET]
+        return [self.percentiles(group) for group in groups if self.series_counts[group]]
+
+    def to_records(self) -> Dict[str, Any]:
+        """Compact form for the analyzer prompt"""
+        rows = [{key: _round(value) if isinstance(value, float) else value for key, value in row.items()} for row in self.to_rows()]
+        return {"percentiles": rows, "top": [{"series": name, "level": _round(level)} for name, level in self.top]}
+
+
+def summarize_distribution(result: PromResult, top_k: int = DISTRIBUTION_TOP_K,
+                           compression: int = SKETCH_COMPRESSION) -> DistributionSummary:
+    """
+    Fold every series into its cluster's sketch and merge them into the fleet sketch.
+
+    A series' level (for the top-k) is its mean over the window, its value for a vector.
+    """
+    sketches: Dict[str, TDigest] = {}
+    counts: Dict[str, int] = {}
+    names, levels = [], []
+    for s in result.series:
+        finite = s.values[np.isfinite(s.values)]
+        if not len(finite):
+            continue
+        cluster = s.metric.get(CLUSTER_LABEL, "unknown")
+        sketches.setdefault(cluster, TDigest(compression)).update(finite)
+        counts[cluster] = counts.get(cluster, 0) + 1
+        names.append(s.name)
+        levels.append(float(finite.mean()))
+
+    fleet = TDigest(compression)
+    for sketch in sketches.values():
+        fleet.merge(sketch)
+    sketches[FLEET] = fleet
+    counts[FLEET] = len(names)
+
+    top: List[Tuple[str, float]] = []
+    if levels:
+        levels_array = np.array(levels)
+        k = min(top_k, len(levels_array))
+        candidates = np.argpartition(-levels_array, k - 1)[:k]
+        top = [(names[i], levels[i]) for i in candidates[np.argsort(-levels_array[candidates])]]
+    return DistributionSummary(sketches, counts, top)
+
+
+def distribution_rows(result: PromResult) -> Tuple[List[Dict[str, Any]], str, List[str]]:
+    """render_recharts dataset of the distribution: a bar group (box) per cluster and the fleet"""
+    rows = summarize_distribution(result).to_rows()
+    return rows, "cluster", [name for name, _ in PERCENTILES]
@@ -0,0 +1,168 @@
+"""
+Query Budget - Keeps prom_range calls within a points budget before they run
+
+The cost of a range query is series x points per series. Points per series follow from
+the time range and step; the series count is probed with a cheap instant count() of the
+same expression (cached for a while, cardinality changes slowly), unless the budget holds
+PROM_PLAUSIBLE_SERIES series at that resolution anyway. Calls over budget get a larger
+step, and if that would leave too few points to be useful, the query is wrapped in topk
+instead. Every adjustment is recorded so the ToolMessage can say what changed.
+"""
+
+import os
+import math
+import time
+import asyncio
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Tuple
+
+from agent.utils.logging_config import get_logger
+from agent.utils.prom_result import parse_prom_response
+from agent.utils.promql import canonical_query, format_duration, range_args
+
+logger = get_logger("query_budget")
+
+PROM_MAX_POINTS_PER_SERIES = int(os.getenv("PROM_MAX_POINTS_PER_SERIES", "2000"))
+PROM_MAX_TOTAL_POINTS = int(os.getenv("PROM_MAX_TOTAL_POINTS", "200000"))
+PROM_MIN_POINTS_PER_SERIES = int(os.getenv("PROM_MIN_POINTS_PER_SERIES", "100"))
+PROM_CARDINALITY_PROBE = os.getenv("PROM_CARDINALITY_PROBE", "true").lower() == "true"
+PROM_PROBE_TTL = float(os.getenv("PROM_PROBE_TTL", "300"))
+PROM_PLAUSIBLE_SERIES = int(os.getenv("PROM_PLAUSIBLE_SERIES", "1000"))  # Probe only if fewer series would fit
+PROM_SCRAPE_INTERVAL = float(os.getenv("PROM_SCRAPE_INTERVAL", "30"))  # Seconds between raw samples, sizes raw fetches
+PROBE_CACHE_SIZE = 256
+
+# Steps the guard rounds up to, so adjusted queries stay readable and cache-friendly
+NICE_STEPS = (15, 30, 60, 120, 300, 600, 900, 1800, 3600, 7200, 10800, 21600, 43200, 86400)
+
+_probe_cache: "OrderedDict[str, Tuple[float, Optional[int]]]" = OrderedDict()
+_budget_stats = {
+    "checked": 0,
+    "probes": 0,
+    "probe_cache_hits": 0,
+    "probes_skipped": 0,
+    "probe_failures": 0,
+    "step_raised": 0,
+    "topk_wrapped": 0,
+}
+
+
+def get_budget_stats() -> dict:
+    """Get query budget statistics for monitoring"""
+    return {**_budget_stats, "probe_cache_size": len(_probe_cache)}
+
+
+def nice_step(seconds: float, round_down: bool = False) -> int:
+    """Smallest readable step of at least the given seconds (largest one of at most, if round_down)"""
+    if round_down:
+        fitting = [step for step in NICE_STEPS if step <= seconds]
+        if seconds < 86400:
+            return fitting[-1] if fitting else NICE_STEPS[0]
+        return int(seconds // 86400 * 86400)
+    for step in NICE_STEPS:
+        if step >= seconds:
+            return step
+    return int(math.ceil(seconds / 86400) * 86400)
+
+
+def points_per_series(span: float, step: float) -> int:
+    return int(span // step) + 1
+
+
+async def probe_series_count(query: str, tool_map: Dict[str, Any], config=None) -> Optional[int]:
+    """Number of series the expression currently returns, via an instant count(); None if unknown"""
+    key = canonical_query(query)
+    cached = _probe_cache.get(key)
+    if cached and time.time() - cached[0] < PROM_PROBE_TTL:
+        _budget_stats["probe_cache_hits"] += 1
+        return cached[1]
+
+    if "prom_query" not in tool_map:
+        return None
+
+    # Imported here, the executor pulls in the MCP client
+    from agent.utils.tool_executor import execute_tool_call
+
+    _budget_stats["probes"] += 1
+    probe = {"name": "prom_query", "args": {"query": f"count({query})"}, "id": f"probe-{abs(hash(key))}"}
+    message = await execute_tool_call(probe, tool_map, config)
+    result = parse_prom_response(message.content)
+    if result is None or result.status != "success":
+        _budget_stats["probe_failures"] += 1
+        logger.warning(f"Cardinality probe failed for {key}: {str(message.content)[:200]}")
+        return None
+
+    # count() of nothing is an empty vector
+    values = [float(s.values[0]) for s in result.series if len(s)]
+    count = int(values[0]) if values else 0
+
+    _probe_cache[key] = (time.time(), count)
+    while len(_probe_cache) > PROBE_CACHE_SIZE:
+        _probe_cache.popitem(last=False)
+    return count
+
+
+async def guard_call(tool_call: Dict[str, Any], tool_map: Dict[str, Any], config=None) -> Tuple[Dict[str, Any], List[str]]:
+    """
+    Fit a prom_range call into the budgets.
+
+    Returns:
+        (possibly adjusted tool call, list of human-readable adjustments)
+    """
+    if tool_call.get("name") != "prom_range":
+        return tool_call, []
+
+    args = tool_call.get("args", {})
+    start, end, step = range_args(args)
+    if start is None or end is None or not step or end < start:
+        return tool_call, []
+
+    _budget_stats["checked"] += 1
+    span = end - start
+    query = args.get("query", "")
+    new_step, new_query, adjustments = step, query, []
+
+    if points_per_series(span, new_step) > PROM_MAX_POINTS_PER_SERIES:
+        new_step = max(nice_step(span / max(PROM_MAX_POINTS_PER_SERIES - 1, 1)), step)
+
+    # No probe round trip when even a plausibly large expression fits at this resolution
+    affordable_series = PROM_MAX_TOTAL_POINTS // points_per_series(span, new_step)
+    probe = PROM_CARDINALITY_PROBE and affordable_series < PROM_PLAUSIBLE_SERIES
+    if PROM_CARDINALITY_PROBE and not probe:
+        _budget_stats["probes_skipped"] += 1
+    series = await probe_series_count(query, tool_map, config) if probe else None
+    if series and series * points_per_series(span, new_step) > PROM_MAX_TOTAL_POINTS:
+        affordable_points = PROM_MAX_TOTAL_POINTS // series
+        if affordable_points >= PROM_MIN_POINTS_PER_SERIES:
+            new_step = max(nice_step(span / max(affordable_points - 1, 1)), new_step)
+        else:
+            # A step that large would flatten the lines, keep the resolution and cut the series instead
+            new_step = max(nice_step(span / max(PROM_MIN_POINTS_PER_SERIES - 1, 1), round_down=True), new_step)
+            k = max(1, PROM_MAX_TOTAL_POINTS // points_per_series(span, new_step))
+            if k < series:
+                new_query = f"topk({k}, {query})"
+                adjustments.append(f"kept the top {k} of {series} series at each step (topk)")
+                _budget_stats["topk_wrapped"] += 1
+
+    if new_step != step:
+        adjustments.insert(0, f"step raised from {format_duration(step)} to {format_duration(new_step)} "
+                              f"({points_per_series(span, step)} -> {points_per_series(span, new_step)} points per series)")
+        _budget_stats["step_raised"] += 1
+
+    if not adjustments:
+        return tool_call, []
+
+    logger.info(f"[PERF] Budget adjusted {tool_call.get('id')}: {'; '.join(adjustments)}")
+    adjusted_args = {**args, "query": new_query, "step": format_duration(new_step)}
+    return {**tool_call, "args": adjusted_args}, adjustments
+
+
+async def apply_query_budget(tool_calls: List[Dict[str, Any]], tool_map: Dict[str, Any], config=None) -> Tuple[List[Dict[str, Any]], Dict[str, List[str]]]:
+    """
+    Fit all prom_range calls into the budgets (probes run concurrently).
+
+    Returns:
+        (tool calls to execute, adjustments per tool_call_id)
+    """
+    guarded = await asyncio.gather(*(guard_call(tool_call, tool_map, config) for tool_call in tool_calls))
+    adjustments = {call["id"]: notes for call, notes in guarded if notes}
+    return [call for call, _ in guarded], adjustments
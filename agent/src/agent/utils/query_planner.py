@@ -0,0 +1,394 @@
+"""
+Query Planner - Reduces a node's Prometheus tool calls before they are executed
+
+Prefix regexes on FL pod names are first pinned to the known pods (see fl_topology), and
+expressions with a recorded series read that series instead (see recording_rules).
+Calls are compared on their canonical PromQL and normalized time arguments:
+- duplicates (same canonical call) are executed once
+- subsets (same per-series expression, stricter matchers, contained time range on the
+  same step grid) are answered from the wider call by filtering its series
+- calls applying window functions (rate, irate, increase, delta, idelta) to the same
+  selector, e.g. rate and increase of container_cpu_usage_seconds_total, share one fetch
+  of the raw samples and are evaluated locally (see counter_eval), unless that fetch
+  (series x span / scrape interval) is over the points budget (see guard_raw_fetches)
+- the remaining calls that apply the same per-series expression over the same time range
+  (e.g. the FL server pods and the client pods) are merged into one query, with a regex
+  matcher when they differ in one label and 'or' otherwise, and the merged result is
+  split back by each call's selector
+
+After execution every original tool call still gets its own ToolMessage, in the original
+order, so routing and the LLM conversation are unchanged.
+"""
+
+import os
+import re
+import math
+import time
+import asyncio
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional, Tuple
+
+from langchain_core.messages import ToolMessage
+
+from agent.utils.counter_eval import cached_raw, evaluate, evaluation_grid, remember_raw
+from agent.utils.fl_topology import pin_pod_selectors
+from agent.utils.recording_rules import use_recorded_series
+from agent.utils.logging_config import get_logger
+from agent.utils.prom_result import PROMETHEUS_TOOLS, cache_prom_result, get_prom_result
+from agent.utils.query_budget import (
+    PROM_CARDINALITY_PROBE, PROM_MAX_TOTAL_POINTS, PROM_PLAUSIBLE_SERIES, PROM_SCRAPE_INTERVAL,
+    points_per_series, probe_series_count,
+)
+from agent.utils.promql import (
+    Matcher, PromQLError, Selector, canonical_matcher, escape_regex, extra_matchers, format_duration, is_subset, parse_duration,
+    parse_query, parse_time, query_key, range_args,
+)
+
+logger = get_logger("query_planner")
+
+QUERY_MERGE = os.getenv("QUERY_MERGE", "true").lower() == "true"
+QUERY_MERGE_MAX = int(os.getenv("QUERY_MERGE_MAX", "8"))  # Calls per merged query
+LOCAL_COUNTER_EVAL = os.getenv("LOCAL_COUNTER_EVAL", "true").lower() == "true"
+LOCAL_EVAL_MAX_WINDOW = float(os.getenv("LOCAL_EVAL_MAX_WINDOW", "10800"))  # Raw samples fetched at most, seconds
+
+_WINDOW_TEMPLATE = re.compile(r"^(rate|irate|increase|delta|idelta)\(\$selector\[([0-9a-z]+)\]\)$")
+
+
+@dataclass
+class Derivation:
+    source_id: str
+    kind: str                                   # 'duplicate', 'subset', 'merged' or 'local_eval'
+    matchers: Tuple[Matcher, ...] = ()          # filter applied to the source series
+    window: Tuple[Optional[float], Optional[float]] = (None, None)
+    evaluation: Optional[Dict[str, Any]] = None # window function evaluated over raw samples
+
+
+@dataclass
+class QueryPlan:
+    original: List[Dict[str, Any]]              # tool calls as requested
+    calls: List[Dict[str, Any]]                 # tool calls to execute
+    derived: Dict[str, Derivation] = field(default_factory=dict)
+    local: Dict[str, ToolMessage] = field(default_factory=dict)  # sources answered without a query
+    raw_fetches: Dict[str, Tuple[str, float]] = field(default_factory=dict)  # raw fetch id -> (selector, span)
+
+
+_planner_stats = {
+    "planned_calls": 0,
+    "executed_calls": 0,
+    "deduplicated": 0,
+    "derived_subsets": 0,
+    "merged_calls": 0,
+    "merged_queries": 0,
+    "local_evaluations": 0,
+    "raw_fetches": 0,
+    "raw_cache_hits": 0,
+    "raw_fetches_over_budget": 0,
+}
+
+
+def get_planner_stats() -> dict:
+    """Get query planner statistics for monitoring"""
+    planned = _planner_stats["planned_calls"]
+    saved = planned - _planner_stats["executed_calls"]
+    return {**_planner_stats, "saved_rate": round(saved / planned, 3) if planned else 0.0}
+
+
+def _time_window(narrow: Dict[str, Any], wide: Dict[str, Any], tool_name: str) -> Optional[Tuple[Optional[float], Optional[float]]]:
+    """Window to cut from the wide call's result, None if it doesn't contain the narrow one"""
+    narrow_args = {k: v for k, v in narrow.items() if k != "query"}
+    wide_args = {k: v for k, v in wide.items() if k != "query"}
+
+    if tool_name != "prom_range":
+        # Instant queries must be evaluated at the same time
+        return (None, None) if query_key(tool_name, {**narrow_args, "query": ""}) == query_key(tool_name, {**wide_args, "query": ""}) else None
+
+    n_start, n_end, n_step = range_args(narrow)
+    w_start, w_end, w_step = range_args(wide)
+    if None in (n_start, n_end, n_step, w_start, w_end, w_step) or n_step != w_step:
+        return None
+    # Range evaluation happens at start + k*step, the narrow grid must be part of the wide one
+    if n_start < w_start or n_end > w_end or (n_start - w_start) % w_step:
+        return None
+    return (n_start, n_end)
+
+
+def plan_tool_calls(tool_calls: List[Dict[str, Any]]) -> QueryPlan:
+    """
+    Plan a node's tool calls: drop duplicates and calls answerable from a wider call.
+
+    Non-Prometheus calls are always executed as requested.
+    """
+    tool_calls = [use_recorded_series(pin_pod_selectors(tool_call)) for tool_call in tool_calls]
+    plan = QueryPlan(original=list(tool_calls), calls=[])
+    by_key: Dict[str, Dict[str, Any]] = {}
+    candidates: List[Dict[str, Any]] = []
+
+    for tool_call in tool_calls:
+        name, args = tool_call.get("name"), tool_call.get("args", {})
+        if name not in PROMETHEUS_TOOLS or not tool_call.get("id") or not isinstance(args.get("query"), str):
+            continue
+        key = query_key(name, args)
+        if key in by_key:
+            plan.derived[tool_call["id"]] = Derivation(by_key[key]["id"], "duplicate")
+            logger.info(f"[PLAN] {name} {tool_call['id']} duplicates {by_key[key]['id']}")
+            continue
+        by_key[key] = tool_call
+        candidates.append(tool_call)
+
+    # A call that is a subset of a root (a call not contained in any other) reads from that root
+    def contains(wide: Dict[str, Any], narrow: Dict[str, Any]):
+        if wide is narrow or wide["name"] != narrow["name"]:
+            return None
+        try:
+            if not is_subset(narrow["args"]["query"], wide["args"]["query"]):
+                return None
+        except PromQLError:
+            return None
+        return _time_window(narrow["args"], wide["args"], narrow["name"])
+
+    roots = [call for call in candidates if not any(contains(other, call) for other in candidates)]
+    for call in candidates:
+        if any(call is root for root in roots):
+            continue
+        for root in roots:
+            window = contains(root, call)
+            if window is not None:
+                matchers = extra_matchers(call["args"]["query"], root["args"]["query"])
+                plan.derived[call["id"]] = Derivation(root["id"], "subset", matchers, window)
+                logger.info(f"[PLAN] {call['name']} {call['id']} is a subset of {root['id']} (filter {[m.render() for m in matchers]})")
+                break
+
+    remaining = [call for call in candidates if call["id"] not in plan.derived]
+    raw_calls = _plan_local_evaluation(remaining, plan) if LOCAL_COUNTER_EVAL else []
+    merged_calls = _merge_calls([call for call in candidates if call["id"] not in plan.derived], plan) if QUERY_MERGE else []
+    plan.calls = [call for call in tool_calls if call.get("id") not in plan.derived] + raw_calls + merged_calls
+
+    _planner_stats["planned_calls"] += len(tool_calls)
+    _planner_stats["executed_calls"] += len(plan.calls)
+    _planner_stats["deduplicated"] += sum(1 for d in plan.derived.values() if d.kind == "duplicate")
+    _planner_stats["derived_subsets"] += sum(1 for d in plan.derived.values() if d.kind == "subset")
+    if plan.derived:
+        logger.info(f"[PERF] Query plan: {len(tool_calls)} calls -> {len(plan.calls)} executed")
+    return plan
+
+
+def _regex_alternative(matcher: Matcher) -> str:
+    """Matcher value as a regex alternative ('=' values are escaped)"""
+    return matcher.value if matcher.op == "=~" else escape_regex(matcher.value)
+
+
+def _merged_selector(selectors: List[Selector]) -> Optional[Selector]:
+    """One selector covering all of them if they differ only in one '='/'=~' label matcher"""
+    common = set.intersection(*(set(s.matchers) for s in selectors))
+    rest = [[m for m in s.matchers if m not in common] for s in selectors]
+    labels = {m.label for ms in rest for m in ms}
+    if len(labels) != 1 or any(len(ms) != 1 or ms[0].op not in ("=", "=~") for ms in rest):
+        return None
+    label = labels.pop()
+    alternatives = list(dict.fromkeys(_regex_alternative(ms[0]) for ms in rest))
+    merged = canonical_matcher(label, "=~", "|".join(alternatives))
+    matchers = sorted(common | ({merged} if merged else set()), key=lambda m: (m.label, m.op, m.value))
+    return Selector(selectors[0].metric, tuple(matchers))
+
+
+def _demux_safe(selector: Selector) -> bool:
+    """The selector can be evaluated locally to split a merged result"""
+    try:
+        for matcher in selector.matchers:
+            if matcher.op in ("=~", "!~"):
+                re.compile(matcher.value)
+        return True
+    except re.error:
+        return False
+
+
+def _merge_calls(calls: List[Dict[str, Any]], plan: QueryPlan) -> List[Dict[str, Any]]:
+    """Merge calls sharing expression and time range into one call each, recording how to split them"""
+    groups: Dict[Tuple[str, str, str, str], List[Tuple[Dict[str, Any], Selector]]] = {}
+    for call in calls:
+        try:
+            parsed = parse_query(call["args"]["query"])
+        except PromQLError:
+            continue
+        if parsed.template is None or not _demux_safe(parsed.selector):
+            continue
+        time_key = query_key(call["name"], {**call["args"], "query": ""})
+        groups.setdefault((call["name"], parsed.template, parsed.selector.metric, time_key), []).append((call, parsed.selector))
+
+    merged_calls = []
+    for (name, template, _, _), members in groups.items():
+        for i in range(0, len(members), QUERY_MERGE_MAX):
+            chunk = members[i:i + QUERY_MERGE_MAX]
+            if len(chunk) < 2:
+                continue
+
+            selectors = [selector for _, selector in chunk]
+            merged_selector = _merged_selector(selectors)
+            if merged_selector is not None:
+                query = template.replace("$selector", merged_selector.render(), 1)
+            else:
+                query = " or ".join(template.replace("$selector", selector.render(), 1) for selector in selectors)
+
+            first = chunk[0][0]
+            merged_call = {**first, "id": f"merged-{first['id']}", "args": {**first["args"], "query": query}}
+            merged_calls.append(merged_call)
+            for call, selector in chunk:
+                plan.derived[call["id"]] = Derivation(merged_call["id"], "merged", selector.matchers)
+
+            _planner_stats["merged_calls"] += len(chunk)
+            _planner_stats["merged_queries"] += 1
+            logger.info(f"[PLAN] Merged {len(chunk)} {name} calls into {merged_call['id']}: {query}")
+    return merged_calls
+
+
+def _window_evaluation(tool_call: Dict[str, Any], now: float) -> Optional[Tuple[str, Dict[str, Any]]]:
+    """(selector, evaluation) of a call that is a bare window function over one selector"""
+    args = tool_call["args"]
+    if set(args) - {"query", "start", "end", "step", "time"}:
+        return None
+    try:
+        parsed = parse_query(args["query"])
+    except PromQLError:
+        return None
+    match = _WINDOW_TEMPLATE.match(parsed.template or "")
+    if not match:
+        return None
+
+    window = parse_duration(match.group(2))
+    if tool_call["name"] == "prom_range":
+        start, end, step = range_args(args)
+        if None in (start, end, step) or step <= 0 or end < start:
+            return None
+    else:
+        # An instant query without a time is pinned to now, like the raw fetch
+        start = end = parse_time(args["time"]) if args.get("time") not in (None, "") else now
+        step = None
+        if end is None:
+            return None
+    if not window:
+        return None
+    return parsed.selector.render(), {"function": match.group(1), "window": window, "start": start, "end": end, "step": step}
+
+
+def _plan_local_evaluation(calls: List[Dict[str, Any]], plan: QueryPlan) -> List[Dict[str, Any]]:
+    """Answer window functions over a shared selector from one raw fetch (or the raw cache)"""
+    now = time.time()
+    groups: Dict[str, List[Tuple[Dict[str, Any], Dict[str, Any]]]] = {}
+    for call in calls:
+        evaluation = _window_evaluation(call, now)
+        if evaluation is not None:
+            groups.setdefault(evaluation[0], []).append((call, evaluation[1]))
+
+    raw_calls = []
+    for selector, members in groups.items():
+        low = min(evaluation["start"] - evaluation["window"] for _, evaluation in members)
+        high = max(evaluation["end"] for _, evaluation in members)
+        if high - low > LOCAL_EVAL_MAX_WINDOW:
+            continue
+
+        first = members[0][0]
+        source_id = f"raw-{first['id']}"
+        cached = cached_raw(selector, low, high)
+        if cached is not None:
+            plan.local[source_id] = ToolMessage(content=cached.to_response_json(), tool_call_id=source_id, name="prom_query")
+            cache_prom_result(source_id, cached)
+            _planner_stats["raw_cache_hits"] += 1
+            raw = None
+            logger.info(f"[PLAN] {len(members)} window functions over {selector} evaluated from cached raw samples")
+        elif len(members) < 2:
+            continue
+        else:
+            span = math.ceil(high - low)
+            raw = (high - span, high)
+            query = f"{selector}[{format_duration(span)}] @ {high:.3f}"
+            raw_calls.append({**first, "name": "prom_query", "id": source_id, "args": {"query": query}})
+            plan.raw_fetches[source_id] = (selector, span)
+            _planner_stats["raw_fetches"] += 1
+            logger.info(f"[PLAN] {len(members)} window functions over {selector} share one raw fetch: {query}")
+
+        for call, evaluation in members:
+            plan.derived[call["id"]] = Derivation(source_id, "local_eval", evaluation={**evaluation, "selector": selector, "raw": raw})
+        _planner_stats["local_evaluations"] += len(members)
+    return raw_calls
+
+
+async def guard_raw_fetches(plan: QueryPlan, tool_map: Dict[str, Any], config=None) -> QueryPlan:
+    """
+    Undo the local evaluations whose raw fetch would exceed the points budget.
+
+    The raw fetch is an instant query, so the query budget never sees it: its cost is
+    estimated here as series (probed like the budget does) x span / scrape interval.
+    Over PROM_MAX_TOTAL_POINTS, the window functions run as the calls that were asked for.
+    """
+    if not plan.raw_fetches or not PROM_CARDINALITY_PROBE:
+        return plan
+    # Like the budget, only probe the fetches that a plausible series count would push over
+    fetch_ids = [fetch_id for fetch_id, (_, span) in plan.raw_fetches.items()
+                 if PROM_MAX_TOTAL_POINTS // points_per_series(span, PROM_SCRAPE_INTERVAL) < PROM_PLAUSIBLE_SERIES]
+    counts = await asyncio.gather(*(probe_series_count(plan.raw_fetches[fetch_id][0], tool_map, config) for fetch_id in fetch_ids))
+
+    for fetch_id, series in zip(fetch_ids, counts):
+        selector, span = plan.raw_fetches[fetch_id]
+        points = (series or 0) * points_per_series(span, PROM_SCRAPE_INTERVAL)
+        if points <= PROM_MAX_TOTAL_POINTS:
+            continue
+        members = {call_id for call_id, derivation in plan.derived.items() if derivation.source_id == fetch_id}
+        for call_id in members:
+            del plan.derived[call_id]
+        del plan.raw_fetches[fetch_id]
+        plan.calls = [call for call in plan.calls if call.get("id") != fetch_id] + [
+            call for call in plan.original if call.get("id") in members
+        ]
+        _planner_stats["raw_fetches_over_budget"] += 1
+        _planner_stats["local_evaluations"] -= len(members)
+        _planner_stats["executed_calls"] += len(members) - 1
+        logger.info(f"[PLAN] Raw fetch of {selector} would return ~{points} points ({series} series), "
+                    f"running its {len(members)} window functions as queries")
+    return plan
+
+
+def _derive_message(tool_call: Dict[str, Any], derivation: Derivation, source: ToolMessage) -> ToolMessage:
+    """Build the ToolMessage of a derived call from its source call's message"""
+    result = get_prom_result(source)
+    if result is None or result.status != "success" or derivation.kind == "duplicate":
+        content = source.content
+        if result is not None:
+            cache_prom_result(tool_call["id"], result)
+    elif derivation.kind == "local_eval":
+        evaluation = derivation.evaluation
+        if evaluation["raw"] is not None:
+            remember_raw(evaluation["selector"], *evaluation["raw"], result)
+        grid = evaluation_grid(evaluation["start"], evaluation["end"], evaluation["step"])
+        derived = evaluate(evaluation["function"], evaluation["window"], result, grid,
+                           "matrix" if evaluation["step"] else "vector")
+        content = derived.to_response_json()
+        cache_prom_result(tool_call["id"], derived)
+    else:
+        matchers = derivation.matchers
+        derived = result.filter(lambda labels: all(m.matches(labels) for m in matchers))
+        if derivation.window != (None, None):
+            derived = derived.slice(*derivation.window)
+        content = derived.to_response_json()
+        cache_prom_result(tool_call["id"], derived)
+
+    return ToolMessage(
+        content=content,
+        tool_call_id=tool_call["id"],
+        name=tool_call.get("name", source.name),
+        additional_kwargs={**source.additional_kwargs, "derived_from": derivation.source_id},
+    )
+
+
+def resolve_plan(plan: QueryPlan, executed: List[ToolMessage]) -> List[ToolMessage]:
+    """One ToolMessage per original tool call, in the original order"""
+    resolved = {**plan.local, **{msg.tool_call_id: msg for msg in executed}}
+    calls_by_id = {tool_call.get("id"): tool_call for tool_call in plan.original}
+
+    def resolve(tool_call_id: str) -> ToolMessage:
+        # A duplicate may point at a call that is itself derived as a subset
+        if tool_call_id not in resolved:
+            derivation = plan.derived[tool_call_id]
+            resolved[tool_call_id] = _derive_message(calls_by_id[tool_call_id], derivation, resolve(derivation.source_id))
+        return resolved[tool_call_id]
+
+    return [resolve(tool_call.get("id")) for tool_call in plan.original]
@@ -0,0 +1,336 @@
+"""
+Recording Rules - Recording-rule advisor mined from the executed query workload
+
+Every prom_query/prom_range the model asks for is logged with its latency and result
+size (internal calls such as budget probes, fan-out probes, prefetches and subscription
+refreshes are not, they would turn into rules of their own). The advisor groups the log
+by expression shape: a window function over one selector (rate(x{...}[5m])), optionally
+aggregated (sum by (pod, cluster_name) (...)). The matchers every occurrence shares stay
+in the rule, the ones that vary (pod, cluster_name, ...) are applied to the recorded
+series at query time. Shapes seen often enough and slow enough on average become
+recording rules (YAML on /recording-rules, and RECORDING_RULES_FILE); each run replaces
+the recommendation with its top RULE_MAX_RULES, so rules the workload stopped needing are
+dropped. The record name ends with a hash of the expression, so a changed expression gets
+a new name and never reads series recorded for the previous one.
+
+A rule is used once its series exist in Prometheus (checked in the background): the
+planner rewrites a matching query to the recorded series with the varying matchers, for
+queries not reading further back than the rule was first seen. Recorded samples sit on
+the rule evaluation interval, so values can lag the raw expression by up to one interval.
+"""
+
+import os
+import re
+import json
+import hashlib
+import time
+import asyncio
+from collections import deque
+from dataclasses import dataclass
+from typing import Any, Dict, List, Optional, Tuple
+
+import yaml
+from langchain_core.messages import ToolMessage
+
+from agent.utils.logging_config import get_logger
+from agent.utils.prom_result import PROMETHEUS_TOOLS, get_prom_result, parse_prom_response
+from agent.utils.promql import Matcher, PromQLError, Selector, canonical_query, parse_query, parse_time
+
+logger = get_logger("recording_rules")
+
+RECORDING_RULES = os.getenv("RECORDING_RULES", "true").lower() == "true"
+RECORDING_RULES_FILE = os.getenv("RECORDING_RULES_FILE", "")
+WORKLOAD_LOG_SIZE = int(os.getenv("WORKLOAD_LOG_SIZE", "5000"))
+WORKLOAD_LOG_FILE = os.getenv("WORKLOAD_LOG_FILE", "")                     # JSONL, survives restarts
+RULE_MIN_COUNT = int(os.getenv("RULE_MIN_COUNT", "5"))
+RULE_MIN_LATENCY = float(os.getenv("RULE_MIN_LATENCY", "0.5"))             # Average seconds per execution
+RULE_MAX_RULES = int(os.getenv("RULE_MAX_RULES", "20"))
+RULE_INTERVAL = os.getenv("RULE_INTERVAL", "1m")
+RULE_ADVISOR_INTERVAL = float(os.getenv("RULE_ADVISOR_INTERVAL", "300"))
+
+RULE_GROUP = "agent-recommended"
+COUNTER_FUNCTIONS = {"rate", "irate", "increase"}
+_WINDOWED = re.compile(r"^([a-z_]+)\(\$selector\[([0-9a-z]+)\]\)$")
+_AGGREGATED = re.compile(r"^(sum|avg|min|max|count)(?: by \(([^)]*)\))?\((.+)\)$")
+_NAME_CHARS = re.compile(r"[^a-zA-Z0-9_:]")
+
+# (aggregation, grouping labels, function, window, metric)
+Shape = Tuple[Optional[str], Tuple[str, ...], str, str, str]
+
+
+@dataclass
+class QueryLogEntry:
+    tool: str
+    query: str        # canonical
+    latency: float
+    series: int
+    points: int
+    at: float
+
+
+@dataclass
+class RecordingRule:
+    name: str
+    expr: str
+    shape: Shape
+    stable: Tuple[Matcher, ...]
+    count: int
+    avg_latency: float
+    available_since: Optional[float] = None
+
+    def to_rule(self) -> Dict[str, str]:
+        return {"record": self.name, "expr": self.expr}
+
+
+_log: "deque[QueryLogEntry]" = deque(maxlen=WORKLOAD_LOG_SIZE)
+_rules: Dict[str, RecordingRule] = {}
+_advisor_task: Optional[asyncio.Task] = None
+_rule_stats = {
+    "logged_queries": 0,
+    "mining_runs": 0,
+    "shapes": 0,
+    "rewrites": 0,
+    "availability_checks": 0,
+}
+
+
+def get_rule_stats() -> dict:
+    """Get workload log and recording rule statistics for monitoring"""
+    return {
+        **_rule_stats,
+        "log_entries": len(_log),
+        "recommended": len(_rules),
+        "available": sum(1 for rule in _rules.values() if rule.available_since),
+        "running": _advisor_task is not None and not _advisor_task.done(),
+    }
+
+
+# --- Workload log ---
+def log_queries(tool_calls: List[Dict[str, Any]], messages: List[ToolMessage]) -> None:
+    """Log the model's Prometheus calls with the latency and result size of their answers"""
+    if not RECORDING_RULES:
+        return
+    by_id = {message.tool_call_id: message for message in messages}
+    for tool_call in tool_calls:
+        message = by_id.get(tool_call.get("id"))
+        if message is not None:
+            log_query(tool_call, message.additional_kwargs.get("timing", {}).get("execution", 0.0), message)
+
+
+def log_query(tool_call: Dict[str, Any], latency: float, message: ToolMessage) -> None:
+    """Log an executed Prometheus call with its latency and result size"""
+    if not RECORDING_RULES or tool_call.get("name") not in PROMETHEUS_TOOLS:
+        return
+    result = get_prom_result(message)
+    if result is None or result.status != "success":
+        return
+    entry = QueryLogEntry(tool_call["name"], canonical_query(tool_call.get("args", {}).get("query", "")),
+                          round(latency, 4), result.series_count, result.point_count, time.time())
+    _log.append(entry)
+    _rule_stats["logged_queries"] += 1
+    if WORKLOAD_LOG_FILE:
+        try:
+            with open(WORKLOAD_LOG_FILE, "a") as f:
+                f.write(json.dumps(entry.__dict__) + "\n")
+        except OSError as e:
+            logger.debug(f"Workload log write failed: {e}")
+
+
+def _load_log() -> None:
+    if not WORKLOAD_LOG_FILE or not os.path.exists(WORKLOAD_LOG_FILE) or _log:
+        return
+    with open(WORKLOAD_LOG_FILE) as f:
+        for line in deque(f, maxlen=WORKLOAD_LOG_SIZE):
+            try:
+                _log.append(QueryLogEntry(**json.loads(line)))
+            except (ValueError, TypeError):
+                continue
+    logger.info(f"Loaded {len(_log)} workload log entries from {WORKLOAD_LOG_FILE}")
+
+
+# --- Mining ---
+def query_shape(query: str) -> Optional[Tuple[Shape, Selector]]:
+    """Shape and selector of a (possibly aggregated) window function over one selector"""
+    try:
+        parsed = parse_query(query)
+    except PromQLError:
+        return None
+    aggregation, grouping = None, ()
+    if parsed.template is None:
+        match = _AGGREGATED.match(parsed.canonical)
+        if not match or len(parsed.selectors) != 1:
+            return None
+        aggregation, labels, inner = match.groups()
+        grouping = tuple(sorted(l for l in (labels or "").split(",") if l))
+        try:
+            parsed = parse_query(inner)
+        except PromQLError:
+            return None
+        if parsed.template is None:
+            return None
+    windowed = _WINDOWED.match(parsed.template)
+    if not windowed:
+        return None
+    return (aggregation, grouping, windowed.group(1), windowed.group(2), parsed.selector.metric), parsed.selector
+
+
+def _expr(shape: Shape, stable: Tuple[Matcher, ...]) -> str:
+    aggregation, grouping, function, window, metric = shape
+    inner = f"{function}({Selector(metric, stable).render()}[{window}])"
+    if aggregation is None:
+        return canonical_query(inner)
+    return canonical_query(f"{aggregation} by ({','.join(grouping)}) ({inner})")
+
+
+def _rule_name(shape: Shape, stable: Tuple[Matcher, ...]) -> str:
+    """level:metric:operations (the Prometheus naming convention), operations ending with a hash of the expression"""
+    aggregation, grouping, function, window, metric = shape
+    if function in COUNTER_FUNCTIONS and metric.endswith("_total"):
+        metric = metric[:-len("_total")]
+    if aggregation is None:
+        job = next((m.value for m in stable if m.label == "job" and m.op == "="), "")
+        level = job or "series"
+        operations = f"{function}{window}"
+    else:
+        level = "_".join(grouping) or "all"
+        operations = f"{function}{window}" if aggregation == "sum" else f"{aggregation}_{function}{window}"
+    digest = hashlib.sha1(_expr(shape, stable).encode()).hexdigest()[:8]
+    return _NAME_CHARS.sub("_", f"{level}:{metric}:{operations}_{digest}")
+
+
+def mine_workload(entries: List[QueryLogEntry]) -> List[RecordingRule]:
+    """Recording rules for the frequent, slow shapes, costliest (total latency) first"""
+    groups: Dict[Shape, List[Tuple[QueryLogEntry, Selector]]] = {}
+    for entry in entries:
+        shaped = query_shape(entry.query)
+        if shaped:
+            groups.setdefault(shaped[0], []).append((entry, shaped[1]))
+    _rule_stats["shapes"] = len(groups)
+
+    rules = []
+    for shape, occurrences in groups.items():
+        latencies = [entry.latency for entry, _ in occurrences]
+        avg_latency = sum(latencies) / len(latencies)
+        if len(occurrences) < RULE_MIN_COUNT or avg_latency < RULE_MIN_LATENCY:
+            continue
+        # Matchers every occurrence has go into the rule, the others are applied to its series
+        stable = set.intersection(*(set(selector.matchers) for _, selector in occurrences))
+        stable = tuple(sorted(stable, key=lambda m: (m.label, m.op, m.value)))
+        rules.append(RecordingRule(_rule_name(shape, stable), _expr(shape, stable), shape, stable, len(occurrences), round(avg_latency, 3)))
+
+    rules.sort(key=lambda rule: -rule.count * rule.avg_latency)
+    unique: Dict[str, RecordingRule] = {}
+    for rule in rules:
+        unique.setdefault(rule.name, rule)
+    return list(unique.values())[:RULE_MAX_RULES]
+
+
+def rules_yaml(rules: Optional[List[RecordingRule]] = None) -> str:
+    """Prometheus rule file with the recommended recording rules"""
+    rules = list(_rules.values()) if rules is None else rules
+    document = {"groups": [{"name": RULE_GROUP, "interval": RULE_INTERVAL, "rules": [rule.to_rule() for rule in rules]}]}
+    return yaml.safe_dump(document, sort_keys=False)
+
+
+# --- Planner rewrite ---
+def use_recorded_series(tool_call: Dict[str, Any]) -> Dict[str, Any]:
+    """The tool call reading a recorded series instead of evaluating the expression (same call if none applies)"""
+    args = tool_call.get("args", {})
+    if not RECORDING_RULES or tool_call.get("name") not in PROMETHEUS_TOOLS or not isinstance(args.get("query"), str):
+        return tool_call
+    available = [rule for rule in _rules.values() if rule.available_since]
+    shaped = query_shape(args["query"]) if available else None
+    if not shaped:
+        return tool_call
+
+    shape, selector = shaped
+    earliest = parse_time(args.get("start") if tool_call["name"] == "prom_range" else args.get("time"))
+    earliest = earliest if earliest is not None else time.time()
+    for rule in available:
+        if rule.shape != shape or earliest < rule.available_since or not set(rule.stable) <= set(selector.matchers):
+            continue
+        varying = tuple(m for m in selector.matchers if m not in rule.stable)
+        # After aggregation only the grouping labels are left to filter on
+        if shape[0] is not None and any(m.label not in shape[1] for m in varying):
+            continue
+        query = Selector(rule.name, varying).render()
+        _rule_stats["rewrites"] += 1
+        logger.info(f"[PLAN] {tool_call.get('id')} reads recorded series {query}")
+        return {**tool_call, "args": {**args, "query": query}}
+    return tool_call
+
+
+# --- Background advisor ---
+async def _check_available(tool_map: Dict[str, Any]) -> None:
+    """Mark rules whose recorded series exist in Prometheus"""
+    from agent.utils.tool_executor import execute_tool_call
+
+    for rule in [rule for rule in _rules.values() if not rule.available_since]:
+        _rule_stats["availability_checks"] += 1
+        message = await execute_tool_call({"name": "prom_query", "args": {"query": f"count({rule.name})"}, "id": f"rule-{rule.name}"}, tool_map)
+        result = parse_prom_response(str(message.content))
+        if result is not None and result.status == "success" and result.series:
+            rule.available_since = time.time()
+            logger.info(f"Recorded series {rule.name} is available, matching queries will read it")
+
+
+async def run_advisor() -> None:
+    """Mine the workload log, publish the rules and check which ones are recorded"""
+    from agent.tools.mcp_tool import get_mcp_tools_with_persistent_sessions, get_tool_server
+    from agent.utils.prom_federation import federate_tools
+
+    _load_log()
+    mined = mine_workload(list(_log))[:RULE_MAX_RULES]
+    _rule_stats["mining_runs"] += 1
+    # The recommendation is the current mined set: rules the workload no longer needs are dropped
+    previous = dict(_rules)
+    _rules.clear()
+    for rule in mined:
+        # The name stands for the expression, a known rule keeps its availability
+        known = previous.get(rule.name)
+        if known:
+            rule.available_since = known.available_since
+        _rules[rule.name] = rule
+    if RECORDING_RULES_FILE and (_rules or previous):
+        with open(RECORDING_RULES_FILE, "w") as f:
+            f.write(rules_yaml())
+
+    if any(not rule.available_since for rule in _rules.values()):
+        server = get_tool_server("prom_query")
+        tools = await get_mcp_tools_with_persistent_sessions(servers=[server] if server else None)
+        tool_map = federate_tools({tool.name: tool for tool in tools})
+        if "prom_query" in tool_map:
+            await _check_available(tool_map)
+    logger.info(f"[PERF] Recording rule advisor: {len(_log)} logged queries, {len(_rules)} rules recommended")
+
+
+async def _advisor_loop() -> None:
+    while True:
+        await asyncio.sleep(RULE_ADVISOR_INTERVAL)
+        try:
+            await run_advisor()
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.warning(f"Recording rule advisor failed: {e}")
+
+
+def start_rule_advisor() -> Optional[asyncio.Task]:
+    """Start the background advisor loop (no-op if disabled or already running)"""
+    global _advisor_task
+    if not RECORDING_RULES:
+        return None
+    if _advisor_task is None or _advisor_task.done():
+        _advisor_task = asyncio.create_task(_advisor_loop())
+    return _advisor_task
+
+
+async def stop_rule_advisor() -> None:
+    global _advisor_task
+    if _advisor_task and not _advisor_task.done():
+        _advisor_task.cancel()
+        try:
+            await _advisor_task
+        except asyncio.CancelledError:
+            pass
+    _advisor_task = None
@@ -0,0 +1,149 @@
+"""
+Series Align - Snaps Prometheus series onto one common step grid
+
+Managed clusters scrape at different offsets, so raw timestamps of series from different
+clusters rarely coincide. Every series is resampled onto the same grid (multiples of the
+step) with linear interpolation, last-observation-carried-forward or nearest sample, and
+a grid point further than the staleness limit from real samples stays empty. Each series
+is resampled with a handful of vectorized passes, no per-point Python loops.
+"""
+
+import os
+from dataclasses import dataclass
+from typing import List, Optional
+
+import numpy as np
+
+from agent.utils.prom_result import PromSeries
+
+ALIGN_METHODS = ("linear", "locf", "nearest")
+
+CHART_ALIGN_METHOD = os.getenv("CHART_ALIGN_METHOD", "linear")
+# Same default as the Prometheus lookback delta: older samples don't count as current
+CHART_ALIGN_STALENESS = float(os.getenv("CHART_ALIGN_STALENESS", "300"))
+CHART_MAX_POINTS = int(os.getenv("CHART_MAX_POINTS", "1000"))
+
+
+@dataclass
+class AlignedSeries:
+    grid: np.ndarray     # shape (points,), grid timestamps
+    values: np.ndarray   # shape (points, series), NaN where a series has no current sample
+
+    def __len__(self) -> int:
+        return len(self.grid)
+
+
+def infer_step(series: List[PromSeries]) -> Optional[float]:
+    """Median sample interval across all series, None if no series has two samples"""
+    diffs = [np.diff(s.timestamps) for s in series if len(s) > 1]
+    if not diffs:
+        return None
+    diffs = np.concatenate(diffs)
+    diffs = diffs[diffs > 0]
+    return float(np.median(diffs)) if len(diffs) else None
+
+
+def make_grid(start: float, end: float, step: float, max_points: int = CHART_MAX_POINTS) -> np.ndarray:
+    """Grid of step multiples covering [start, end], with the step raised to stay within max_points"""
+    points = int((end - start) // step) + 1
+    if max_points > 0 and points > max_points:
+        step *= int(np.ceil(points / max_points))
+    first = np.floor(start / step) * step
+    return np.arange(first, end + step / 2, step)
+
+
+def resample(timestamps: np.ndarray, values: np.ndarray, grid: np.ndarray,
+             method: str = CHART_ALIGN_METHOD, staleness: float = CHART_ALIGN_STALENESS) -> np.ndarray:
+    """
+    Resample one series onto the grid.
+
+    Args:
+        timestamps: Sorted sample timestamps
+        values: Sample values, non-finite samples are treated as missing
+        grid: Sorted grid timestamps
+        method: 'linear', 'locf' (last observation carried forward) or 'nearest'
+        staleness: Maximum distance in seconds between a grid point and the sample(s) it uses
+
+    Returns:
+        Values on the grid, NaN where no sample is close enough
+    """
+    if method not in ALIGN_METHODS:
+        raise ValueError(f"Unknown alignment method '{method}', expected one of {ALIGN_METHODS}")
+
+    finite = np.isfinite(values)
+    if not finite.all():
+        timestamps, values = timestamps[finite], values[finite]
+
+    out = np.full(len(grid), np.nan)
+    if not len(timestamps):
+        return out
+
+    # Index of the last sample at or before each grid point, and the first one after it
+    prev = np.searchsorted(timestamps, grid, side="right") - 1
+    has_prev = prev >= 0
+    nxt = prev + 1
+    has_next = nxt < len(timestamps)
+    prev_c = np.clip(prev, 0, len(timestamps) - 1)
+    next_c = np.clip(nxt, 0, len(timestamps) - 1)
+
+    prev_age = np.where(has_prev, grid - timestamps[prev_c], np.inf)
+    next_age = np.where(has_next, timestamps[next_c] - grid, np.inf)
+    prev_fresh = prev_age <= staleness
+
+    if method == "locf":
+        out[prev_fresh] = values[prev_c[prev_fresh]]
+
+    elif method == "nearest":
+        use_next = next_age < prev_age
+        nearest_age = np.minimum(prev_age, next_age)
+        chosen = np.where(use_next, next_c, prev_c)
+        ok = nearest_age <= staleness
+        out[ok] = values[chosen[ok]]
+
+    else:
+        # Interpolate between neighbours that are both fresh, otherwise carry the previous sample
+        gap = np.where(has_prev & has_next, timestamps[next_c] - timestamps[prev_c], np.inf)
+        interpolate = has_prev & has_next & (gap <= staleness) & (prev_age > 0)
+        carry = prev_fresh & ~interpolate
+        out[carry] = values[prev_c[carry]]
+
+        weight = prev_age[interpolate] / gap[interpolate]
+        lo, hi = values[prev_c[interpolate]], values[next_c[interpolate]]
+        out[interpolate] = lo + (hi - lo) * weight
+
+    return out
+
+
+def align_series(series: List[PromSeries], step: Optional[float] = None, method: str = CHART_ALIGN_METHOD,
+                 staleness: Optional[float] = None, max_points: int = CHART_MAX_POINTS) -> AlignedSeries:
+    """
+    Align series onto one common grid.
+
+    Args:
+        series: Series to align, e.g. PromResult.series
+        step: Grid step in seconds, inferred from the sample intervals if omitted
+        method: 'linear', 'locf' or 'nearest'
+        staleness: Staleness limit in seconds, defaults to CHART_ALIGN_STALENESS (at least one step)
+        max_points: Upper bound on grid points, the step is raised to respect it
+
+    Returns:
+        AlignedSeries with one column per input series (in input order)
+    """
+    populated = [s for s in series if len(s)]
+    if not populated:
+        return AlignedSeries(np.empty(0), np.empty((0, len(series))))
+
+    start = min(float(s.timestamps[0]) for s in populated)
+    end = max(float(s.timestamps[-1]) for s in populated)
+    step = step or infer_step(populated) or 1.0
+    grid = make_grid(start, end, step, max_points)
+
+    if staleness is None:
+        grid_step = float(grid[1] - grid[0]) if len(grid) > 1 else step
+        staleness = max(CHART_ALIGN_STALENESS, grid_step)
+
+    values = np.full((len(grid), len(series)), np.nan)
+    for column, s in enumerate(series):
+        if len(s):
+            values[:, column] = resample(s.timestamps, s.values, grid, method, staleness)
+    return AlignedSeries(grid, values)
@@ -0,0 +1,487 @@
+"""
+Series Store - Embedded time-series store for recently fetched prom_range results
+
+Range results are kept per (canonical query, step): their points sit on the evaluation
+grid (start + k*step), so timestamps are implicit and each series is one column of a
+ring buffer that keeps the newest STORE_SERIES_CAPACITY points. A follow-up range query
+over the same expression is answered from the store when the grid covers it (also for a
+step that is a multiple of the stored one), or with a delta fetch of only the points
+after the stored ones.
+
+Memory is capped: idle entries are compressed first (XOR of consecutive values, like
+Gorilla, then zlib), then spilled to an mmap'd file if STORE_SPILL_DIR is set, and the
+least recently accessed entries are evicted last. The newest points of a fetch may still
+change (late scrapes), so the last STORE_MUTABLE_WINDOW seconds are never served locally.
+"""
+
+import os
+import time
+import zlib
+import hashlib
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+from langchain_core.messages import ToolMessage
+
+from agent.utils.logging_config import get_logger
+from agent.utils.prom_result import PromResult, PromSeries, cache_prom_result, get_prom_result, intern_labels
+from agent.utils.promql import canonical_query, format_duration, range_args
+
+logger = get_logger("series_store")
+
+SERIES_STORE = os.getenv("SERIES_STORE", "true").lower() == "true"
+STORE_MAX_BYTES = int(os.getenv("STORE_MAX_BYTES", str(64 * 1024 * 1024)))
+STORE_SERIES_CAPACITY = int(os.getenv("STORE_SERIES_CAPACITY", "11000"))  # Prometheus' points-per-series limit
+STORE_MUTABLE_WINDOW = float(os.getenv("STORE_MUTABLE_WINDOW", "120"))
+STORE_COMPRESS_AFTER = float(os.getenv("STORE_COMPRESS_AFTER", "60"))
+STORE_SPILL_DIR = os.getenv("STORE_SPILL_DIR", "")
+STORE_SPILL_MAX_BYTES = int(os.getenv("STORE_SPILL_MAX_BYTES", str(512 * 1024 * 1024)))
+
+
+# --- Compression ---
+def xor_compress(matrix: np.ndarray) -> bytes:
+    """XOR each value with its predecessor in the same series (column), then deflate"""
+    bits = np.ascontiguousarray(matrix.T).view(np.uint64)
+    xored = bits.copy()
+    xored[:, 1:] = np.bitwise_xor(bits[:, 1:], bits[:, :-1])
+    return zlib.compress(xored.tobytes(), 1)
+
+
+def xor_decompress(blob: bytes, shape: Tuple[int, int]) -> np.ndarray:
+    rows, columns = shape
+    xored = np.frombuffer(zlib.decompress(blob), dtype=np.uint64).reshape(columns, rows)
+    return np.bitwise_xor.accumulate(xored, axis=1).view(np.float64).T.copy()
+
+
+# --- Ring buffer ---
+class RingMatrix:
+    """Per-series rings sharing one head: rows are grid points (oldest first), columns series"""
+
+    def __init__(self, max_capacity: int, columns: int = 0):
+        self.max_capacity = max_capacity
+        self._data = np.full((0, columns), np.nan)
+        self._head = 0  # Row of the oldest point
+        self.length = 0
+
+    @property
+    def capacity(self) -> int:
+        return self._data.shape[0]
+
+    @property
+    def columns(self) -> int:
+        return self._data.shape[1]
+
+    @property
+    def nbytes(self) -> int:
+        return self._data.nbytes
+
+    def add_columns(self, count: int) -> None:
+        self._data = np.hstack([self._data, np.full((self.capacity, count), np.nan)])
+
+    def _reserve(self, rows: int) -> None:
+        """Grow (doubling, up to max_capacity) so that rows fit without overwriting"""
+        if rows <= self.capacity or self.capacity >= self.max_capacity:
+            return
+        capacity = min(self.max_capacity, max(rows, 2 * self.capacity, 64))
+        data = np.full((capacity, self.columns), np.nan)
+        data[:self.length] = self.matrix()
+        self._data, self._head = data, 0
+
+    def extend(self, rows: np.ndarray) -> int:
+        """Append rows, overwriting the oldest ones when full. Returns the number of rows dropped"""
+        self._reserve(self.length + len(rows))
+        if len(rows) >= self.capacity:
+            dropped = self.length + len(rows) - self.capacity
+            self._data[:] = rows[-self.capacity:]
+            self._head, self.length = 0, self.capacity
+            return dropped
+
+        tail = (self._head + self.length) % self.capacity
+        first = min(len(rows), self.capacity - tail)
+        self._data[tail:tail + first] = rows[:first]
+        self._data[:len(rows) - first] = rows[first:]
+
+        dropped = max(0, self.length + len(rows) - self.capacity)
+        self._head = (self._head + dropped) % self.capacity
+        self.length = min(self.capacity, self.length + len(rows))
+        return dropped
+
+    def truncate(self, rows: int) -> None:
+        """Drop the newest rows"""
+        self.length = max(0, self.length - rows)
+
+    def matrix(self) -> np.ndarray:
+        """Rows in time order (a view when they don't wrap around)"""
+        end = self._head + self.length
+        if end <= self.capacity:
+            return self._data[self._head:end]
+        return np.concatenate([self._data[self._head:], self._data[:end - self.capacity]])
+
+
+# --- Store entries ---
+@dataclass
+class StoreEntry:
+    key: str
+    query: str
+    step: float
+    labels: List[Dict[str, str]]
+    end_ts: float                   # grid timestamp of the newest stored point
+    final_until: float              # points after this may still change
+    ring: Optional[RingMatrix] = None
+    compressed: Optional[bytes] = None
+    spill_path: Optional[str] = None
+    length: int = 0
+    last_access: float = field(default_factory=time.time)
+
+    @property
+    def first_ts(self) -> float:
+        return self.end_ts - (self.length - 1) * self.step
+
+    @property
+    def memory_bytes(self) -> int:
+        if self.ring is not None:
+            return self.ring.nbytes
+        return len(self.compressed) if self.compressed is not None else 0
+
+    @property
+    def state(self) -> str:
+        return "ring" if self.ring is not None else "compressed" if self.compressed is not None else "spilled"
+
+    def matrix(self) -> np.ndarray:
+        """All stored points (rows) x series (columns), read-only for non-ring states"""
+        if self.ring is not None:
+            return self.ring.matrix()
+        if self.compressed is not None:
+            return xor_decompress(self.compressed, (self.length, len(self.labels)))
+        return np.load(self.spill_path, mmap_mode="r")
+
+    def hydrate(self) -> RingMatrix:
+        """Bring the entry back into an appendable ring"""
+        if self.ring is None:
+            matrix = np.asarray(self.matrix())
+            ring = RingMatrix(STORE_SERIES_CAPACITY, len(self.labels))
+            ring.extend(matrix)
+            self._drop_cold()
+            self.ring = ring
+        return self.ring
+
+    def compress(self) -> None:
+        if self.ring is not None:
+            self.compressed = xor_compress(self.ring.matrix())
+            self.ring = None
+            _store_stats["compressions"] += 1
+
+    def spill(self) -> None:
+        matrix = np.asarray(self.matrix())
+        path = os.path.join(STORE_SPILL_DIR, f"{hashlib.sha1(self.key.encode()).hexdigest()}.npy")
+        np.save(path, matrix)
+        self.ring, self.compressed = None, None
+        self.spill_path = path
+        _store_stats["spills"] += 1
+
+    def _drop_cold(self) -> None:
+        if self.spill_path and os.path.exists(self.spill_path):
+            os.remove(self.spill_path)
+        self.compressed, self.spill_path = None, None
+
+
+_entries: "OrderedDict[str, StoreEntry]" = OrderedDict()  # Least recently accessed first
+_store_stats = {
+    "lookups": 0,
+    "full_hits": 0,
+    "delta_hits": 0,
+    "misses": 0,
+    "points_served": 0,
+    "points_fetched": 0,
+    "compressions": 0,
+    "spills": 0,
+    "evictions": 0,
+}
+
+
+def get_store_stats() -> dict:
+    """Get series store statistics for monitoring"""
+    lookups = _store_stats["lookups"]
+    hits = _store_stats["full_hits"] + _store_stats["delta_hits"]
+    return {
+        **_store_stats,
+        "hit_ratio": round(hits / lookups, 3) if lookups else 0.0,
+        "entries": len(_entries),
+        "memory_bytes": sum(entry.memory_bytes for entry in _entries.values()),
+        "spilled_entries": sum(1 for entry in _entries.values() if entry.state == "spilled"),
+    }
+
+
+def _entry_key(query: str, step: float) -> str:
+    return f"{canonical_query(query)}|{format_duration(step)}"
+
+
+def _label_key(labels: Dict[str, str]) -> Tuple[Tuple[str, str], ...]:
+    return tuple(sorted(labels.items()))
+
+
+def _grid_matrix(result: PromResult, start: float, step: float, count: int, labels: List[Dict[str, str]]) -> np.ndarray:
+    """Place the result's points on the grid start + k*step, columns in the order of labels"""
+    columns = {_label_key(l): i for i, l in enumerate(labels)}
+    matrix = np.full((count, len(labels)), np.nan)
+    for s in result.series:
+        rows = np.rint((s.timestamps - start) / step).astype(np.int64)
+        inside = (rows >= 0) & (rows < count)
+        matrix[rows[inside], columns[_label_key(s.metric)]] = s.values[inside]
+    return matrix
+
+
+def _enforce_limits() -> None:
+    """Compress idle entries, then spill or evict the least recently accessed ones, until under the cap"""
+    now = time.time()
+    for entry in _entries.values():
+        if entry.ring is not None and now - entry.last_access > STORE_COMPRESS_AFTER:
+            entry.compress()
+
+    def total() -> int:
+        return sum(entry.memory_bytes for entry in _entries.values())
+
+    for entry in list(_entries.values()):
+        if total() <= STORE_MAX_BYTES:
+            break
+        entry.compress()
+
+    for key, entry in list(_entries.items()):
+        if total() <= STORE_MAX_BYTES:
+            break
+        if entry.state == "spilled":
+            continue
+        if STORE_SPILL_DIR:
+            os.makedirs(STORE_SPILL_DIR, exist_ok=True)
+            entry.spill()
+        else:
+            _evict(key)
+
+    if STORE_SPILL_DIR:
+        spilled = [(key, e) for key, e in _entries.items() if e.state == "spilled"]
+        spill_bytes = sum(os.path.getsize(e.spill_path) for _, e in spilled if os.path.exists(e.spill_path))
+        for key, entry in spilled:
+            if spill_bytes <= STORE_SPILL_MAX_BYTES:
+                break
+            spill_bytes -= os.path.getsize(entry.spill_path) if os.path.exists(entry.spill_path) else 0
+            _evict(key)
+
+
+def _evict(key: str) -> None:
+    entry = _entries.pop(key)
+    entry._drop_cold()
+    _store_stats["evictions"] += 1
+
+
+def store_result(query: str, start: float, end: float, step: float, result: PromResult, fetched_at: Optional[float] = None) -> None:
+    """Add a range result to the store, appending to the entry when it continues it"""
+    if not SERIES_STORE or result.status != "success" or result.result_type != "matrix":
+        return
+
+    fetched_at = fetched_at or time.time()
+    key = _entry_key(query, step)
+    entry = _entries.get(key)
+
+    # Only a continuation of the stored grid is appended, anything else replaces the entry
+    continues = (
+        entry is not None
+        and abs(((start - entry.first_ts) / step) - round((start - entry.first_ts) / step)) < 1e-6
+        and entry.first_ts <= start <= entry.end_ts + step
+        and end >= entry.end_ts
+    )
+
+    if not continues:
+        grid_end = start + int((end - start) // step) * step
+        count = int((grid_end - start) // step) + 1
+        labels = [s.metric for s in result.series]
+        ring = RingMatrix(STORE_SERIES_CAPACITY, len(labels))
+        ring.extend(_grid_matrix(result, start, step, count, labels))
+        if entry is not None:
+            entry._drop_cold()
+        entry = StoreEntry(key, canonical_query(query), step, labels, grid_end, fetched_at - STORE_MUTABLE_WINDOW, ring, length=ring.length)
+        _entries[key] = entry
+    else:
+        ring = entry.hydrate()
+        known = {_label_key(l) for l in entry.labels}
+        new_labels = [s.metric for s in result.series if _label_key(s.metric) not in known]
+        if new_labels:
+            entry.labels.extend(new_labels)
+            ring.add_columns(len(new_labels))
+
+        # Re-write from the fetch start: that replaces the not-yet-final tail with fresh points
+        overlap = int(round((entry.end_ts - start) / step)) + 1 if start <= entry.end_ts else 0
+        ring.truncate(overlap)
+        grid_end = start + int((end - start) // step) * step
+        count = int(round((grid_end - start) / step)) + 1
+        ring.extend(_grid_matrix(result, start, step, count, entry.labels))
+        entry.end_ts = grid_end
+        entry.length = ring.length
+        entry.final_until = fetched_at - STORE_MUTABLE_WINDOW
+
+    entry.last_access = time.time()
+    _entries.move_to_end(key)
+    _store_stats["points_fetched"] += result.point_count
+    _enforce_limits()
+
+
+@dataclass
+class StoreHit:
+    kind: str                           # 'full' or 'delta'
+    result: Optional[PromResult] = None     # for a delta: the stored history before fetch_start
+    fetch_start: Optional[float] = None
+
+
+def _read(entry: StoreEntry, start: float, end: float, step: float) -> PromResult:
+    """Stored points on the requested grid within [start, end]"""
+    every = int(round(step / entry.step))
+    first_row = int(np.ceil((start - entry.first_ts) / entry.step - 1e-9))
+    last_row = int(np.floor((end - entry.first_ts) / entry.step + 1e-9))
+    rows = np.arange(max(first_row, 0), min(last_row, entry.length - 1) + 1)
+    if every > 1 and len(rows):
+        # Coarser steps read every k-th stored point, on the grid of the requested start
+        rows = rows[(rows - rows[0]) % every == 0]
+
+    matrix = np.asarray(entry.matrix())[rows]
+    timestamps = entry.first_ts + rows * entry.step
+    series = []
+    for column, labels in enumerate(entry.labels):
+        values = matrix[:, column]
+        present = ~np.isnan(values)
+        if present.any():
+            series.append(PromSeries(intern_labels(labels), timestamps[present].astype(np.float64), values[present].copy()))
+    return PromResult("success", "matrix", series)
+
+
+def lookup(query: str, start: float, end: float, step: float, include_mutable: bool = False) -> Optional[StoreHit]:
+    """
+    Find stored points for a range query.
+
+    Args:
+        include_mutable: Also serve the newest, not yet final points (right after fetching them)
+
+    Returns:
+        'full' hit with the result, 'delta' hit with the start of the missing tail, or None
+    """
+    if not SERIES_STORE:
+        return None
+    if not include_mutable:
+        _store_stats["lookups"] += 1
+
+    canonical = canonical_query(query)
+    # Stored points answer the request only on the same grid: the step a multiple of the
+    # stored one and the start on a stored timestamp, (start - first_ts) % step == 0
+    candidates = [e for e in _entries.values() if e.query == canonical and step >= e.step
+                  and abs(step / e.step - round(step / e.step)) < 1e-9
+                  and abs((start - e.first_ts) / e.step - round((start - e.first_ts) / e.step)) < 1e-6]
+    candidates.sort(key=lambda e: -e.step)
+
+    for entry in candidates:
+        usable_end = entry.end_ts if include_mutable else min(entry.end_ts, entry.final_until)
+        if start < entry.first_ts or start > usable_end:
+            continue
+        entry.last_access = time.time()
+        _entries.move_to_end(entry.key)
+
+        if end <= usable_end:
+            result = _read(entry, start, end, step)
+            if not include_mutable:
+                _store_stats["full_hits"] += 1
+                _store_stats["points_served"] += result.point_count
+            return StoreHit("full", result)
+
+        if step == entry.step:
+            # Fetch only what's missing: the points after the last final one, on the stored grid
+            last_final = entry.first_ts + int((usable_end - entry.first_ts) // entry.step) * entry.step
+            _store_stats["delta_hits"] += 1
+            return StoreHit("delta", _read(entry, start, last_final, step), fetch_start=last_final + entry.step)
+
+    if not include_mutable:
+        _store_stats["misses"] += 1
+    return None
+
+
+# --- Tool node integration ---
+def plan_store_reads(tool_calls: List[Dict[str, Any]]) -> Tuple[List[Dict[str, Any]], List[ToolMessage], Dict[str, Dict[str, Any]]]:
+    """
+    Answer prom_range calls from the store where possible.
+
+    Returns:
+        (calls to execute, messages answered locally, original args and stored history of calls
+        turned into delta fetches)
+    """
+    remaining, local, deltas = [], [], {}
+    for tool_call in tool_calls:
+        args = tool_call.get("args", {})
+        start, end, step = range_args(args) if tool_call.get("name") == "prom_range" else (None, None, None)
+        hit = lookup(args.get("query", ""), start, end, step) if None not in (start, end, step) else None
+
+        if hit and hit.kind == "full":
+            logger.info(f"[PERF] {tool_call['id']} answered from the series store ({hit.result.point_count} points)")
+            cache_prom_result(tool_call["id"], hit.result)
+            local.append(ToolMessage(
+                content=hit.result.to_response_json(),
+                tool_call_id=tool_call["id"],
+                name="prom_range",
+                additional_kwargs={"timing": {"queue_wait": 0.0, "execution": 0.0}, "served_from": "series_store"},
+            ))
+        elif hit and hit.kind == "delta":
+            logger.info(f"[PERF] {tool_call['id']} delta fetch from {hit.fetch_start:.0f} instead of {start:.0f}")
+            deltas[tool_call["id"]] = {"args": args, "history": hit.result}
+            remaining.append({**tool_call, "args": {**args, "start": _format_time(hit.fetch_start)}})
+        else:
+            remaining.append(tool_call)
+    return remaining, local, deltas
+
+
+def _concat(history: PromResult, tail: PromResult) -> PromResult:
+    """Stored history followed by the freshly fetched points, per label set"""
+    series: Dict[Tuple[Tuple[str, str], ...], PromSeries] = {_label_key(s.metric): s for s in history.series}
+    for s in tail.series:
+        key = _label_key(s.metric)
+        before = series.get(key)
+        if before is None:
+            series[key] = s
+            continue
+        newer = s.slice(before.timestamps[-1] + 1e-9) if len(before) else s
+        series[key] = PromSeries(before.metric, np.concatenate([before.timestamps, newer.timestamps]),
+                                 np.concatenate([before.values, newer.values]))
+    return PromResult("success", "matrix", list(series.values()), None, list(tail.warnings))
+
+
+def record_results(tool_calls: List[Dict[str, Any]], messages: List[ToolMessage], deltas: Dict[str, Dict[str, Any]]) -> List[ToolMessage]:
+    """Store executed prom_range results; delta fetches are answered with the stored history plus the new points"""
+    calls = {tool_call.get("id"): tool_call for tool_call in tool_calls}
+    completed = []
+    for message in messages:
+        tool_call = calls.get(message.tool_call_id)
+        result = get_prom_result(message) if tool_call and tool_call.get("name") == "prom_range" else None
+        if result is None:
+            completed.append(message)
+            continue
+
+        args = tool_call["args"]
+        start, end, step = range_args(args)
+        # A result missing clusters or backends must not be served as complete later
+        if None not in (start, end, step) and not message.additional_kwargs.get("missing_clusters") and not result.warnings:
+            store_result(args.get("query", ""), start, end, step, result)
+
+        # The history was read when the delta was planned, so the answer is whole even when
+        # the new points couldn't be stored (partial result) or the entry was evicted since
+        delta = deltas.get(message.tool_call_id)
+        if delta and result.status == "success":
+            merged = _concat(delta["history"], result)
+            cache_prom_result(message.tool_call_id, merged)
+            message = ToolMessage(
+                content=merged.to_response_json(),
+                tool_call_id=message.tool_call_id,
+                name=message.name,
+                additional_kwargs={**message.additional_kwargs, "served_from": "series_store+delta"},
+            )
+        completed.append(message)
+    return completed
+
+
+def _format_time(timestamp: float) -> str:
+    return time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime(timestamp)) if float(timestamp).is_integer() else str(timestamp)
@@ -0,0 +1,180 @@
+"""
+Startup Profiler - Import-time breakdown and time-to-first-request of the agent server
+
+Usage:
+    uv run profile-startup                       # profile agent.main
+    uv run profile-startup --top 30 --lazy       # lazy MCP startup, show 30 modules
+    uv run profile-startup --import-budget 2.0 --ready-budget 5.0   # exit 1 when over budget
+"""
+
+import os
+import sys
+import time
+import socket
+import argparse
+import subprocess
+import urllib.request
+from typing import Dict, List, Optional
+
+DEFAULT_MODULE = "agent.main"
+DEFAULT_APP = "agent.main:app"
+# Directory holding the agent package, so the child interpreter finds it when it isn't installed
+SOURCE_ROOT = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+def _free_port() -> int:
+    """Pick a free local TCP port"""
+    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def parse_importtime(output: str) -> List[Dict[str, float]]:
+    """
+    Parse the stderr of `python -X importtime`.
+
+    Returns:
+        One entry per imported module with 'module', 'self' and 'cumulative' seconds, in import order
+    """
+    entries = []
+    for line in output.splitlines():
+        if not line.startswith("import time:"):
+            continue
+        fields = line[len("import time:"):].split("|")
+        if len(fields) != 3:
+            continue
+        try:
+            self_us, cumulative_us = int(fields[0]), int(fields[1])
+        except ValueError:
+            continue  # Header line
+        entries.append({
+            "module": fields[2].strip(),
+            "self": self_us / 1e6,
+            "cumulative": cumulative_us / 1e6,
+        })
+    return entries
+
+
+def profile_imports(module: str = DEFAULT_MODULE) -> Dict[str, object]:
+    """
+    Import a module in a fresh interpreter with -X importtime.
+
+    Returns:
+        Dictionary with 'total' wall time of the import, 'module_time' as reported
+        by importtime and the parsed per-module 'entries'
+    """
+    start = time.time()
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        capture_output=True,
+        text=True,
+        env={**os.environ, "DISABLE_EMIT_STATE": "true", "PYTHONPATH": os.pathsep.join(filter(None, (SOURCE_ROOT, os.getenv("PYTHONPATH"))))},
+    )
+    total = time.time() - start
+
+    if result.returncode != 0:
+        raise RuntimeError(f"Importing {module} failed:\n{result.stderr[-2000:]}")
+
+    entries = parse_importtime(result.stderr)
+    module_time = next((e["cumulative"] for e in entries if e["module"] == module), 0.0)
+    return {"total": total, "module_time": module_time, "entries": entries}
+
+
+def measure_first_request(app: str = DEFAULT_APP, path: str = "/", lazy: bool = False, timeout: float = 120.0) -> Optional[float]:
+    """
+    Start the app under uvicorn and measure the time until the first request succeeds.
+
+    Args:
+        app: Uvicorn application path
+        path: Path that is polled until it answers with 200
+        lazy: Start with MCP_LAZY_STARTUP=true
+        timeout: Give up after this many seconds
+
+    Returns:
+        Seconds from process start to the first successful response, None on timeout
+    """
+    port = _free_port()
+    env = {**os.environ, "MCP_LAZY_STARTUP": "true" if lazy else os.getenv("MCP_LAZY_STARTUP", "false")}
+    start = time.time()
+    process = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", app, "--host", "127.0.0.1", "--port", str(port), "--log-level", "warning"],
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+        env=env,
+    )
+
+    try:
+        while time.time() - start < timeout:
+            if process.poll() is not None:
+                raise RuntimeError(f"Server exited with code {process.returncode} before answering")
+            try:
+                with urllib.request.urlopen(f"http://127.0.0.1:{port}{path}", timeout=1) as response:
+                    if response.status == 200:
+                        return time.time() - start
+            except OSError:
+                pass
+            time.sleep(0.05)
+        return None
+    finally:
+        process.terminate()
+        try:
+            process.wait(timeout=10)
+        except subprocess.TimeoutExpired:
+            process.kill()
+
+
+def print_import_report(profile: Dict[str, object], module: str, top: int) -> None:
+    """Print the slowest imports by cumulative and by self time"""
+    entries = profile["entries"]
+    print(f"=== Import profile: {module} ===")
+    print(f"⏱️  import {module}: {profile['module_time']:.3f}s (interpreter total {profile['total']:.3f}s, {len(entries)} modules)")
+
+    print(f"\n📦 Top {top} by cumulative time:")
+    for entry in sorted(entries, key=lambda e: e["cumulative"], reverse=True)[:top]:
+        print(f"  {entry['cumulative']:8.3f}s  {entry['module']}")
+
+    print(f"\n🔬 Top {top} by self time:")
+    for entry in sorted(entries, key=lambda e: e["self"], reverse=True)[:top]:
+        print(f"  {entry['self']:8.3f}s  {entry['module']}")
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Profile agent import time and time-to-first-request")
+    parser.add_argument("--module", default=DEFAULT_MODULE, help="Module to import-profile")
+    parser.add_argument("--app", default=DEFAULT_APP, help="Uvicorn app used for time-to-first-request")
+    parser.add_argument("--top", type=int, default=20, help="Number of modules to list")
+    parser.add_argument("--lazy", action="store_true", help="Measure with MCP_LAZY_STARTUP=true")
+    parser.add_argument("--skip-server", action="store_true", help="Only profile imports")
+    parser.add_argument("--import-budget", type=float, default=None, help="Fail if the import takes longer (seconds)")
+    parser.add_argument("--ready-budget", type=float, default=None, help="Fail if the first request takes longer (seconds)")
+    args = parser.parse_args(argv)
+
+    over_budget = []
+
+    profile = profile_imports(args.module)
+    print_import_report(profile, args.module, args.top)
+    if args.import_budget is not None and profile["module_time"] > args.import_budget:
+        over_budget.append(f"import {profile['module_time']:.3f}s > {args.import_budget:.3f}s")
+
+    if not args.skip_server:
+        first_request = measure_first_request(args.app, lazy=args.lazy)
+        mode = "lazy" if args.lazy else "eager"
+        if first_request is None:
+            print(f"\n❌ Time to first request ({mode}): no response")
+            over_budget.append("server never answered")
+        else:
+            print(f"\n🚀 Time to first request ({mode}): {first_request:.3f}s")
+            if args.ready_budget is not None and first_request > args.ready_budget:
+                over_budget.append(f"first request {first_request:.3f}s > {args.ready_budget:.3f}s")
+
+    if over_budget:
+        print(f"\n⚠️  Startup budget exceeded: {'; '.join(over_budget)}")
+        return 1
+
+    if args.import_budget is not None or args.ready_budget is not None:
+        print("\n✅ Startup within budget")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,331 @@
+"""
+Subscriptions - Pinned charts that keep updating without re-running the workflow
+
+'/pin' subscribes to the line charts of the thread's last render_recharts call that were
+built from a prom_range result ('source'). A background scheduler then fetches only the
+samples after the chart's last timestamp, on the original step grid, every step (at least
+SUBSCRIPTION_MIN_INTERVAL), and publishes the new rows to the subscription's listeners; no
+LLM is involved. CopilotKit state can only be emitted while a graph run is streaming, so
+the updates go out on an SSE endpoint (see main.py) instead.
+
+Each subscription is bounded: series and rows kept, lifetime, idle time without a
+listener, consecutive failures; and per thread and overall counts.
+"""
+
+import os
+import time
+import uuid
+import asyncio
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional, Set
+
+from langchain_core.messages import AIMessage, ToolMessage
+
+from agent.utils.logging_config import get_logger
+from agent.utils.chart_data import pivot_aligned
+from agent.utils.fl_rounds import has_rounds
+from agent.utils.prom_result import get_prom_result, parse_prom_response
+from agent.utils.promql import range_args
+
+logger = get_logger("subscriptions")
+
+SUBSCRIPTIONS = os.getenv("SUBSCRIPTIONS", "true").lower() == "true"
+SUBSCRIPTION_MIN_INTERVAL = float(os.getenv("SUBSCRIPTION_MIN_INTERVAL", "30"))
+SUBSCRIPTION_MAX_PER_THREAD = int(os.getenv("SUBSCRIPTION_MAX_PER_THREAD", "4"))
+SUBSCRIPTION_MAX_TOTAL = int(os.getenv("SUBSCRIPTION_MAX_TOTAL", "32"))
+SUBSCRIPTION_MAX_SERIES = int(os.getenv("SUBSCRIPTION_MAX_SERIES", "50"))
+SUBSCRIPTION_MAX_ROWS = int(os.getenv("SUBSCRIPTION_MAX_ROWS", "2000"))         # Rows kept for late listeners
+SUBSCRIPTION_TTL = float(os.getenv("SUBSCRIPTION_TTL", "7200"))
+SUBSCRIPTION_IDLE_TIMEOUT = float(os.getenv("SUBSCRIPTION_IDLE_TIMEOUT", "600"))  # Without any listener
+SUBSCRIPTION_MAX_FAILURES = int(os.getenv("SUBSCRIPTION_MAX_FAILURES", "5"))
+SUBSCRIPTION_CONCURRENCY = int(os.getenv("SUBSCRIPTION_CONCURRENCY", "4"))
+LISTENER_QUEUE_SIZE = 100
+
+PIN_COMMAND = "/pin"
+UNPIN_COMMAND = "/unpin"
+
+
+@dataclass
+class Subscription:
+    id: str
+    thread_id: str
+    title: str
+    unit: str
+    scaler: float
+    query: str
+    step: float
+    last_ts: float
+    keys: List[str]
+    rows: List[Dict[str, Any]]
+    created: float = field(default_factory=time.time)
+    next_run: float = 0.0
+    last_listened: float = field(default_factory=time.time)
+    failures: int = 0
+    listeners: Set[asyncio.Queue] = field(default_factory=set)
+
+    def describe(self) -> Dict[str, Any]:
+        return {
+            "id": self.id, "thread_id": self.thread_id, "chart_title": self.title, "query": self.query,
+            "step": self.step, "last_timestamp": self.last_ts, "series": len(self.keys), "rows": len(self.rows),
+            "listeners": len(self.listeners), "expires_in": round(self.created + SUBSCRIPTION_TTL - time.time()),
+        }
+
+
+_subscriptions: Dict[str, Subscription] = {}
+_scheduler_task: Optional[asyncio.Task] = None
+_subscription_stats = {
+    "pinned": 0,
+    "rejected": 0,
+    "fetches": 0,
+    "fetch_failures": 0,
+    "rows_pushed": 0,
+    "expired": 0,
+    "idle_stopped": 0,
+    "failed_stopped": 0,
+}
+
+
+def get_subscription_stats() -> dict:
+    """Get chart subscription statistics for monitoring"""
+    return {
+        **_subscription_stats,
+        "active": len(_subscriptions),
+        "listeners": sum(len(s.listeners) for s in _subscriptions.values()),
+        "running": _scheduler_task is not None and not _scheduler_task.done(),
+    }
+
+
+def list_subscriptions(thread_id: Optional[str] = None) -> List[Dict[str, Any]]:
+    return [s.describe() for s in _subscriptions.values() if thread_id is None or s.thread_id == thread_id]
+
+
+# --- Pinning ---
+def _tool_call(messages, tool_call_id: str) -> Optional[Dict[str, Any]]:
+    for msg in reversed(messages):
+        if isinstance(msg, AIMessage):
+            for tool_call in msg.tool_calls or []:
+                if tool_call.get("id") == tool_call_id:
+                    return tool_call
+    return None
+
+
+def _chart_subscription(chart: Dict[str, Any], messages, thread_id: str) -> Optional[Subscription]:
+    """Subscription for a chart built from a prom_range result, None if the chart can't be updated"""
+    source = chart.get("source")
+    if not source or chart.get("rechart_type") != "LineChart" or chart.get("summary", "series") != "series":
+        return None
+    tool_call = _tool_call(messages, source)
+    message = next((m for m in reversed(messages) if isinstance(m, ToolMessage) and m.tool_call_id == source), None)
+    if not tool_call or tool_call.get("name") != "prom_range" or message is None:
+        return None
+    result = get_prom_result(message)
+    _, _, step = range_args(tool_call.get("args", {}))
+    # Round-labelled FL metrics are charted per round, not per timestamp
+    if result is None or result.status != "success" or not result.series or has_rounds(result) or not step:
+        return None
+
+    rows = list(chart.get("rechart_data") or [])
+    last_ts = max(float(s.timestamps[-1]) for s in result.series if len(s))
+    return Subscription(
+        id=f"sub-{uuid.uuid4().hex[:8]}", thread_id=thread_id, title=chart.get("chart_title", ""),
+        unit=chart.get("unit", ""), scaler=chart.get("scaler", 1.0), query=tool_call["args"]["query"],
+        step=step, last_ts=last_ts, keys=list(chart.get("y_axis_keys") or []), rows=rows[-SUBSCRIPTION_MAX_ROWS:],
+        next_run=time.time() + max(step, SUBSCRIPTION_MIN_INTERVAL),
+    )
+
+
+def pin_charts(messages, thread_id: str) -> List[Subscription]:
+    """Subscribe to the updatable charts of the thread's last render_recharts call"""
+    if not SUBSCRIPTIONS:
+        return []
+    charts = []
+    for msg in reversed(messages):
+        calls = [tc for tc in getattr(msg, "tool_calls", None) or [] if tc.get("name") == "render_recharts"]
+        if calls:
+            charts = [chart for tc in calls for chart in tc.get("args", {}).get("data", tc.get("args", {})).get("charts", [])]
+            break
+
+    pinned = []
+    for chart in charts:
+        if len(_subscriptions) >= SUBSCRIPTION_MAX_TOTAL or \
+                sum(1 for s in _subscriptions.values() if s.thread_id == thread_id) >= SUBSCRIPTION_MAX_PER_THREAD:
+            _subscription_stats["rejected"] += 1
+            logger.warning(f"Subscription limit reached for thread {thread_id}")
+            break
+        subscription = _chart_subscription(chart, messages, thread_id)
+        if subscription is None:
+            _subscription_stats["rejected"] += 1
+            continue
+        _subscriptions[subscription.id] = subscription
+        pinned.append(subscription)
+        _subscription_stats["pinned"] += 1
+        logger.info(f"Pinned '{subscription.title}' as {subscription.id} (every {max(subscription.step, SUBSCRIPTION_MIN_INTERVAL):.0f}s)")
+
+    if pinned:
+        start_scheduler()
+    return pinned
+
+
+def unpin(subscription_id: Optional[str] = None, thread_id: Optional[str] = None) -> int:
+    """Stop one subscription, or all of a thread"""
+    ids = [sid for sid, s in _subscriptions.items()
+           if sid == subscription_id or (subscription_id is None and s.thread_id == thread_id)]
+    for sid in ids:
+        _stop(sid, "unpinned")
+    return len(ids)
+
+
+def _stop(subscription_id: str, reason: str) -> None:
+    subscription = _subscriptions.pop(subscription_id, None)
+    if subscription is None:
+        return
+    for queue in subscription.listeners:
+        _publish(queue, {"subscription_id": subscription_id, "stopped": reason})
+        _publish(queue, None)
+    logger.info(f"Stopped subscription {subscription_id}: {reason}")
+
+
+# --- Listeners ---
+def _publish(queue: asyncio.Queue, update: Optional[Dict[str, Any]]) -> None:
+    # A slow listener loses its oldest updates, not the scheduler's time
+    if queue.full():
+        queue.get_nowait()
+    queue.put_nowait(update)
+
+
+def listen(subscription_id: str) -> Optional[asyncio.Queue]:
+    """Queue receiving the subscription's updates (None ends the stream), primed with the kept rows"""
+    subscription = _subscriptions.get(subscription_id)
+    if subscription is None:
+        return None
+    queue: asyncio.Queue = asyncio.Queue(maxsize=LISTENER_QUEUE_SIZE)
+    queue.put_nowait(_update(subscription, subscription.rows))
+    subscription.listeners.add(queue)
+    subscription.last_listened = time.time()
+    return queue
+
+
+def unlisten(subscription_id: str, queue: asyncio.Queue) -> None:
+    subscription = _subscriptions.get(subscription_id)
+    if subscription is not None:
+        subscription.listeners.discard(queue)
+        subscription.last_listened = time.time()
+
+
+def _update(subscription: Subscription, rows: List[Dict[str, Any]]) -> Dict[str, Any]:
+    return {
+        "subscription_id": subscription.id, "chart_title": subscription.title, "unit": subscription.unit,
+        "scaler": subscription.scaler, "x_axis_key": "timestamp", "y_axis_keys": subscription.keys, "rows": rows,
+    }
+
+
+# --- Scheduler ---
+async def _prom_range():
+    from agent.tools.mcp_tool import get_mcp_tools_with_persistent_sessions, get_tool_server
+    from agent.utils.prom_federation import federate_tools
+
+    server = get_tool_server("prom_range")
+    tools = await get_mcp_tools_with_persistent_sessions(servers=[server] if server else None)
+    return federate_tools({tool.name: tool for tool in tools})
+
+
+async def refresh(subscription: Subscription, tool_map: Dict[str, Any]) -> int:
+    """Fetch the samples after the last timestamp on the original grid and publish the new rows"""
+    from agent.utils.tool_executor import execute_tool_call
+
+    start = subscription.last_ts + subscription.step
+    end = subscription.last_ts + ((time.time() - subscription.last_ts) // subscription.step) * subscription.step
+    if end < start:
+        return 0
+
+    _subscription_stats["fetches"] += 1
+    call = {"name": "prom_range", "id": f"{subscription.id}-{int(end)}",
+            "args": {"query": subscription.query, "start": start, "end": end, "step": f"{int(subscription.step)}s"}}
+    message = await execute_tool_call(call, tool_map, {"configurable": {"thread_id": subscription.thread_id}})
+    result = parse_prom_response(str(message.content))
+    if result is None or result.status != "success":
+        raise RuntimeError(str(message.content)[:200])
+
+    if len(result.series) > SUBSCRIPTION_MAX_SERIES:
+        result.series = result.series[:SUBSCRIPTION_MAX_SERIES]
+    rows, keys = pivot_aligned(result, step=subscription.step)
+    rows = [row for row in rows if row["timestamp"] > subscription.last_ts]
+    subscription.last_ts = max([subscription.last_ts] + [row["timestamp"] for row in rows])
+    if not rows:
+        return 0
+
+    subscription.keys += [key for key in keys if key not in subscription.keys][:SUBSCRIPTION_MAX_SERIES - len(subscription.keys)]
+    subscription.rows = (subscription.rows + rows)[-SUBSCRIPTION_MAX_ROWS:]
+    update = _update(subscription, rows)
+    for queue in subscription.listeners:
+        _publish(queue, update)
+    _subscription_stats["rows_pushed"] += len(rows) * len(subscription.listeners)
+    return len(rows)
+
+
+async def _run(subscription: Subscription, tool_map: Dict[str, Any], limiter: asyncio.Semaphore) -> None:
+    async with limiter:
+        started = time.time()
+        try:
+            appended = await refresh(subscription, tool_map)
+            subscription.failures = 0
+            logger.info(f"[PERF] Subscription {subscription.id}: {appended} new rows in {time.time() - started:.3f}s")
+        except Exception as e:
+            subscription.failures += 1
+            _subscription_stats["fetch_failures"] += 1
+            logger.warning(f"Subscription {subscription.id} refresh failed ({subscription.failures}): {e}")
+    subscription.next_run = time.time() + max(subscription.step, SUBSCRIPTION_MIN_INTERVAL)
+
+
+async def _scheduler_loop() -> None:
+    limiter = asyncio.Semaphore(SUBSCRIPTION_CONCURRENCY)
+    while _subscriptions:
+        now = time.time()
+        for sid, subscription in list(_subscriptions.items()):
+            if now - subscription.created > SUBSCRIPTION_TTL:
+                _subscription_stats["expired"] += 1
+                _stop(sid, "expired")
+            elif not subscription.listeners and now - subscription.last_listened > SUBSCRIPTION_IDLE_TIMEOUT:
+                _subscription_stats["idle_stopped"] += 1
+                _stop(sid, "no listener")
+            elif subscription.failures >= SUBSCRIPTION_MAX_FAILURES:
+                _subscription_stats["failed_stopped"] += 1
+                _stop(sid, "too many failures")
+
+        due = [s for s in _subscriptions.values() if s.next_run <= now]
+        if due:
+            try:
+                tool_map = await _prom_range()
+                await asyncio.gather(*(_run(subscription, tool_map, limiter) for subscription in due))
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                _subscription_stats["fetch_failures"] += len(due)
+                logger.warning(f"Subscription refresh round failed: {e}")
+                for subscription in due:
+                    subscription.failures += 1
+                    subscription.next_run = time.time() + max(subscription.step, SUBSCRIPTION_MIN_INTERVAL)
+        await asyncio.sleep(1.0)
+
+
+def start_scheduler() -> Optional[asyncio.Task]:
+    """Start the scheduler (no-op if disabled or already running), it exits once nothing is pinned"""
+    global _scheduler_task
+    if not SUBSCRIPTIONS:
+        return None
+    if _scheduler_task is None or _scheduler_task.done():
+        _scheduler_task = asyncio.create_task(_scheduler_loop())
+    return _scheduler_task
+
+
+async def stop_subscriptions() -> None:
+    global _scheduler_task
+    for sid in list(_subscriptions):
+        _stop(sid, "shutdown")
+    if _scheduler_task and not _scheduler_task.done():
+        _scheduler_task.cancel()
+        try:
+            await _scheduler_task
+        except asyncio.CancelledError:
+            pass
+    _scheduler_task = None
@@ -1,49 +1,193 @@
 """
 Tool Executor - Common logic for executing tools and handling results
+
+Tool calls are bounded by per-server and per-tool concurrency limits. Free slots are handed
+out round-robin across threads, so one conversation's burst can't starve the others. Every
+call has a deadline; a call that misses it ends as an error ToolMessage instead of stalling
+the node.
+
+Internal traffic (fan-out shards, speculative prefetches) runs in its own lane: one
+limiter replacing the tool and server limits, with the deadline starting once the call has
+a slot, so calls still queued in the lane don't time out.
 """
 
+import os
 import time
-from typing import List, Dict, Any
+import asyncio
+from collections import OrderedDict, deque
+from contextlib import asynccontextmanager
+from typing import List, Dict, Any, Optional
 from langchain_core.messages import ToolMessage
 from langchain_core.runnables import RunnableConfig
+from agent.tools.mcp_tool import get_tool_server
 from agent.utils.logging_config import get_logger
+from agent.utils.session_config import get_session_info
 
 logger = get_logger("tool_executor")
 
-async def execute_tool_call(tool_call: Dict[str, Any], tool_map: Dict[str, Any], config: RunnableConfig = None) -> ToolMessage:
-    """Execute a single tool call and return the result message"""
+
+def _parse_tool_settings(value: str) -> Dict[str, float]:
+    """Parse 'tool=value,tool=value' settings"""
+    settings = {}
+    for item in value.split(","):
+        if "=" in item:
+            name, setting = item.split("=", 1)
+            settings[name.strip()] = float(setting)
+    return settings
+
+
+TOOL_SERVER_CONCURRENCY = int(os.getenv("TOOL_SERVER_CONCURRENCY", "4"))
+TOOL_CONCURRENCY = {name: int(limit) for name, limit in _parse_tool_settings(os.getenv("TOOL_CONCURRENCY", "prom_range=2")).items()}
+TOOL_CALL_TIMEOUT = float(os.getenv("TOOL_CALL_TIMEOUT", "60"))
+TOOL_TIMEOUTS = _parse_tool_settings(os.getenv("TOOL_TIMEOUTS", "prom_range=90"))
+
+LOCAL_SERVER = "local"  # Tools that don't go through an MCP server, e.g. render_recharts
+
+
+class FairLimiter:
+    """Concurrency limit whose free slots go round-robin to the waiting owners (threads)"""
+
+    def __init__(self, name: str, limit: int):
+        self.name = name
+        self.limit = limit
+        self.active = 0
+        self._waiting: "OrderedDict[str, deque[asyncio.Future]]" = OrderedDict()
+
+    @property
+    def queued(self) -> int:
+        return sum(len(queue) for queue in self._waiting.values())
+
+    async def acquire(self, owner: str) -> None:
+        if self.active < self.limit and not self._waiting:
+            self.active += 1
+            return
+
+        future = asyncio.get_running_loop().create_future()
+        self._waiting.setdefault(owner, deque()).append(future)
+        try:
+            await future
+        except asyncio.CancelledError:
+            if future.done() and not future.cancelled():
+                # The slot was handed over right before we were cancelled, pass it on
+                self.release()
+            else:
+                queue = self._waiting.get(owner)
+                if queue and future in queue:
+                    queue.remove(future)
+                    if not queue:
+                        del self._waiting[owner]
+            raise
+
+    def release(self) -> None:
+        # Hand the slot directly to the next owner in line, which then moves to the back
+        while self._waiting:
+            owner, queue = next(iter(self._waiting.items()))
+            future = queue.popleft()
+            if queue:
+                self._waiting.move_to_end(owner)
+            else:
+                del self._waiting[owner]
+            if not future.done():
+                future.set_result(None)
+                return
+        self.active -= 1
+
+
+_server_limiters: Dict[str, FairLimiter] = {}
+_tool_limiters: Dict[str, FairLimiter] = {}
+_lane_limiters: Dict[str, FairLimiter] = {}
+_executor_stats = {
+    "calls": 0,
+    "timeouts": 0,
+    "cancelled": 0,
+    "errors": 0,
+    "queue_wait_total": 0.0,
+    "execution_total": 0.0,
+}
+
+
+def _get_limiters(tool_name: str) -> List[FairLimiter]:
+    """
+    Limiters a call has to pass, in acquisition order: the tool's, then the server's.
+
+    The narrower tool limit goes first, so calls waiting for it (prom_range) don't sit on
+    server slots the server's other tools (prom_query, prom_metadata, ...) could use.
+    """
+    limiters = []
+    if tool_name in TOOL_CONCURRENCY:
+        if tool_name not in _tool_limiters:
+            _tool_limiters[tool_name] = FairLimiter(tool_name, TOOL_CONCURRENCY[tool_name])
+        limiters.append(_tool_limiters[tool_name])
+
+    limiters.append(_server_limiter(get_tool_server(tool_name) or LOCAL_SERVER))
+    return limiters
+
+
+def _server_limiter(server_name: str) -> FairLimiter:
+    if server_name not in _server_limiters:
+        _server_limiters[server_name] = FairLimiter(server_name, TOOL_SERVER_CONCURRENCY)
+    return _server_limiters[server_name]
+
+
+@asynccontextmanager
+async def server_slot(server_name: str, config: RunnableConfig = None):
+    """
+    Hold a slot of an MCP server's limit around a call a tool makes to that server itself
+    (the secondary Prometheus backends). Yields the seconds spent queued.
+    """
+    limiter = _server_limiter(server_name)
+    queued = time.time()
+    await limiter.acquire(get_session_info(config)["thread_id"])
+    try:
+        yield time.time() - queued
+    finally:
+        limiter.release()
+
+
+def is_busy(tool_name: str) -> bool:
+    """Calls of the tool, or of its server, are running or waiting under the regular limits"""
+    return any(limiter.active or limiter.queued for limiter in _get_limiters(tool_name))
+
+
+def lane_limiter(name: str, limit: int) -> FairLimiter:
+    """Limiter of an internal lane, shared by every call run in it"""
+    if name not in _lane_limiters:
+        _lane_limiters[name] = FairLimiter(name, limit)
+    return _lane_limiters[name]
+
+
+def get_executor_stats() -> dict:
+    """Get tool execution statistics for monitoring"""
+    calls = _executor_stats["calls"]
+    return {
+        **_executor_stats,
+        "avg_queue_wait": round(_executor_stats["queue_wait_total"] / calls, 3) if calls else 0.0,
+        "avg_execution": round(_executor_stats["execution_total"] / calls, 3) if calls else 0.0,
+        "limiters": {
+            limiter.name: {"limit": limiter.limit, "active": limiter.active, "queued": limiter.queued}
+            for limiter in [*_server_limiters.values(), *_tool_limiters.values(), *_lane_limiters.values()]
+        },
+    }
+
+
+async def execute_tool_call(tool_call: Dict[str, Any], tool_map: Dict[str, Any], config: RunnableConfig = None,
+                            lane: Optional[FairLimiter] = None) -> ToolMessage:
+    """
+    Execute a single tool call and return the result message.
+
+    Args:
+        lane: Run under this limiter instead of the tool and server limits, the deadline
+              then only covers the execution
+    """
     tool_name = tool_call.get("name", "")
     tool_args = tool_call.get("args", {})
     tool_call_id = tool_call.get("id", "")
-    
+
     start_time = time.time()
     logger.debug(f"[PERF] Executing tool '{tool_name}'")
     logger.debug(f"Executing tool: {tool_name} with args: {tool_args}")
-    
-    if tool_name in tool_map:
-        try:
-            tool = tool_map[tool_name]
-            invoke_start = time.time()
-            result = await tool.ainvoke(tool_args, config)
-            invoke_end = time.time()
-            
-            logger.debug(f"[PERF] Tool '{tool_name}' completed in {invoke_end - invoke_start:.3f}s")
-            
-            return ToolMessage(
-                content=str(result),
-                tool_call_id=tool_call_id,
-                name=tool_name
-            )
-            
-        except Exception as e:
-            end_time = time.time()
-            logger.error(f"[PERF] Tool '{tool_name}' failed after {end_time - start_time:.3f}s: {e}")
-            return ToolMessage(
-                content=f"Error executing {tool_name}: {str(e)}",
-                tool_call_id=tool_call_id,
-                name=tool_name
-            )
-    else:
+
+    if tool_name not in tool_map:
         logger.warning(f"Tool '{tool_name}' not found in tool map")
         return ToolMessage(
             content=f"Tool '{tool_name}' not found",
@@ -51,31 +195,94 @@ async def execute_tool_call(tool_call: Dict[str, Any], tool_map: Dict[str, Any],
             name=tool_name
         )
 
+    tool = tool_map[tool_name]
+    owner = get_session_info(config)["thread_id"]
+    timeout = TOOL_TIMEOUTS.get(tool_name, TOOL_CALL_TIMEOUT)
+    timing = {"queue_wait": None, "execution": 0.0}
+
+    async def run():
+        acquired = []
+        try:
+            for limiter in [lane] if lane else _get_limiters(tool_name):
+                await limiter.acquire(owner)
+                acquired.append(limiter)
+            timing["queue_wait"] = time.time() - start_time
+
+            invoke_start = time.time()
+            try:
+                if lane:
+                    return await asyncio.wait_for(tool.ainvoke(tool_args, config), timeout=timeout)
+                return await tool.ainvoke(tool_args, config)
+            finally:
+                timing["execution"] = time.time() - invoke_start
+        finally:
+            for limiter in reversed(acquired):
+                limiter.release()
+
+    _executor_stats["calls"] += 1
+    try:
+        # The deadline covers queueing and execution (only execution in a lane); on expiry the
+        # call is cancelled down to the MCP request
+        result = await asyncio.wait_for(run(), timeout=None if lane else timeout)
+        content = str(result)
+        logger.debug(f"[PERF] Tool '{tool_name}' completed: queue_wait={timing['queue_wait']:.3f}s, execution={timing['execution']:.3f}s")
+
+    except asyncio.TimeoutError:
+        _executor_stats["timeouts"] += 1
+        if timing["queue_wait"] is None:
+            # Expired while still queued
+            timing["queue_wait"] = time.time() - start_time
+        logger.error(f"[PERF] Tool '{tool_name}' timed out after {timeout:g}s (queue_wait={timing['queue_wait']:.3f}s)")
+        content = f"Error executing {tool_name}: timed out after {timeout:g}s, try a narrower time range or a larger step"
+
+    except asyncio.CancelledError:
+        _executor_stats["cancelled"] += 1
+        logger.warning(f"[PERF] Tool '{tool_name}' cancelled after {time.time() - start_time:.3f}s")
+        raise
+
+    except Exception as e:
+        _executor_stats["errors"] += 1
+        logger.error(f"[PERF] Tool '{tool_name}' failed after {time.time() - start_time:.3f}s: {e}")
+        content = f"Error executing {tool_name}: {str(e)}"
+
+    finally:
+        if timing["queue_wait"] is None:
+            timing["queue_wait"] = time.time() - start_time
+        _executor_stats["queue_wait_total"] += timing["queue_wait"]
+        _executor_stats["execution_total"] += timing["execution"]
+
+    message = ToolMessage(
+        content=content,
+        tool_call_id=tool_call_id,
+        name=tool_name,
+        additional_kwargs={"timing": {key: round(value, 3) for key, value in timing.items()}},
+    )
+    return message
+
 async def execute_tool_calls(tool_calls: List[Dict[str, Any]], tool_map: Dict[str, Any], config: RunnableConfig = None) -> List[ToolMessage]:
-    """Execute multiple tool calls concurrently and return all result messages"""
-    import asyncio
-    
+    """Execute multiple tool calls concurrently (within the concurrency limits) and return all result messages"""
     total_start = time.time()
-    
+
     logger.info(f"[PERF] 💫 PARALLEL execution of {len(tool_calls)} tools")
-    
+
     # Create coroutines for all tool calls
     tasks = []
     for i, tool_call in enumerate(tool_calls, 1):
         logger.debug(f"[PERF] Preparing tool {i}/{len(tool_calls)}: {tool_call.get('name', 'unknown')}")
         task = execute_tool_call(tool_call, tool_map, config)
         tasks.append(task)
-    
-    # Execute all tool calls concurrently
+
+    # Execute all tool calls concurrently, cancelling the run cancels every pending call
     logger.debug(f"[PERF] Executing {len(tasks)} tools concurrently...")
     tool_messages = await asyncio.gather(*tasks)
-    
+
     total_end = time.time()
-    logger.info(f"[PERF] ✨ All {len(tool_calls)} tools completed CONCURRENTLY in {total_end - total_start:.3f}s")
-    
+    queue_wait = sum(msg.additional_kwargs.get("timing", {}).get("queue_wait", 0.0) for msg in tool_messages)
+    logger.info(f"[PERF] ✨ All {len(tool_calls)} tools completed CONCURRENTLY in {total_end - total_start:.3f}s (queue wait {queue_wait:.3f}s total)")
+
     return list(tool_messages)
 
 def count_successful_tools(tool_messages: List[ToolMessage]) -> int:
     """Count the number of successful tool executions"""
-    return len([msg for msg in tool_messages 
-               if not msg.content.startswith("Error") and not msg.content.startswith("Tool")])
\ No newline at end of file
+    return len([msg for msg in tool_messages
+               if not msg.content.startswith("Error") and not msg.content.startswith("Tool")])
@@ -0,0 +1,76 @@
+"""
+Counter eval - local window functions give what Prometheus returns for a known counter series
+
+Expected values follow Prometheus' extrapolatedRate and irate by hand: 15s scrapes, a reset
+from 30 to 5 at t=45.
+"""
+
+import json
+
+import numpy as np
+from langchain_core.messages import ToolMessage
+
+from agent.utils.counter_eval import evaluate, evaluate_series
+from agent.utils.prom_result import PromResult, PromSeries, get_prom_result
+from agent.utils.query_planner import plan_tool_calls, resolve_plan
+
+TIMESTAMPS = np.array([0.0, 15.0, 30.0, 45.0, 60.0])
+STEADY = np.array([0.0, 15.0, 30.0, 45.0, 60.0])     # 1/s
+RESET = np.array([0.0, 15.0, 30.0, 5.0, 20.0])       # Reset at t=45
+
+
+def at(function, values, times, window=60.0):
+    return evaluate_series(function, TIMESTAMPS, values, np.array(times), window).tolist()
+
+
+def test_rate_extrapolates_to_window_edges():
+    # (0, 60] holds 15..60: 45 over 45s, extrapolated by 15s at the start
+    assert np.allclose(at("rate", STEADY, [60.0]), [1.0])
+    assert np.allclose(at("increase", STEADY, [60.0]), [60.0])
+    # (10, 70] holds 15..60, 5s to the start and 10s to the end are both extrapolated
+    assert np.allclose(at("increase", STEADY, [70.0]), [60.0])
+
+
+def test_rate_adds_counter_resets():
+    # Reset-adjusted 15, 30, 35, 50: 35 over 45s, extrapolated to 60s
+    assert np.allclose(at("increase", RESET, [60.0]), [35 * 60 / 45])
+    assert np.allclose(at("rate", RESET, [60.0]), [35 / 45])
+    # delta doesn't treat the drop as a reset
+    assert np.allclose(at("delta", RESET, [60.0]), [5 * 60 / 45])
+
+
+def test_irate_uses_last_two_samples():
+    assert np.allclose(at("irate", STEADY, [60.0]), [1.0])
+    assert np.allclose(at("irate", RESET, [45.0, 60.0]), [5 / 15, 15 / 15])
+    assert np.allclose(at("idelta", RESET, [45.0, 60.0]), [-25.0, 15.0])
+
+
+def test_window_with_one_sample_has_no_value():
+    assert np.isnan(at("rate", STEADY, [60.0], window=10.0)).all()
+    assert np.isnan(at("irate", STEADY, [60.0], window=10.0)).all()
+
+
+def test_evaluate_drops_metric_name():
+    raw = PromResult("success", "matrix", [PromSeries({"__name__": "c", "pod": "p"}, TIMESTAMPS, RESET)])
+    result = evaluate("irate", 60.0, raw, np.array([45.0, 60.0]))
+    [series] = result.series
+    assert series.metric == {"pod": "p"}
+    assert series.timestamps.tolist() == [45.0, 60.0]
+
+
+def test_planned_local_evaluation_matches_kernels():
+    selector = 'counter_eval_test_total{pod="p"}'
+    plan = plan_tool_calls([
+        {"id": "eval-rate", "name": "prom_query", "args": {"query": f"rate({selector}[1m])", "time": "60"}},
+        {"id": "eval-irate", "name": "prom_query", "args": {"query": f"irate({selector}[1m])", "time": "60"}},
+    ])
+    [raw_call] = plan.calls
+    assert raw_call["args"]["query"] == f"{selector}[1m] @ 60.000"
+
+    values = [[ts, str(v)] for ts, v in zip(TIMESTAMPS.tolist(), RESET.tolist())]
+    content = json.dumps({"status": "success", "data": {"resultType": "matrix", "result": [
+        {"metric": {"__name__": "counter_eval_test_total", "pod": "p"}, "values": values},
+    ]}})
+    rate, irate = resolve_plan(plan, [ToolMessage(content=content, tool_call_id=raw_call["id"], name="prom_query")])
+    assert np.allclose(get_prom_result(rate).series[0].values, [35 / 45])
+    assert np.allclose(get_prom_result(irate).series[0].values, [1.0])
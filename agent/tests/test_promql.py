@@ -0,0 +1,43 @@
+"""
+PromQL canonical form - equivalent spellings share one form, and the form is stable
+"""
+
+from agent.utils.promql import Matcher, canonical_query, extra_matchers, is_subset, query_key
+
+# Spellings of one query, each group must collapse to the same canonical form
+EQUIVALENT = [
+    ['sum by (pod, namespace)(rate(x{b="2",a=~"1"}[5m]))', 'sum(rate(x{a="1",b="2"}[300s])) by (namespace,pod)'],
+    ['{__name__="up", job=~".*"}', "up", "  up  "],
+    ["rate(x[1h])", "rate(x[60m])", "rate(x[3600s])"],
+    ['x{a=~".+"}', 'x{a!=""}'],
+]
+
+
+def test_equivalent_spellings_share_canonical_form():
+    for spellings in EQUIVALENT:
+        forms = {canonical_query(query) for query in spellings}
+        assert len(forms) == 1, f"{spellings} -> {sorted(forms)}"
+
+
+def test_canonical_form_round_trips():
+    for query in [query for spellings in EQUIVALENT for query in spellings] + ["1.0 + up", "histogram_quantile(0.9, rate(h_bucket[5m]))"]:
+        canonical = canonical_query(query)
+        assert canonical_query(canonical) == canonical, query
+
+
+def test_unparsable_query_is_whitespace_collapsed():
+    assert canonical_query('up{job="a"  ') == 'up{job="a"'
+
+
+def test_query_key_normalizes_time_arguments():
+    a = query_key("prom_range", {"query": "rate(x[5m])", "start": "1000", "end": 2000, "step": "1m"})
+    b = query_key("prom_range", {"query": "rate(x[300s])", "start": 1000, "end": "2000", "step": "60s"})
+    assert a == b
+
+
+def test_subset_needs_stricter_matchers_on_same_expression():
+    assert is_subset('up{job="a",pod="p"}', 'up{job="a"}')
+    assert not is_subset('up{job="a"}', 'up{job="a",pod="p"}')
+    assert not is_subset('rate(up{job="a",pod="p"}[5m])', 'up{job="a"}')
+    assert not is_subset('sum(up{job="a",pod="p"})', 'sum(up{job="a"})')
+    assert extra_matchers('up{job="a",pod="p"}', 'up{job="a"}') == (Matcher("pod", "=", "p"),)
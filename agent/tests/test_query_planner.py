@@ -0,0 +1,82 @@
+"""
+Query planner - duplicate, subset and merged calls are answered from the call that is executed
+"""
+
+import json
+
+from langchain_core.messages import ToolMessage
+
+from agent.utils.prom_result import get_prom_result
+from agent.utils.query_planner import plan_tool_calls, resolve_plan
+
+
+def call(call_id, query, name="prom_query", **args):
+    return {"id": call_id, "name": name, "args": {"query": query, **args}}
+
+
+def test_duplicates_run_once():
+    plan = plan_tool_calls([
+        call("dup-1", 'up{job="a"}'),
+        call("dup-2", 'up{ job = "a" }'),
+        {"id": "dup-3", "name": "kubectl", "args": {"command": "kubectl get pods"}},
+    ])
+    assert [c["id"] for c in plan.calls] == ["dup-1", "dup-3"]
+    assert plan.derived["dup-2"].kind == "duplicate"
+    assert plan.derived["dup-2"].source_id == "dup-1"
+
+
+def test_subset_reads_from_wider_call():
+    plan = plan_tool_calls([
+        call("sub-1", 'up{job="a"}'),
+        call("sub-2", 'up{job="a",pod="p"}'),
+    ])
+    assert [c["id"] for c in plan.calls] == ["sub-1"]
+    derivation = plan.derived["sub-2"]
+    assert (derivation.kind, derivation.source_id) == ("subset", "sub-1")
+    assert [m.render() for m in derivation.matchers] == ['pod="p"']
+
+
+def test_range_subset_needs_contained_window_on_same_grid():
+    plan = plan_tool_calls([
+        call("grid-1", 'up{job="a"}', "prom_range", start="1000", end="2000", step="60"),
+        call("grid-2", 'up{job="a",pod="p"}', "prom_range", start="1060", end="1600", step="60"),
+        call("grid-3", 'up{job="a",pod="p"}', "prom_range", start="1030", end="1600", step="60"),
+        call("grid-4", 'up{job="a",pod="p"}', "prom_range", start="1000", end="2600", step="60"),
+    ])
+    assert plan.derived["grid-2"].window == (1060.0, 1600.0)
+    assert "grid-3" not in plan.derived   # Off the wider call's step grid
+    assert "grid-4" not in plan.derived   # Runs past the wider call's end
+
+
+def vector_response(*series):
+    result = [{"metric": labels, "value": [1000, str(value)]} for labels, value in series]
+    return json.dumps({"status": "success", "data": {"resultType": "vector", "result": result}})
+
+
+def test_merged_result_is_split_per_call():
+    plan = plan_tool_calls([
+        call("merge-server", 'avg_over_time(mem{pod="server"}[5m])'),
+        call("merge-client", 'avg_over_time(mem{pod="client-0"}[5m])'),
+    ])
+    [merged] = plan.calls
+    assert merged["args"]["query"] == 'avg_over_time(mem{pod=~"server|client-0"}[5m])'
+
+    executed = ToolMessage(
+        content=vector_response(({"pod": "server"}, 1), ({"pod": "client-0"}, 2), ({"pod": "client-1"}, 3)),
+        tool_call_id=merged["id"],
+        name="prom_query",
+    )
+    messages = resolve_plan(plan, [executed])
+    assert [m.tool_call_id for m in messages] == ["merge-server", "merge-client"]
+    assert [s.metric["pod"] for s in get_prom_result(messages[0]).series] == ["server"]
+    assert [s.metric["pod"] for s in get_prom_result(messages[1]).series] == ["client-0"]
+
+
+def test_calls_differing_in_several_labels_merge_with_or():
+    plan = plan_tool_calls([
+        call("or-1", 'avg_over_time(mem{pod="server",namespace="fl"}[5m])'),
+        call("or-2", 'avg_over_time(mem{pod="client-0",namespace="edge"}[5m])'),
+    ])
+    [merged] = plan.calls
+    assert " or " in merged["args"]["query"]
+    assert {plan.derived[i].kind for i in ("or-1", "or-2")} == {"merged"}
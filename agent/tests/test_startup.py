@@ -0,0 +1,23 @@
+"""
+Startup budget - importing agent.main must stay fast and leave the heavy stacks for later
+"""
+
+import os
+
+from agent.utils.startup_profiler import profile_imports
+
+IMPORT_BUDGET = float(os.getenv("STARTUP_IMPORT_BUDGET", "2.5"))   # Seconds
+# Loaded by the warmup and on first use, never on the import path
+LAZY_MODULES = ("agent.tools.render_recharts", "langchain_openai", "numpy")
+
+
+def test_import_within_budget():
+    profile = profile_imports("agent.main")
+    assert profile["module_time"] <= IMPORT_BUDGET, (
+        f"import agent.main took {profile['module_time']:.3f}s, budget {IMPORT_BUDGET:.3f}s"
+    )
+
+
+def test_import_skips_lazy_modules():
+    imported = {entry["module"] for entry in profile_imports("agent.main")["entries"]}
+    assert not imported & set(LAZY_MODULES), f"imported at startup: {sorted(imported & set(LAZY_MODULES))}"